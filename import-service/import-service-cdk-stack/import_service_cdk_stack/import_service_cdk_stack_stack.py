@@ -133,6 +133,13 @@ class ImportServiceCdkStackStack(Stack):
             description='Smart Open Layer for CSV streaming'
         )
 
+        product_schema_layer = _lambda.LayerVersion(
+            self, 'ProductSchemaLayer',
+            code=_lambda.Code.from_asset('../../layers/product_schema'),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_9],
+            description='Shared product schema validator'
+        )
+
         catalog_items_queue = sqs.Queue.from_queue_arn(
             self, "ImportToCatalogQueue",
             f"arn:aws:sqs:{self.region}:{self.account}:catalogItemsQueue"
@@ -143,10 +150,23 @@ class ImportServiceCdkStackStack(Stack):
             runtime=_lambda.Runtime.PYTHON_3_9,
             handler="import_file_parser.handler",
             code=_lambda.Code.from_asset("../src"),
-            timeout=Duration.seconds(30),
-            layers=[smart_open_layer],
+            # Large files are split into ranges imported by synchronous
+            # invocations of this function, which the coordinator waits for
+            timeout=Duration.minutes(5),
+            layers=[smart_open_layer, product_schema_layer],
             environment={
-                "SQS_QUEUE_URL": catalog_items_queue.queue_url
+                "SQS_QUEUE_URL": catalog_items_queue.queue_url,
+                "IMPORT_FILE_WORKERS": "4",
+                "IMPORT_SENDER_WORKERS": "4",
+                "IMPORT_QUEUE_DEPTH": "16",
+                "IMPORT_RANGE_THRESHOLD_BYTES": str(64 * 1024 * 1024),
+                "IMPORT_RANGE_BYTES": str(8 * 1024 * 1024),
+                "IMPORT_RANGE_WORKERS": "16",
+                # Products per catalog queue message. 1 sends plain messages; raise
+                # it (e.g. to 25) only once the deployed catalog_batch_process
+                # reads catalog-products/1 envelopes
+                "IMPORT_PACK_ROWS": "1",
+                "IMPORT_PACK_COMPRESS": "false"
             }
         )
         apply_tags(import_file_parser)
@@ -180,6 +200,7 @@ class ImportServiceCdkStackStack(Stack):
         import_file_parser.add_to_role_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
+                # Also authorizes SendMessageBatch
                 actions=[
                     'sqs:SendMessage'
                 ],
@@ -189,6 +210,50 @@ class ImportServiceCdkStackStack(Stack):
             )
         )
 
+        import_file_parser.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    's3:GetObject',
+                    's3:PutObject',
+                    's3:DeleteObject'
+                ],
+                resources=[
+                    f'arn:aws:s3:::{import_bucket.bucket_name}/checkpoints/*'
+                ]
+            )
+        )
+
+        import_file_parser.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                # Without it a missing checkpoint reads as 403 instead of 404
+                actions=[
+                    's3:ListBucket'
+                ],
+                resources=[
+                    f'arn:aws:s3:::{import_bucket.bucket_name}'
+                ],
+                conditions={
+                    'StringLike': {'s3:prefix': ['checkpoints/*']}
+                }
+            )
+        )
+
+        import_file_parser.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'lambda:InvokeFunction'
+                ],
+                # Range workers are invocations of the function itself; its
+                # ARN would make the role depend on the function it belongs to
+                resources=[
+                    f'arn:aws:lambda:{self.region}:{self.account}:function:{self.stack_name}-ImportFileParser*'
+                ]
+            )
+        )
+
         import_bucket.add_event_notification(
             s3.EventType.OBJECT_CREATED,
             s3n.LambdaDestination(import_file_parser),
@@ -0,0 +1,65 @@
+import csv
+from smart_open import open
+
+# A range starts right after a line break: a worker never sees half a row.
+# Fields with quoted line breaks are not supported by range imports.
+
+def open_object(s3, bucket, key):
+    # With defer_seek nothing is fetched until the first read, so a seek
+    # followed by a read is a single ranged GET from that offset
+    return open(f's3://{bucket}/{key}', 'rb', transport_params={'client': s3, 'defer_seek': True})
+
+def read_header(s3, bucket, key):
+    """(field names, offset of the first row) of a CSV object."""
+    with open_object(s3, bucket, key) as stream:
+        line = stream.readline()
+    fieldnames = next(csv.reader([line.decode('utf-8-sig')]), [])
+    return fieldnames, len(line)
+
+def next_line_start(s3, bucket, key, offset):
+    """The first line start at or after offset."""
+    if offset == 0:
+        return 0
+    with open_object(s3, bucket, key) as stream:
+        # Reading from the byte before offset finds a line that starts at offset
+        stream.seek(offset - 1)
+        return offset - 1 + len(stream.readline())
+
+def split_ranges(s3, bucket, key, start, size, range_bytes):
+    """[(start, end)] byte ranges of about range_bytes covering [start, size), aligned to line starts."""
+    boundaries = [start]
+    for offset in range(start + range_bytes, size, range_bytes):
+        boundary = next_line_start(s3, bucket, key, offset)
+        if boundaries[-1] < boundary < size:
+            boundaries.append(boundary)
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+def read_lines(s3, bucket, key, start, end, position):
+    """
+    Decoded lines starting in [start, end). position['offset'] and
+    position['next'] are set to the byte offsets of every line and of the
+    one after it before the line is yielded.
+    """
+    with open_object(s3, bucket, key) as stream:
+        stream.seek(start)
+        offset = start
+        while offset < end:
+            line = stream.readline()
+            if not line:
+                return
+            position['offset'] = offset
+            offset += len(line)
+            position['next'] = offset
+            yield line.decode('utf-8')
+
+def read_rows(s3, bucket, key, fieldnames, start, end):
+    """
+    (byte offset, offset of the next row, row dict) of every CSV row starting
+    in [start, end). csv reads one line per row, so position describes the
+    row just returned.
+    """
+    position = {}
+    reader = csv.DictReader(read_lines(s3, bucket, key, start, end, position), fieldnames=fieldnames)
+    for row in reader:
+        yield position['offset'], position['next'], row
@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+import time
+from botocore.exceptions import ClientError
+
+# Progress of every byte range of a file import is kept in a sidecar object
+# under checkpoints/, so a retried import resumes after the last row whose
+# batch was sent instead of re-enqueueing the whole file. The checkpoints
+# are deleted once the file is moved to parsed/.
+CHECKPOINT_PREFIX = 'checkpoints/'
+# Checkpoints are written at most this often while a range is imported, and
+# always when it stops
+IMPORT_CHECKPOINT_INTERVAL_SECONDS = float(os.environ.get('IMPORT_CHECKPOINT_INTERVAL_SECONDS', '5'))
+
+def checkpoint_key(key, start):
+    return f'{CHECKPOINT_PREFIX}{key}/{start}.json'
+
+def load_checkpoint(s3, bucket, key, start, etag):
+    """{'offset', 'rows'} saved for the range starting at start, or None."""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=checkpoint_key(key, start))
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    checkpoint = json.loads(response['Body'].read())
+    # A checkpoint of an earlier upload under the same key does not apply
+    return checkpoint if checkpoint.get('etag') == etag else None
+
+def save_checkpoint(s3, bucket, key, start, etag, offset, rows):
+    s3.put_object(
+        Bucket=bucket,
+        Key=checkpoint_key(key, start),
+        Body=json.dumps({'etag': etag, 'offset': offset, 'rows': rows}),
+        ContentType='application/json'
+    )
+
+def delete_checkpoints(s3, bucket, key, starts):
+    objects = [{'Key': checkpoint_key(key, start)} for start in starts]
+    for i in range(0, len(objects), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={'Objects': objects[i:i + 1000], 'Quiet': True})
+
+class CheckpointWriter:
+    """
+    Remembers the latest (offset, rows) progress of a range and saves it at
+    most every IMPORT_CHECKPOINT_INTERVAL_SECONDS; flush saves what is left.
+    """
+
+    def __init__(self, s3, bucket, key, start, etag, offset, rows):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.start = start
+        self.etag = etag
+        self.progress = (offset, rows)
+        self.saved = self.progress
+        self.saved_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def advance(self, progress):
+        with self.lock:
+            self.progress = progress
+            if time.monotonic() - self.saved_at >= IMPORT_CHECKPOINT_INTERVAL_SECONDS:
+                self.save()
+
+    def flush(self):
+        with self.lock:
+            if self.progress != self.saved:
+                self.save()
+
+    def save(self):
+        offset, rows = self.progress
+        save_checkpoint(self.s3, self.bucket, self.key, self.start, self.etag, offset, rows)
+        self.saved = self.progress
+        self.saved_at = time.monotonic()
@@ -2,59 +2,229 @@ import json
 import os
 import boto3
 import logging
-from smart_open import open
-import csv
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+
+from catalog_envelope import pack_products
+from csv_ranges import read_header, split_ranges, read_rows
+from import_checkpoints import load_checkpoint, delete_checkpoints, CheckpointWriter
+from product_schema import validate_product, make_version, VERSION_SEQUENCE_SCALE
+from sqs_batch import send_messages
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-s3 = boto3.client('s3')
-sqs = boto3.client('sqs')
+# Each file is parsed on its own thread while a pool of sender threads
+# enqueues its rows; the parser waits once IMPORT_QUEUE_DEPTH batches of 10
+# rows are pending, so memory stays flat whatever the file size
+IMPORT_FILE_WORKERS = int(os.environ.get('IMPORT_FILE_WORKERS', '4'))
+IMPORT_SENDER_WORKERS = int(os.environ.get('IMPORT_SENDER_WORKERS', '4'))
+IMPORT_QUEUE_DEPTH = int(os.environ.get('IMPORT_QUEUE_DEPTH', '16'))
+
+# Rows are packed into catalog envelopes of up to IMPORT_PACK_ROWS products
+# (and 256 KiB), optionally gzip-compressed; 1 sends one plain product per
+# message
+IMPORT_PACK_ROWS = int(os.environ.get('IMPORT_PACK_ROWS', '1'))
+IMPORT_PACK_COMPRESS = os.environ.get('IMPORT_PACK_COMPRESS', 'false').lower() == 'true'
+
+# Files larger than the threshold are split into line-aligned byte ranges of
+# about IMPORT_RANGE_BYTES, imported by up to IMPORT_RANGE_WORKERS concurrent
+# workers: 'lambda' invokes this function once per range, 'inline' imports
+# the ranges in this process (local runs and tests)
+IMPORT_RANGE_THRESHOLD_BYTES = int(os.environ.get('IMPORT_RANGE_THRESHOLD_BYTES', str(64 * 1024 * 1024)))
+IMPORT_RANGE_BYTES = int(os.environ.get('IMPORT_RANGE_BYTES', str(8 * 1024 * 1024)))
+IMPORT_RANGE_WORKERS = int(os.environ.get('IMPORT_RANGE_WORKERS', '16'))
+IMPORT_RANGE_DISPATCH = os.environ.get('IMPORT_RANGE_DISPATCH', 'lambda')
+IMPORT_WORKER_FUNCTION_NAME = os.environ.get('IMPORT_WORKER_FUNCTION_NAME',
+                                             os.environ.get('AWS_LAMBDA_FUNCTION_NAME'))
+
+# A connection per sender of every file, so concurrent calls never wait for the pool
+client_config = Config(max_pool_connections=max(10, IMPORT_FILE_WORKERS * IMPORT_SENDER_WORKERS))
+s3 = boto3.client('s3', config=client_config)
+sqs = boto3.client('sqs', config=client_config)
+# Range workers are invoked synchronously and may run for minutes; a retried
+# invocation would import its range twice
+lambda_client = boto3.client('lambda', config=Config(
+    max_pool_connections=max(10, IMPORT_RANGE_WORKERS),
+    read_timeout=900,
+    retries={'total_max_attempts': 1}
+))
 sql_url = os.environ['SQS_QUEUE_URL']
 
+def row_sequence(offset, file_size):
+    # Spreads byte offsets over the sequence range of make_version, so rows
+    # keep their file order whichever range imports them. Rows take at least
+    # 9 bytes, which keeps sequences distinct in files of up to ~9 GB.
+    return offset * (VERSION_SEQUENCE_SCALE - 1) // max(file_size, 1)
+
+def message_bodies(rows, key, file_timestamp_ms, file_size, stats):
+    """
+    (SQS message body, (offset of the next row, rows read)) of the valid rows;
+    invalid rows are logged and counted in stats, which also counts the rows.
+    """
+    for offset, next_offset, row in rows:
+        stats['rows'] += 1
+        product, errors = validate_product(row)
+        if errors:
+            stats['invalid'] += 1
+            logger.warning('Skipping invalid row at byte %d of %s: %s',
+                           offset, key, '; '.join(errors))
+            continue
+        # Rows without a version column are versioned by the upload time of
+        # their file and their position, so later rows and files win and
+        # re-importing an older or the same file writes nothing
+        product.setdefault('version', make_version(file_timestamp_ms, row_sequence(offset, file_size)))
+        # Decimal prices travel as strings and are coerced again by the consumer
+        yield json.dumps(product, default=str), (next_offset, stats['rows'])
+
+def import_range(bucket, key, fieldnames, start, end, file_timestamp_ms, file_size, etag):
+    """
+    Enqueues the rows starting in bytes [start, end) of the file, resuming
+    after the last checkpoint of the range. Returns
+    {'rows', 'sent', 'batches', 'retries', 'failed', 'invalid'} counts, where
+    rows counts the valid rows and sent/failed count messages.
+    """
+    checkpoint = load_checkpoint(s3, bucket, key, start, etag)
+    offset, rows_read = (checkpoint['offset'], checkpoint['rows']) if checkpoint else (start, 0)
+    if offset >= end:
+        logger.info('Bytes %d-%d of %s were already imported', start, end, key)
+        return {'rows': 0, 'sent': 0, 'batches': 0, 'retries': 0, 'failed': 0, 'invalid': 0}
+    if checkpoint:
+        logger.info('Resuming %s at byte %d (row %d of the range)', key, offset, rows_read)
+
+    counts = {'rows': rows_read, 'invalid': 0}
+    writer = CheckpointWriter(s3, bucket, key, start, etag, offset, rows_read)
+    try:
+        rows = read_rows(s3, bucket, key, fieldnames, offset, end)
+        bodies = message_bodies(rows, key, file_timestamp_ms, file_size, counts)
+        if IMPORT_PACK_ROWS > 1:
+            bodies = pack_products(bodies, IMPORT_PACK_ROWS, compress=IMPORT_PACK_COMPRESS)
+        # Messages are sent 10 per SendMessageBatch call by the sender pool;
+        # the checkpoint follows the batches that were sent completely
+        stats = send_messages(sqs, sql_url, bodies,
+                              workers=IMPORT_SENDER_WORKERS, queue_depth=IMPORT_QUEUE_DEPTH,
+                              on_sent=writer.advance)
+        if not stats['failed']:
+            # Trailing invalid rows are done with as well
+            writer.advance((end, counts['rows']))
+    finally:
+        writer.flush()
+    return {**stats, 'rows': counts['rows'] - rows_read - counts['invalid'], 'invalid': counts['invalid']}
+
+def invoke_range_worker(task):
+    response = lambda_client.invoke(
+        FunctionName=IMPORT_WORKER_FUNCTION_NAME,
+        InvocationType='RequestResponse',
+        Payload=json.dumps({'importRange': task})
+    )
+    result = json.loads(response['Payload'].read())
+    if response.get('FunctionError'):
+        raise RuntimeError(f"Range {task['start']}-{task['end']} failed: {result.get('errorMessage')}")
+    return result
+
+def run_range_inline(task):
+    return import_range(**task)
+
+RANGE_DISPATCHERS = {
+    'lambda': invoke_range_worker,
+    'inline': run_range_inline
+}
+
+def import_ranges(tasks):
+    """Dispatches the range tasks concurrently. Returns their stats; raises the first failure."""
+    dispatch = RANGE_DISPATCHERS[IMPORT_RANGE_DISPATCH]
+    with ThreadPoolExecutor(max_workers=min(IMPORT_RANGE_WORKERS, len(tasks))) as executor:
+        futures = [executor.submit(dispatch, task) for task in tasks]
+    failures = [future.exception() for future in futures if future.exception()]
+    for error in failures:
+        logger.error('Range import failed: %s', error)
+    if failures:
+        raise failures[0]
+    return [future.result() for future in futures]
+
+def process_file(bucket, key):
+    logger.info('Processing file: %s from bucket: %s', key, bucket)
+
+    head = s3.head_object(Bucket=bucket, Key=key)
+    file_size = head['ContentLength']
+    etag = head['ETag']
+    file_timestamp_ms = int(head['LastModified'].timestamp() * 1000)
+    fieldnames, first_row = read_header(s3, bucket, key)
+
+    if file_size > IMPORT_RANGE_THRESHOLD_BYTES:
+        ranges = split_ranges(s3, bucket, key, first_row, file_size, IMPORT_RANGE_BYTES)
+    else:
+        ranges = [(first_row, file_size)]
+    tasks = [
+        {
+            'bucket': bucket,
+            'key': key,
+            'fieldnames': fieldnames,
+            'start': start,
+            'end': end,
+            'file_timestamp_ms': file_timestamp_ms,
+            'file_size': file_size,
+            'etag': etag
+        }
+        for start, end in ranges
+    ]
+    if len(tasks) == 1:
+        results = [import_range(**tasks[0])]
+    else:
+        logger.info('Importing %s (%d bytes) in %d ranges', key, file_size, len(tasks))
+        results = import_ranges(tasks)
+    stats = {name: sum(result[name] for result in results) for name in results[0]}
+
+    logger.info('Processed file: %s (%d rows in %d messages sent in %d batches, %d retries, '
+                '%d failed messages, %d invalid rows skipped)',
+                key, stats['rows'], stats['sent'], stats['batches'], stats['retries'],
+                stats['failed'], stats['invalid'])
+    if stats['failed']:
+        # The file stays in uploaded/ so it can be imported again;
+        # rows already sent are versioned and are not written twice
+        raise RuntimeError(f"{stats['failed']} messages of {key} could not be enqueued")
+
+    parsed_key = key.replace('uploaded/', 'parsed/')
+
+    logger.info('Copying file to parsed folder: %s', parsed_key)
+    s3.copy_object(
+        CopySource={'Bucket': bucket, 'Key': key},
+        Bucket=bucket,
+        Key=parsed_key
+    )
+
+    logger.info('Deleting file from uploaded folder: %s', key)
+    s3.delete_object(
+        Bucket=bucket,
+        Key=key
+    )
+
+    logger.info('Successfully moved file from %s to %s', key, parsed_key)
+    delete_checkpoints(s3, bucket, key, [start for start, _ in ranges])
+
 def handler(event, context):
     logger.info('Incoming event: %s', json.dumps(event))
     logger.info('Context: RequestId: %s', context.aws_request_id)
     
-    try:
-        for record in event['Records']:
-            bucket = record['s3']['bucket']['name']
-            key = record['s3']['object']['key']
-            
-            logger.info('Processing file: %s from bucket: %s', key, bucket)
-            
-            s3_uri = f's3://{bucket}/{key}'
-            
-            with open(s3_uri, 'r') as file_stream:
-                csv_reader = csv.DictReader(file_stream)
-                
-                for row in csv_reader:
-                    sqs.send_message(
-                        QueueUrl=sql_url,
-                        MessageBody=json.dumps(row)
-                    )
-            
-            logger.info('Successfully processed file: %s', key)
-
-            parsed_key = key.replace('uploaded/', 'parsed/')
-            
-            logger.info('Copying file to parsed folder: %s', parsed_key)
-            s3.copy_object(
-                CopySource={'Bucket': bucket, 'Key': key},
-                Bucket=bucket,
-                Key=parsed_key
-            )
-            
-            logger.info('Deleting file from uploaded folder: %s', key)
-            s3.delete_object(
-                Bucket=bucket,
-                Key=key
-            )
-            
-            logger.info('Successfully moved file from %s to %s', key, parsed_key)
+    if 'importRange' in event:
+        # Worker invocation of a range import; failures surface as FunctionError
+        return import_range(**event['importRange'])
 
+    try:
+        files = [
+            (record['s3']['bucket']['name'], record['s3']['object']['key'])
+            for record in event['Records']
+        ]
+        # Files are processed concurrently; every file is attempted even when
+        # another one fails, and the first failure is reported afterwards
+        with ThreadPoolExecutor(max_workers=max(1, min(IMPORT_FILE_WORKERS, len(files)))) as executor:
+            futures = [executor.submit(process_file, bucket, key) for bucket, key in files]
+        failures = [(key, future.exception()) for (_, key), future in zip(files, futures) if future.exception()]
+        for key, error in failures:
+            logger.error('Error processing file %s: %s', key, error)
+        if failures:
+            raise failures[0][1]
 
-            
         return {
             "statusCode": 200,
             "headers": {
@@ -68,6 +238,10 @@ def handler(event, context):
             
     except Exception as e:
         logger.error('Error processing file: %s', str(e))
+        if any('s3' in record for record in event.get('Records', [])):
+            # S3 invokes this function asynchronously and only an error makes
+            # Lambda retry it; the retry resumes from the import checkpoints
+            raise
         return {
             "statusCode": 500,
             "headers": {
@@ -0,0 +1,137 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger()
+
+SEND_BATCH_MAX_ENTRIES = 10
+# SQS limits the combined size of all messages of one SendMessageBatch call
+SEND_BATCH_MAX_BYTES = 256 * 1024
+MAX_SEND_ATTEMPTS = 5
+BASE_BACKOFF_SECONDS = 0.05
+
+def backoff(attempt):
+    # Full jitter keeps concurrent retries from hitting the queue in lockstep
+    time.sleep(random.uniform(0, min(BASE_BACKOFF_SECONDS * (2 ** attempt), 1)))
+
+def batched_entries(items):
+    """
+    Groups (message body, mark) pairs into SendMessageBatch entries: at most
+    10 per batch and 256 KiB of bodies in total. Yields (entries, mark of the
+    batch's last body) with entries a list of {'Id', 'MessageBody'}.
+    """
+    batch, batch_bytes, batch_mark = [], 0, None
+    for body, mark in items:
+        size = len(body.encode('utf-8'))
+        if batch and (len(batch) == SEND_BATCH_MAX_ENTRIES or batch_bytes + size > SEND_BATCH_MAX_BYTES):
+            yield batch, batch_mark
+            batch, batch_bytes = [], 0
+        batch.append({'Id': str(len(batch)), 'MessageBody': body})
+        batch_bytes += size
+        batch_mark = mark
+    if batch:
+        yield batch, batch_mark
+
+def send_batch(sqs, queue_url, entries):
+    """
+    One SendMessageBatch call, resending only the entries listed in Failed
+    with exponential backoff; entries SQS blamed on the sender are not
+    retried. Returns (unsent entries, number of retried calls).
+    """
+    unsent, retries = [], 0
+    for attempt in range(MAX_SEND_ATTEMPTS):
+        if attempt:
+            logger.warning('Retrying %d failed SendMessageBatch entries', len(entries))
+            backoff(attempt - 1)
+            retries += 1
+        response = sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+
+        entries_by_id = {entry['Id']: entry for entry in entries}
+        retryable = []
+        for failure in response.get('Failed') or []:
+            if failure.get('SenderFault'):
+                logger.error('SQS rejected entry %s: %s', failure['Id'], failure.get('Message'))
+                unsent.append(entries_by_id[failure['Id']])
+            else:
+                retryable.append(entries_by_id[failure['Id']])
+        if not retryable:
+            return unsent, retries
+        entries = retryable
+    return unsent + entries, retries
+
+def send_messages(sqs, queue_url, bodies, workers=1, queue_depth=1, on_sent=None):
+    """
+    Sends any number of message bodies with SendMessageBatch.
+    With workers > 1 the calling thread only reads the bodies and groups them
+    into batches, which a pool of sender threads takes from a queue holding
+    up to queue_depth batches. A full queue blocks the reader, so memory
+    stays at (queue_depth + workers) batches whatever the number of bodies.
+    Batches may be sent out of order.
+    With on_sent, bodies are (body, mark) pairs and on_sent(mark) is called,
+    in order, with the mark of the last body of every run of batches that
+    has been sent completely; a batch with unsent entries stops the run.
+    Returns {'sent', 'batches', 'retries', 'failed'} counts.
+    """
+    stats = {'sent': 0, 'batches': 0, 'retries': 0, 'failed': 0}
+    stats_lock = threading.Lock()
+    # Completed batches waiting for the ones read before them
+    sent_marks = {}
+    next_index = 0
+
+    def send(index, entries, mark):
+        nonlocal next_index
+        unsent, retries = send_batch(sqs, queue_url, entries)
+        with stats_lock:
+            stats['batches'] += 1
+            stats['retries'] += retries
+            stats['sent'] += len(entries) - len(unsent)
+            stats['failed'] += len(unsent)
+            if on_sent and not unsent:
+                sent_marks[index] = mark
+                last_mark = None
+                while next_index in sent_marks:
+                    last_mark = sent_marks.pop(next_index)
+                    next_index += 1
+                if last_mark is not None:
+                    on_sent(last_mark)
+
+    items = bodies if on_sent else ((body, None) for body in bodies)
+    if workers <= 1:
+        for index, (entries, mark) in enumerate(batched_entries(items)):
+            send(index, entries, mark)
+        return stats
+
+    pending = queue.Queue(maxsize=queue_depth)
+    errors = []
+
+    def sender():
+        while True:
+            batch = pending.get()
+            if batch is None:
+                return
+            # After a failure the queue is only drained, so the reader never blocks
+            if errors:
+                continue
+            try:
+                send(*batch)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=sender, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for index, (entries, mark) in enumerate(batched_entries(items)):
+            if errors:
+                break
+            pending.put((index, entries, mark))
+    finally:
+        for _ in threads:
+            pending.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    return stats
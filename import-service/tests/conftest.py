@@ -1,6 +1,7 @@
+import json
 import os
 import pytest
-from moto import mock_s3
+from moto import mock_s3, mock_sqs
 import boto3
 
 def pytest_configure(config):
@@ -11,6 +12,7 @@ def pytest_configure(config):
     os.environ['AWS_SESSION_TOKEN'] = 'testing'
     os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
     os.environ['BUCKET_NAME'] = 'test-bucket'
+    os.environ['SQS_QUEUE_URL'] = 'https://sqs.us-east-1.amazonaws.com/123456789012/test-queue'
 
 @pytest.fixture
 def s3_client():
@@ -21,6 +23,14 @@ def s3_client():
         s3.create_bucket(Bucket=bucket_name)
         yield s3
 
+@pytest.fixture
+def sqs_client():
+    """Create mocked SQS client and queue."""
+    with mock_sqs():
+        sqs = boto3.client('sqs', region_name='us-east-1')
+        sqs.create_queue(QueueName='test-queue')
+        yield sqs
+
 @pytest.fixture
 def valid_csv_content():
     """Provide test CSV content"""
@@ -28,4 +38,35 @@ def valid_csv_content():
         "title,description,price,count\n"
         "First Test Product,Test Description,10.99,5\n"
         "Second Test Product,Another Description,20.00,10"
-    )
\ No newline at end of file
+    )
+
+def upload_event(s3_client, key, body):
+    bucket_name = os.environ['BUCKET_NAME']
+    s3_client.put_object(Bucket=bucket_name, Key=key, Body=body)
+    return {
+        'Records': [{
+            's3': {
+                'bucket': {'name': bucket_name},
+                'object': {'key': key}
+            }
+        }]
+    }
+
+def csv_rows(count):
+    return "id,title,description,price,count\n" + "\n".join(
+        f"{i},Product {i},Description {i},{i + 1}.50,{i}" for i in range(count)
+    )
+
+def receive_all(sqs_client):
+    bodies = []
+    while True:
+        messages = sqs_client.receive_message(
+            QueueUrl=os.environ['SQS_QUEUE_URL'], MaxNumberOfMessages=10
+        ).get('Messages', [])
+        if not messages:
+            return bodies
+        bodies.extend(json.loads(message['Body']) for message in messages)
+        sqs_client.delete_message_batch(
+            QueueUrl=os.environ['SQS_QUEUE_URL'],
+            Entries=[{'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(messages)]
+        )
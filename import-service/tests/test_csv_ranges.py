@@ -0,0 +1,49 @@
+import os
+from csv_ranges import read_header, split_ranges, read_rows
+
+CSV = (
+    "﻿id,title,description,price,count\n"
+    + "".join(f"{i},Product {i},Description {i},{i + 1}.50,{i}\n" for i in range(40))
+)
+
+def upload(s3_client, key='uploaded/ranges.csv'):
+    s3_client.put_object(Bucket=os.environ['BUCKET_NAME'], Key=key, Body=CSV.encode('utf-8'))
+    return os.environ['BUCKET_NAME'], key
+
+def test_read_header(s3_client):
+    bucket, key = upload(s3_client)
+
+    fieldnames, first_row = read_header(s3_client, bucket, key)
+
+    assert fieldnames == ['id', 'title', 'description', 'price', 'count']
+    assert CSV.encode('utf-8')[first_row:].startswith(b'0,Product 0')
+
+def test_ranges_are_line_aligned_and_cover_every_row(s3_client):
+    bucket, key = upload(s3_client)
+    data = CSV.encode('utf-8')
+    fieldnames, first_row = read_header(s3_client, bucket, key)
+
+    ranges = split_ranges(s3_client, bucket, key, first_row, len(data), 100)
+
+    assert len(ranges) > 5
+    assert ranges[0][0] == first_row and ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert data[start - 1:start] == b'\n'
+
+    rows = [row for start, end in ranges for row in read_rows(s3_client, bucket, key, fieldnames, start, end)]
+    assert [row['id'] for _, _, row in rows] == [str(i) for i in range(40)]
+    offsets = [offset for offset, _, _ in rows]
+    assert offsets == sorted(offsets)
+    assert all(data[offset:].startswith(f"{row['id']},".encode()) for offset, _, row in rows)
+    assert all(next_offset == following for (_, next_offset, _), following in zip(rows, offsets[1:]))
+
+def test_range_ending_mid_line_keeps_the_line(s3_client):
+    bucket, key = upload(s3_client)
+    fieldnames, first_row = read_header(s3_client, bucket, key)
+
+    # A range owns every line starting inside it
+    rows = list(read_rows(s3_client, bucket, key, fieldnames, first_row, first_row + 1))
+
+    assert [row['id'] for _, _, row in rows] == ['0']
+    assert rows[0][2]['count'] == '0'
@@ -0,0 +1,92 @@
+import os
+import pytest
+import import_checkpoints
+from import_checkpoints import load_checkpoint, save_checkpoint, CheckpointWriter
+from conftest import upload_event, csv_rows, receive_all
+
+def context():
+    return type('obj', (object,), {'aws_request_id': 'test'})
+
+class FailingSqs:
+    """Delegates to the real client, failing every SendMessageBatch call after the first `calls`."""
+
+    def __init__(self, sqs, calls):
+        self.sqs = sqs
+        self.calls = calls
+
+    def send_message_batch(self, **kwargs):
+        if self.calls == 0:
+            raise RuntimeError('Task timed out')
+        self.calls -= 1
+        return self.sqs.send_message_batch(**kwargs)
+
+def test_checkpoint_of_another_upload_is_ignored(s3_client):
+    bucket = os.environ['BUCKET_NAME']
+    save_checkpoint(s3_client, bucket, 'uploaded/file.csv', 10, '"old"', 500, 12)
+
+    assert load_checkpoint(s3_client, bucket, 'uploaded/file.csv', 10, '"old"') == {
+        'etag': '"old"', 'offset': 500, 'rows': 12
+    }
+    assert load_checkpoint(s3_client, bucket, 'uploaded/file.csv', 10, '"new"') is None
+    assert load_checkpoint(s3_client, bucket, 'uploaded/file.csv', 20, '"old"') is None
+
+def test_writer_saves_at_most_every_interval(s3_client, monkeypatch):
+    monkeypatch.setattr(import_checkpoints, 'IMPORT_CHECKPOINT_INTERVAL_SECONDS', 3600)
+    bucket = os.environ['BUCKET_NAME']
+    writer = CheckpointWriter(s3_client, bucket, 'uploaded/file.csv', 0, '"e"', 0, 0)
+
+    writer.advance((100, 10))
+    writer.advance((200, 20))
+    assert load_checkpoint(s3_client, bucket, 'uploaded/file.csv', 0, '"e"') is None
+
+    writer.flush()
+    assert load_checkpoint(s3_client, bucket, 'uploaded/file.csv', 0, '"e"')['offset'] == 200
+
+def test_failed_import_resumes_from_checkpoint(s3_client, sqs_client, monkeypatch):
+    from src import import_file_parser
+    monkeypatch.setattr(import_file_parser, 'IMPORT_SENDER_WORKERS', 1)
+    monkeypatch.setattr(import_checkpoints, 'IMPORT_CHECKPOINT_INTERVAL_SECONDS', 0)
+    real_sqs = import_file_parser.sqs
+    event = upload_event(s3_client, 'uploaded/resume.csv', csv_rows(95))
+
+    monkeypatch.setattr(import_file_parser, 'sqs', FailingSqs(real_sqs, 4))
+    # Raising is what makes Lambda retry the asynchronous S3 invocation
+    with pytest.raises(RuntimeError):
+        import_file_parser.handler(event, context())
+    keys = [obj['Key'] for obj in s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])['Contents']]
+    assert 'uploaded/resume.csv' in keys
+    assert len(receive_all(sqs_client)) == 40
+
+    monkeypatch.setattr(import_file_parser, 'sqs', real_sqs)
+    response = import_file_parser.handler(event, context())
+    assert response['statusCode'] == 200
+
+    # Only the rows after the 40 acknowledged ones are sent again
+    bodies = receive_all(sqs_client)
+    assert sorted(int(body['id']) for body in bodies) == list(range(40, 95))
+    keys = [obj['Key'] for obj in s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])['Contents']]
+    assert keys == ['parsed/resume.csv']
+
+def test_completed_ranges_are_skipped_on_retry(s3_client, sqs_client, monkeypatch):
+    from src import import_file_parser
+    monkeypatch.setattr(import_file_parser, 'IMPORT_RANGE_THRESHOLD_BYTES', 500)
+    monkeypatch.setattr(import_file_parser, 'IMPORT_RANGE_BYTES', 300)
+    monkeypatch.setattr(import_file_parser, 'IMPORT_RANGE_DISPATCH', 'inline')
+    monkeypatch.setattr(import_file_parser, 'IMPORT_RANGE_WORKERS', 1)
+    monkeypatch.setattr(import_file_parser, 'IMPORT_SENDER_WORKERS', 1)
+    real_sqs = import_file_parser.sqs
+    event = upload_event(s3_client, 'uploaded/ranges.csv', csv_rows(100) + "\n")
+
+    monkeypatch.setattr(import_file_parser, 'sqs', FailingSqs(real_sqs, 3))
+    with pytest.raises(RuntimeError):
+        import_file_parser.handler(event, context())
+    first_run = receive_all(sqs_client)
+
+    monkeypatch.setattr(import_file_parser, 'sqs', real_sqs)
+    assert import_file_parser.handler(event, context())['statusCode'] == 200
+    second_run = receive_all(sqs_client)
+
+    ids = sorted(int(body['id']) for body in first_run + second_run)
+    assert ids == list(range(100))
+    keys = [obj['Key'] for obj in s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])['Contents']]
+    assert keys == ['parsed/ranges.csv']
@@ -1,9 +1,12 @@
 import json
 import os
 import pytest
+import time
+from botocore.exceptions import ClientError
 from src.import_file_parser import handler
+from conftest import upload_event, csv_rows, receive_all
 
-def test_successful_file_processing(s3_client, valid_csv_content):
+def test_successful_file_processing(s3_client, sqs_client, valid_csv_content):
     """Test successful processing of a valid CSV file"""
     bucket_name = os.environ['BUCKET_NAME']
     
@@ -36,4 +39,221 @@ def test_successful_file_processing(s3_client, valid_csv_content):
     objects = s3_client.list_objects_v2(Bucket=bucket_name)
     keys = [obj['Key'] for obj in objects.get('Contents', [])]
     assert 'parsed/test.csv' in keys
-    assert 'uploaded/test.csv' not in keys
\ No newline at end of file
+    assert 'uploaded/test.csv' not in keys
+
+def test_rows_are_sent_in_batches_of_ten(s3_client, sqs_client):
+    from src import import_file_parser
+
+    calls = []
+    def record(model, **kwargs):
+        calls.append(model.name)
+    import_file_parser.sqs.meta.events.register('provide-client-params.sqs', record)
+    try:
+        event = upload_event(s3_client, 'uploaded/many.csv', csv_rows(95))
+        response = import_file_parser.handler(event, type('obj', (object,), {'aws_request_id': 'test'}))
+    finally:
+        import_file_parser.sqs.meta.events.unregister('provide-client-params.sqs', record)
+
+    assert response['statusCode'] == 200
+    # 10 calls instead of 95 SendMessage calls
+    assert calls == ['SendMessageBatch'] * 10
+    bodies = receive_all(sqs_client)
+    assert sorted(int(body['id']) for body in bodies) == list(range(95))
+
+def test_batches_respect_size_limit():
+    from sqs_batch import batched_entries, SEND_BATCH_MAX_BYTES
+
+    bodies = ['x' * (100 * 1024)] * 5 + ['small'] * 12
+    batches = list(batched_entries((body, index) for index, body in enumerate(bodies)))
+
+    assert [len(batch) for batch, _ in batches] == [2, 2, 10, 3]
+    assert [mark for _, mark in batches] == [1, 3, 13, 16]
+    for batch, _ in batches:
+        assert sum(len(entry['MessageBody']) for entry in batch) <= SEND_BATCH_MAX_BYTES
+        assert len({entry['Id'] for entry in batch}) == len(batch)
+
+class FlakySqs:
+    """Fails the given entry Ids on the first call; SenderFault ones every time."""
+
+    def __init__(self, transient_ids, sender_fault_ids=()):
+        self.transient_ids = set(transient_ids)
+        self.sender_fault_ids = set(sender_fault_ids)
+        self.calls = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.calls.append([entry['Id'] for entry in Entries])
+        failed = []
+        for entry in Entries:
+            if entry['Id'] in self.sender_fault_ids:
+                failed.append({'Id': entry['Id'], 'SenderFault': True, 'Code': 'InvalidMessageContents'})
+            elif entry['Id'] in self.transient_ids and len(self.calls) == 1:
+                failed.append({'Id': entry['Id'], 'SenderFault': False, 'Code': 'InternalError'})
+        return {'Failed': failed}
+
+def test_only_failed_entries_are_retried(monkeypatch):
+    import sqs_batch
+    monkeypatch.setattr(sqs_batch, 'BASE_BACKOFF_SECONDS', 0)
+    sqs = FlakySqs(transient_ids={'2', '5'}, sender_fault_ids={'7'})
+
+    stats = sqs_batch.send_messages(sqs, 'queue-url', [f'body {i}' for i in range(10)])
+
+    assert sqs.calls[1] == ['2', '5']
+    assert len(sqs.calls) == 2
+    assert stats == {'sent': 9, 'batches': 1, 'retries': 1, 'failed': 1}
+
+def test_file_with_unsent_rows_stays_uploaded(s3_client, sqs_client, monkeypatch):
+    from src import import_file_parser
+    monkeypatch.setattr(import_file_parser, 'send_messages',
+                        lambda sqs, queue_url, bodies, **kwargs: {'sent': 1, 'batches': 1, 'retries': 4, 'failed': 1})
+
+    event = upload_event(s3_client, 'uploaded/partial.csv', csv_rows(2))
+    with pytest.raises(RuntimeError, match='could not be enqueued'):
+        import_file_parser.handler(event, type('obj', (object,), {'aws_request_id': 'test'}))
+
+    keys = [obj['Key'] for obj in s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])['Contents']]
+    assert keys == ['uploaded/partial.csv']
+
+class SlowSqs:
+    """Records the bodies it receives, sleeping on every call."""
+
+    def __init__(self, delay=0.002, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.bodies = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('queue unavailable')
+        self.bodies.extend(entry['MessageBody'] for entry in Entries)
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+def test_pipelined_senders_send_everything_with_bounded_backlog():
+    from sqs_batch import send_messages
+
+    sqs = SlowSqs()
+    backlog = []
+    def bodies():
+        for i in range(500):
+            backlog.append(i - len(sqs.bodies))
+            yield f'body {i}'
+
+    stats = send_messages(sqs, 'queue-url', bodies(), workers=3, queue_depth=2)
+
+    assert stats == {'sent': 500, 'batches': 50, 'retries': 0, 'failed': 0}
+    assert sorted(sqs.bodies) == sorted(f'body {i}' for i in range(500))
+    # Queued batches, batches being sent and the one being filled
+    assert max(backlog) <= (2 + 3 + 1) * 10
+
+def test_pipelined_sender_failure_stops_the_reader():
+    from sqs_batch import send_messages
+
+    read = []
+    def bodies():
+        for i in range(10000):
+            read.append(i)
+            yield f'body {i}'
+
+    with pytest.raises(RuntimeError):
+        send_messages(SlowSqs(fail=True), 'queue-url', bodies(), workers=2, queue_depth=2)
+    assert len(read) < 10000
+
+def test_records_are_processed_concurrently(s3_client, sqs_client):
+    from src import import_file_parser
+
+    upload_event(s3_client, 'uploaded/first.csv', csv_rows(15))
+    event = upload_event(s3_client, 'uploaded/second.csv', csv_rows(5))
+    event['Records'].insert(0, {
+        's3': {'bucket': {'name': os.environ['BUCKET_NAME']}, 'object': {'key': 'uploaded/first.csv'}}
+    })
+    event['Records'].append({
+        's3': {'bucket': {'name': os.environ['BUCKET_NAME']}, 'object': {'key': 'uploaded/missing.csv'}}
+    })
+
+    # The missing file fails the event, the others are still imported
+    with pytest.raises(ClientError):
+        import_file_parser.handler(event, type('obj', (object,), {'aws_request_id': 'test'}))
+    keys = sorted(obj['Key'] for obj in s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])['Contents'])
+    assert keys == ['parsed/first.csv', 'parsed/second.csv']
+    assert len(receive_all(sqs_client)) == 20
+
+def test_large_file_is_imported_in_ranges(s3_client, sqs_client, monkeypatch):
+    from src import import_file_parser
+    monkeypatch.setattr(import_file_parser, 'IMPORT_RANGE_THRESHOLD_BYTES', 500)
+    monkeypatch.setattr(import_file_parser, 'IMPORT_RANGE_BYTES', 300)
+    monkeypatch.setattr(import_file_parser, 'IMPORT_RANGE_DISPATCH', 'inline')
+    dispatched = []
+    monkeypatch.setitem(import_file_parser.RANGE_DISPATCHERS, 'inline',
+                        lambda task: dispatched.append(task) or import_file_parser.import_range(**task))
+
+    event = upload_event(s3_client, 'uploaded/large.csv', csv_rows(100) + "\n")
+    response = import_file_parser.handler(event, type('obj', (object,), {'aws_request_id': 'test'}))
+
+    assert response['statusCode'] == 200
+    assert len(dispatched) > 5
+    bodies = receive_all(sqs_client)
+    assert sorted(int(body['id']) for body in bodies) == list(range(100))
+    # Versions follow the file order across ranges
+    versions = [body['version'] for body in sorted(bodies, key=lambda body: int(body['id']))]
+    assert versions == sorted(versions) and len(set(versions)) == 100
+    keys = [obj['Key'] for obj in s3_client.list_objects_v2(Bucket=os.environ['BUCKET_NAME'])['Contents']]
+    assert keys == ['parsed/large.csv']
+
+def test_range_worker_invocation(monkeypatch):
+    import io
+    from src import import_file_parser
+
+    class FakeLambda:
+        def __init__(self, payload, function_error=None):
+            self.payload = payload
+            self.function_error = function_error
+            self.requests = []
+
+        def invoke(self, **kwargs):
+            self.requests.append(kwargs)
+            response = {'Payload': io.BytesIO(json.dumps(self.payload).encode())}
+            if self.function_error:
+                response['FunctionError'] = self.function_error
+            return response
+
+    task = {'bucket': 'b', 'key': 'k', 'fieldnames': ['id'], 'start': 10, 'end': 20,
+            'file_timestamp_ms': 1, 'file_size': 20, 'etag': '"abc"'}
+    stats = {'sent': 1, 'batches': 1, 'retries': 0, 'failed': 0, 'invalid': 0}
+    fake = FakeLambda(stats)
+    monkeypatch.setattr(import_file_parser, 'lambda_client', fake)
+
+    assert import_file_parser.invoke_range_worker(task) == stats
+    assert json.loads(fake.requests[0]['Payload']) == {'importRange': task}
+    assert fake.requests[0]['InvocationType'] == 'RequestResponse'
+
+    monkeypatch.setattr(import_file_parser, 'lambda_client', FakeLambda({'errorMessage': 'boom'}, 'Unhandled'))
+    with pytest.raises(RuntimeError, match='boom'):
+        import_file_parser.invoke_range_worker(task)
+
+def test_rows_are_packed_into_envelopes(s3_client, sqs_client, monkeypatch):
+    from catalog_envelope import decode_message
+    from src import import_file_parser
+    monkeypatch.setattr(import_file_parser, 'IMPORT_PACK_ROWS', 25)
+
+    for compress in (False, True):
+        monkeypatch.setattr(import_file_parser, 'IMPORT_PACK_COMPRESS', compress)
+        event = upload_event(s3_client, 'uploaded/packed.csv', csv_rows(95))
+        response = import_file_parser.handler(event, type('obj', (object,), {'aws_request_id': 'test'}))
+        assert response['statusCode'] == 200
+
+        messages = []
+        while True:
+            received = sqs_client.receive_message(
+                QueueUrl=os.environ['SQS_QUEUE_URL'], MaxNumberOfMessages=10
+            ).get('Messages', [])
+            if not received:
+                break
+            for message in received:
+                messages.append(decode_message(message['Body']))
+                sqs_client.delete_message(QueueUrl=os.environ['SQS_QUEUE_URL'],
+                                          ReceiptHandle=message['ReceiptHandle'])
+
+        assert sorted(len(products) for products, _ in messages) == [20, 25, 25, 25]
+        assert all(envelope == {'attempt': 0, 'compressed': compress} for _, envelope in messages)
+        ids = sorted(int(product['id']) for products, _ in messages for product in products)
+        assert ids == list(range(95))
@@ -0,0 +1,94 @@
+import base64
+import gzip
+import json
+import zlib
+
+# Several products packed into one catalog queue message. Plain messages
+# hold a single product object and stay valid; packed ones are recognized
+# by their "envelope" field:
+#   {"envelope": "catalog-products/1", "attempt": 0, "products": [...]}
+#   {"envelope": "catalog-products/1", "attempt": 0, "encoding": "gzip", "data": "<base64>"}
+# "data" is the gzip-compressed JSON array of products. "attempt" counts how
+# often rows of the message were sent again after failing to be written.
+# Envelopes of rows that failed validation, parked in the dead-letter queue,
+# also carry "errors": the validation errors of every product, in order.
+ENVELOPE = 'catalog-products/1'
+SQS_MAX_MESSAGE_BYTES = 256 * 1024
+
+def encode_envelope(product_bodies, compress=False, attempt=0, errors=None):
+    """Envelope body from product JSON strings."""
+    products = '[' + ','.join(product_bodies) + ']'
+    header = {'envelope': ENVELOPE, 'attempt': attempt}
+    if errors is not None:
+        # Left uncompressed so the errors can be read in the console
+        header['errors'] = errors
+    if compress:
+        data = base64.b64encode(gzip.compress(products.encode('utf-8'))).decode('ascii')
+        return json.dumps({**header, 'encoding': 'gzip', 'data': data})
+    return json.dumps(header)[:-1] + f', "products": {products}}}'
+
+def decode_message(body):
+    """
+    (products, envelope) of a queue message: envelope is None for a plain
+    single-product body, else {'attempt', 'compressed'}. Raises ValueError
+    for malformed messages and envelopes of an unknown format.
+    """
+    message = json.loads(body)
+    if not isinstance(message, dict) or 'envelope' not in message:
+        return [message], None
+    if message['envelope'] != ENVELOPE:
+        raise ValueError(f"Unsupported envelope {message['envelope']!r}")
+
+    compressed = message.get('encoding') == 'gzip'
+    if compressed:
+        data = message.get('data')
+        if not isinstance(data, str):
+            raise ValueError('Envelope data must be a string')
+        try:
+            products = json.loads(gzip.decompress(base64.b64decode(data)))
+        except (OSError, EOFError, zlib.error) as e:
+            # gzip.BadGzipFile is an OSError; base64 and JSON errors are ValueErrors
+            raise ValueError(f'Corrupt envelope data: {e}')
+    elif 'encoding' in message:
+        raise ValueError(f"Unsupported envelope encoding {message['encoding']!r}")
+    elif 'products' not in message:
+        raise ValueError('Envelope has no products')
+    else:
+        products = message['products']
+    if not isinstance(products, list):
+        raise ValueError('Envelope products must be a list')
+    try:
+        attempt = int(message.get('attempt', 0))
+    except (TypeError, ValueError):
+        raise ValueError('Envelope attempt must be an integer')
+    return products, {'attempt': attempt, 'compressed': compressed}
+
+def pack_products(items, max_rows, max_bytes=SQS_MAX_MESSAGE_BYTES, compress=False):
+    """
+    Packs (product JSON, mark) pairs into envelopes of at most max_rows
+    products and max_bytes. Yields (envelope body, mark of its last product).
+    Uncompressed envelopes are filled up to max_bytes; compressed ones are
+    split in half until they fit.
+    """
+    overhead = len(encode_envelope([]))
+    batch, batch_bytes, batch_mark = [], overhead, None
+    for body, mark in items:
+        size = len(body.encode('utf-8')) + 1
+        if batch and (len(batch) == max_rows or (not compress and batch_bytes + size > max_bytes)):
+            yield from encode_fitting(batch, batch_mark, max_bytes, compress)
+            batch, batch_bytes = [], overhead
+        batch.append((body, mark))
+        batch_bytes += size
+        batch_mark = mark
+    if batch:
+        yield from encode_fitting(batch, batch_mark, max_bytes, compress)
+
+def encode_fitting(batch, mark, max_bytes, compress):
+    envelope = encode_envelope([body for body, _ in batch], compress)
+    if len(envelope.encode('utf-8')) <= max_bytes or len(batch) == 1:
+        # A single product over the limit is left for SQS to reject
+        yield envelope, mark
+        return
+    half = len(batch) // 2
+    yield from encode_fitting(batch[:half], batch[half - 1][1], max_bytes, compress)
+    yield from encode_fitting(batch[half:], mark, max_bytes, compress)
@@ -0,0 +1,301 @@
+from decimal import Decimal, InvalidOperation
+from itertools import repeat
+
+# Field rules shared by every product write path. compile_schema turns them
+# into one coercing validator per field when the module is imported, so
+# validating a product runs no schema interpretation. Each field also gets a
+# column validator that checks a whole batch of values at once (validate_many).
+PRODUCT_SCHEMA = {
+    'id': {'type': 'string', 'required': False, 'max_length': 64},
+    'title': {'type': 'string', 'required': True, 'max_length': 200},
+    'description': {'type': 'string', 'required': True, 'max_length': 4000},
+    'price': {'type': 'decimal', 'required': True, 'exclusive_minimum': 0},
+    'count': {'type': 'integer', 'required': True, 'minimum': 0},
+    # Orders updates of the same product: writers skip versions that are not
+    # newer than the stored one
+    'version': {'type': 'integer', 'required': False, 'minimum': 0}
+}
+
+# Versions are epoch milliseconds scaled up so that a writer can also order
+# several updates stamped with the same millisecond, e.g. rows of one file
+VERSION_SEQUENCE_SCALE = 10 ** 9
+
+def make_version(timestamp_ms, sequence=0):
+    return timestamp_ms * VERSION_SEQUENCE_SCALE + sequence
+
+class ProductValidationError(ValueError):
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+def compile_string(label, rules):
+    max_length = rules.get('max_length')
+    required = rules['required']
+
+    def coerce(value):
+        if not isinstance(value, str):
+            return None, f"{label} must be a string"
+        value = value.strip()
+        if required and not value:
+            return None, f"{label} cannot be empty"
+        if max_length is not None and len(value) > max_length:
+            return None, f"{label} must be at most {max_length} characters"
+        return value, None
+    return coerce
+
+def compile_decimal(label, rules):
+    exclusive_minimum = Decimal(rules['exclusive_minimum'])
+
+    def coerce(value):
+        # bool is an int subclass; floats go through str to keep their digits
+        if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+            return None, f"{label} must be a number"
+        try:
+            number = Decimal(str(value).strip())
+        except InvalidOperation:
+            return None, f"{label} must be a number"
+        if not number.is_finite():
+            return None, f"{label} must be a number"
+        if number <= exclusive_minimum:
+            return None, f"{label} must be positive"
+        return number, None
+    return coerce
+
+def compile_integer(label, rules):
+    minimum = rules['minimum']
+
+    def coerce(value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            number = value
+        elif isinstance(value, str):
+            try:
+                number = int(value.strip())
+            except ValueError:
+                return None, f"{label} must be a whole number"
+        elif isinstance(value, float) and value.is_integer():
+            number = int(value)
+        elif isinstance(value, Decimal) and value.is_finite() and value == value.to_integral_value():
+            number = int(value)
+        else:
+            return None, f"{label} must be a whole number"
+        if number < minimum:
+            return None, f"{label} must be non-negative"
+        return number, None
+    return coerce
+
+# Column validators coerce the values of one field across a batch with a
+# few builtin passes. They only cover the common case of a clean column of
+# strings (or ints); they return None as soon as a value is of another type
+# or fails a rule, and the caller then checks that column value by value.
+
+def compile_string_column(rules):
+    max_length = rules.get('max_length')
+    required = rules['required']
+
+    def coerce_column(values):
+        if not all(isinstance(value, str) for value in values):
+            return None
+        stripped = [value.strip() for value in values]
+        if required and not all(stripped):
+            return None
+        if max_length is not None and max(map(len, stripped), default=0) > max_length:
+            return None
+        return stripped
+    return coerce_column
+
+def compile_decimal_column(rules):
+    exclusive_minimum = Decimal(rules['exclusive_minimum'])
+
+    def coerce_column(values):
+        if not all(type(value) is str for value in values):
+            return None
+        try:
+            numbers = [Decimal(value.strip()) for value in values]
+        except InvalidOperation:
+            return None
+        if not all(map(Decimal.is_finite, numbers)):
+            return None
+        if numbers and min(numbers) <= exclusive_minimum:
+            return None
+        return numbers
+    return coerce_column
+
+def compile_integer_column(rules):
+    minimum = rules['minimum']
+
+    def coerce_column(values):
+        if all(type(value) is int for value in values):
+            numbers = values
+        elif all(type(value) is str for value in values):
+            try:
+                numbers = [int(value.strip()) for value in values]
+            except ValueError:
+                return None
+        else:
+            return None
+        if numbers and min(numbers) < minimum:
+            return None
+        return numbers
+    return coerce_column
+
+COMPILERS = {
+    'string': (compile_string, compile_string_column),
+    'decimal': (compile_decimal, compile_decimal_column),
+    'integer': (compile_integer, compile_integer_column)
+}
+
+def compile_schema(schema):
+    """[(name, required, coerce)] for every field of schema."""
+    return [
+        (name, rules['required'], COMPILERS[rules['type']][0](name.capitalize(), rules))
+        for name, rules in schema.items()
+    ]
+
+def compile_columns(schema):
+    """[(name, required, coerce, coerce_column)] for every field of schema."""
+    return [
+        (name, rules['required'], COMPILERS[rules['type']][0](name.capitalize(), rules),
+         COMPILERS[rules['type']][1](rules))
+        for name, rules in schema.items()
+    ]
+
+COMPILED_SCHEMA = compile_schema(PRODUCT_SCHEMA)
+COMPILED_COLUMNS = compile_columns(PRODUCT_SCHEMA)
+# Columns are validated in blocks of this many values, so a bad value only
+# sends its own block through the value-by-value checks
+ABSENT = object()
+COLUMN_BLOCK_ROWS = 64
+REQUIRED_FIELDS = [name for name, required, _ in COMPILED_SCHEMA if required]
+
+def validate_product(data):
+    """
+    Coerces data against the product schema in a single pass.
+    Returns (product, errors): the coerced product (Decimal price, int count,
+    stripped strings, unknown fields dropped) and every error found; product
+    is None when there are errors.
+    """
+    if not isinstance(data, dict):
+        return None, ["Product must be an object"]
+
+    missing_fields = [name for name in REQUIRED_FIELDS if data.get(name) is None]
+    if missing_fields:
+        return None, [f"Missing required fields: {', '.join(missing_fields)}"]
+
+    product, errors = {}, []
+    for name, required, coerce in COMPILED_SCHEMA:
+        value = data.get(name)
+        # Empty CSV cells of optional columns count as absent
+        if value is None or (value == '' and not required):
+            continue
+        coerced, error = coerce(value)
+        if error:
+            errors.append(error)
+        else:
+            product[name] = coerced
+    return (None, errors) if errors else (product, errors)
+
+def validate_many(rows):
+    """
+    Validates a batch column by column: the values of each field are
+    gathered, coerced and checked across all rows at once, and only a block
+    holding a bad value is checked value by value. Returns two lists aligned
+    with rows, the coerced products (None for invalid rows) and their
+    errors, exactly as validate_product would return them.
+    """
+    errors = [[] for _ in rows]
+    candidates = []
+    for index, row in enumerate(rows):
+        if isinstance(row, dict):
+            candidates.append(index)
+        else:
+            errors[index].append("Product must be an object")
+    candidate_rows = [rows[index] for index in candidates]
+
+    required_values = {name: [row.get(name) for row in candidate_rows] for name in REQUIRED_FIELDS}
+    if any(None in values for values in required_values.values()):
+        complete = []
+        for position, index in enumerate(candidates):
+            missing_fields = [name for name in REQUIRED_FIELDS if required_values[name][position] is None]
+            if missing_fields:
+                errors[index].append(f"Missing required fields: {', '.join(missing_fields)}")
+            else:
+                complete.append(position)
+        candidates = [candidates[position] for position in complete]
+        candidate_rows = [candidate_rows[position] for position in complete]
+        required_values = {
+            name: [values[position] for position in complete] for name, values in required_values.items()
+        }
+    candidate_errors = [errors[index] for index in candidates]
+
+    names, columns = [], []
+    sparse = failed = False
+    for name, required, coerce, coerce_column in COMPILED_COLUMNS:
+        if required:
+            column, column_failed = coerce_values(required_values[name], candidate_errors, coerce, coerce_column)
+        else:
+            values = [row.get(name) for row in candidate_rows]
+            # Empty CSV cells of optional columns count as absent
+            positions = [i for i, value in enumerate(values) if value is not None and value != '']
+            if not positions:
+                continue
+            if len(positions) == len(values):
+                column, column_failed = coerce_values(values, candidate_errors, coerce, coerce_column)
+            else:
+                coerced, column_failed = coerce_values([values[i] for i in positions],
+                                                       [candidate_errors[i] for i in positions],
+                                                       coerce, coerce_column)
+                column = [ABSENT] * len(values)
+                for i, value in zip(positions, coerced):
+                    column[i] = value
+                sparse = True
+        failed = failed or column_failed
+        names.append(name)
+        columns.append(column)
+
+    if sparse:
+        built = [
+            {name: value for name, value in zip(names, values) if value is not ABSENT}
+            for values in zip(*columns)
+        ]
+    else:
+        built = list(map(dict, map(zip, repeat(names), zip(*columns))))
+    if not failed and len(candidates) == len(rows):
+        return built, errors
+
+    products = [None] * len(rows)
+    for index, row_errors, product in zip(candidates, candidate_errors, built):
+        if not row_errors:
+            products[index] = product
+    return products, errors
+
+def coerce_values(values, value_errors, coerce, coerce_column):
+    """
+    (coerced values, whether any failed) of one column, in blocks of
+    COLUMN_BLOCK_ROWS. A value that fails is ABSENT and its error is added
+    to its value_errors list.
+    """
+    coerced = []
+    failed = False
+    for start in range(0, len(values), COLUMN_BLOCK_ROWS):
+        block = values[start:start + COLUMN_BLOCK_ROWS]
+        block_coerced = coerce_column(block)
+        if block_coerced is not None:
+            coerced.extend(block_coerced)
+            continue
+        # Only the block holding a bad value is checked value by value
+        for value, errors in zip(block, value_errors[start:start + COLUMN_BLOCK_ROWS]):
+            value, error = coerce(value)
+            if error:
+                errors.append(error)
+                coerced.append(ABSENT)
+                failed = True
+            else:
+                coerced.append(value)
+    return coerced, failed
+
+def parse_product(data):
+    """The coerced product, or ProductValidationError listing every error."""
+    product, errors = validate_product(data)
+    if errors:
+        raise ProductValidationError(errors)
+    return product
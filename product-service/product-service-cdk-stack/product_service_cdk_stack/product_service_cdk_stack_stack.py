@@ -8,7 +8,9 @@ from aws_cdk import (
     aws_sns as sns,
     aws_sns_subscriptions as subscriptions,
     aws_lambda_event_sources as lambda_events,
+    aws_dynamodb as dynamodb,
     Duration,
+    RemovalPolicy,
     Tags
 )
 from constructs import Construct
@@ -28,6 +30,71 @@ class ProductServiceCdkStackStack(Stack):
             for key, value in tags.items():
                 Tags.of(resource).add(key, value)
 
+        # The products table was created out of band; this declaration adopts
+        # it (`cdk import`) so its secondary indexes live in code.
+        products_table = dynamodb.Table(
+            self, 'ProductsTable',
+            table_name='products',
+            partition_key=dynamodb.Attribute(
+                name='id',
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.RETAIN
+        )
+        apply_tags(products_table)
+
+        # Sorted views of the whole catalog for filtered/sorted listings, and
+        # products by last write for the search index's incremental refresh.
+        # Products are spread over catalog#0..catalog#7 index partitions
+        # (see product_fields.catalog_partition); readers merge the shards.
+        catalog_indexes = [
+            ('price-index', 'price', dynamodb.AttributeType.NUMBER),
+            ('title-index', 'title_lower', dynamodb.AttributeType.STRING),
+            ('updated-index', 'updated_at', dynamodb.AttributeType.NUMBER)
+        ]
+        # CloudFormation creates at most one global secondary index per stack
+        # update. Roll new indexes out one deployment at a time with
+        # `cdk deploy -c catalogIndexes=<n>`, n counting up to len(catalog_indexes).
+        index_count = int(self.node.try_get_context('catalogIndexes') or len(catalog_indexes))
+        for index_name, sort_key, sort_key_type in catalog_indexes[:index_count]:
+            products_table.add_global_secondary_index(
+                index_name=index_name,
+                partition_key=dynamodb.Attribute(
+                    name='catalog_partition',
+                    type=dynamodb.AttributeType.STRING
+                ),
+                sort_key=dynamodb.Attribute(
+                    name=sort_key,
+                    type=sort_key_type
+                )
+            )
+
+        catalog_meta_table = dynamodb.Table(
+            self, 'CatalogMetaTable',
+            table_name='catalog_meta',
+            partition_key=dynamodb.Attribute(
+                name='id',
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        apply_tags(catalog_meta_table)
+
+        idempotency_table = dynamodb.Table(
+            self, 'IdempotencyTable',
+            table_name='idempotency',
+            partition_key=dynamodb.Attribute(
+                name='id',
+                type=dynamodb.AttributeType.STRING
+            ),
+            time_to_live_attribute='expires_at',
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        apply_tags(idempotency_table)
+
         get_products_list = _lambda.Function(
             self, 'GetProductsList',
             runtime=_lambda.Runtime.PYTHON_3_9,
@@ -35,7 +102,14 @@ class ProductServiceCdkStackStack(Stack):
             code=_lambda.Code.from_asset('../src'),
             environment={
                 'TABLE_NAME_PRODUCTS': 'products',
-                'TABLE_NAME_STOCKS': 'stocks'
+                'TABLE_NAME_STOCKS': 'stocks',
+                'SCAN_TOTAL_SEGMENTS': os.getenv('SCAN_TOTAL_SEGMENTS', '1'),
+                'SCAN_MAX_WORKERS': os.getenv('SCAN_MAX_WORKERS', '8'),
+                'CATALOG_CACHE_TTL_SECONDS': os.getenv('CATALOG_CACHE_TTL_SECONDS', '300'),
+                'CATALOG_STOCK_CACHE_TTL_SECONDS': os.getenv('CATALOG_STOCK_CACHE_TTL_SECONDS', '10'),
+                'STOCK_AGGREGATE_CACHE_TTL_SECONDS': os.getenv('STOCK_AGGREGATE_CACHE_TTL_SECONDS', '5'),
+                'CACHE_MAX_AGE_SECONDS': os.getenv('CACHE_MAX_AGE_SECONDS', '60'),
+                'TABLE_NAME_CATALOG_META': catalog_meta_table.table_name
             }            
         )
         apply_tags(get_products_list)
@@ -44,7 +118,32 @@ class ProductServiceCdkStackStack(Stack):
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
                 actions=[
-                    'dynamodb:Scan'
+                    'dynamodb:Query'
+                ],
+                resources=[
+                    f'{products_table.table_arn}/index/*'
+                ]
+            )
+        )
+
+        get_products_list.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:GetItem'
+                ],
+                resources=[
+                    catalog_meta_table.table_arn
+                ]
+            )
+        )
+
+        get_products_list.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:Scan',
+                    'dynamodb:BatchGetItem'
                 ],
                 resources=[
                     f'arn:aws:dynamodb:{self.region}:{self.account}:table/products',
@@ -53,6 +152,73 @@ class ProductServiceCdkStackStack(Stack):
             )
         )
 
+        search_products = _lambda.Function(
+            self, 'SearchProducts',
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler='product_search.handler',
+            code=_lambda.Code.from_asset('../src'),
+            # The search index lives in memory; ~2 KiB per product
+            memory_size=1024,
+            timeout=Duration.seconds(30),
+            environment={
+                'TABLE_NAME_PRODUCTS': 'products',
+                'TABLE_NAME_STOCKS': 'stocks',
+                'TABLE_NAME_CATALOG_META': catalog_meta_table.table_name,
+                'SEARCH_INDEX_TTL_SECONDS': os.getenv('SEARCH_INDEX_TTL_SECONDS', '300'),
+                'CACHE_MAX_AGE_SECONDS': os.getenv('CACHE_MAX_AGE_SECONDS', '60')
+            }
+        )
+        apply_tags(search_products)
+
+        search_products.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:Scan'
+                ],
+                resources=[
+                    f'arn:aws:dynamodb:{self.region}:{self.account}:table/products'
+                ]
+            )
+        )
+
+        # Incremental refreshes read the updated-index
+        search_products.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:Query'
+                ],
+                resources=[
+                    f'arn:aws:dynamodb:{self.region}:{self.account}:table/products/index/updated-index'
+                ]
+            )
+        )
+
+        search_products.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:BatchGetItem'
+                ],
+                resources=[
+                    f'arn:aws:dynamodb:{self.region}:{self.account}:table/stocks'
+                ]
+            )
+        )
+
+        search_products.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:GetItem'
+                ],
+                resources=[
+                    catalog_meta_table.table_arn
+                ]
+            )
+        )
+
         get_product_by_id = _lambda.Function(
             self, 'GetProductById',
             runtime=_lambda.Runtime.PYTHON_3_9,
@@ -60,7 +226,15 @@ class ProductServiceCdkStackStack(Stack):
             code=_lambda.Code.from_asset('../src'),
             environment={
                 'TABLE_NAME_PRODUCTS': 'products',
-                'TABLE_NAME_STOCKS': 'stocks'
+                'TABLE_NAME_STOCKS': 'stocks',
+                'CACHE_MAX_AGE_SECONDS': os.getenv('CACHE_MAX_AGE_SECONDS', '60'),
+                # Cached products are dropped whenever the catalog version changes
+                'PRODUCT_CACHE_TTL_SECONDS': os.getenv('PRODUCT_CACHE_TTL_SECONDS', '300'),
+                'STOCK_CACHE_TTL_SECONDS': os.getenv('STOCK_CACHE_TTL_SECONDS', '10'),
+                'CATALOG_VERSION_CHECK_SECONDS': os.getenv('CATALOG_VERSION_CHECK_SECONDS', '5'),
+                'PRODUCT_CACHE_MAX_ENTRIES': '10000',
+                'PRODUCT_CACHE_MAX_BYTES': str(32 * 1024 * 1024),
+                'TABLE_NAME_CATALOG_META': catalog_meta_table.table_name
             } 
         )
         apply_tags(get_product_by_id)
@@ -71,6 +245,18 @@ class ProductServiceCdkStackStack(Stack):
                 actions=[
                     'dynamodb:GetItem'
                 ],
+                resources=[
+                    catalog_meta_table.table_arn
+                ]
+            )
+        )
+
+        get_product_by_id.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:BatchGetItem'
+                ],
                 resources=[
                     f'arn:aws:dynamodb:{self.region}:{self.account}:table/products',
                     f'arn:aws:dynamodb:{self.region}:{self.account}:table/stocks'
@@ -78,18 +264,54 @@ class ProductServiceCdkStackStack(Stack):
             )
         )
 
+        product_schema_layer = _lambda.LayerVersion(
+            self, 'ProductSchemaLayer',
+            code=_lambda.Code.from_asset('../../layers/product_schema'),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_9],
+            description='Shared product schema validator'
+        )
+
         create_product = _lambda.Function(
             self, 'CreateProduct',
             runtime=_lambda.Runtime.PYTHON_3_9,
             handler='create_product.handler',
             code=_lambda.Code.from_asset('../src'),
+            layers=[product_schema_layer],
             environment={
                 'TABLE_NAME_PRODUCTS': 'products',
-                'TABLE_NAME_STOCKS': 'stocks'
+                'TABLE_NAME_STOCKS': 'stocks',
+                'TABLE_NAME_CATALOG_META': catalog_meta_table.table_name,
+                'TABLE_NAME_IDEMPOTENCY': idempotency_table.table_name,
+                'IDEMPOTENCY_CACHE_TTL_SECONDS': '300'
             }
         )
         apply_tags(create_product)
 
+        create_product.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:GetItem',
+                    'dynamodb:PutItem'
+                ],
+                resources=[
+                    idempotency_table.table_arn
+                ]
+            )
+        )
+
+        create_product.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:UpdateItem'
+                ],
+                resources=[
+                    catalog_meta_table.table_arn
+                ]
+            )
+        )
+
         create_product.add_to_role_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
@@ -103,10 +325,96 @@ class ProductServiceCdkStackStack(Stack):
             )
         )
 
+        create_products_batch = _lambda.Function(
+            self, 'CreateProductsBatch',
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler='create_products_batch.handler',
+            code=_lambda.Code.from_asset('../src'),
+            layers=[product_schema_layer],
+            memory_size=512,
+            timeout=Duration.seconds(29),
+            environment={
+                'TABLE_NAME_PRODUCTS': 'products',
+                'TABLE_NAME_STOCKS': 'stocks',
+                'TABLE_NAME_CATALOG_META': catalog_meta_table.table_name
+            }
+        )
+        apply_tags(create_products_batch)
+
+        create_products_batch.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:UpdateItem'
+                ],
+                resources=[
+                    catalog_meta_table.table_arn
+                ]
+            )
+        )
+
+        create_products_batch.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:BatchWriteItem',
+                    'dynamodb:PutItem'
+                ],
+                resources=[
+                    f'arn:aws:dynamodb:{self.region}:{self.account}:table/products',
+                    f'arn:aws:dynamodb:{self.region}:{self.account}:table/stocks'
+                ]
+            )
+        )
+
+        stock_reservation = _lambda.Function(
+            self, 'StockReservation',
+            runtime=_lambda.Runtime.PYTHON_3_9,
+            handler='stock_reservation.handler',
+            code=_lambda.Code.from_asset('../src'),
+            environment={
+                'TABLE_NAME_STOCKS': 'stocks',
+                'SHARD_COUNT_CACHE_TTL_SECONDS': os.getenv('SHARD_COUNT_CACHE_TTL_SECONDS', '5')
+            }
+        )
+        apply_tags(stock_reservation)
+
+        stock_reservation.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    # Conditional decrements of one shard, or several in a
+                    # transaction when no single shard holds enough
+                    'dynamodb:GetItem',
+                    'dynamodb:BatchGetItem',
+                    'dynamodb:UpdateItem',
+                    'dynamodb:TransactWriteItems'
+                ],
+                resources=[
+                    f'arn:aws:dynamodb:{self.region}:{self.account}:table/stocks'
+                ]
+            )
+        )
+
+        catalog_items_dlq = sqs.Queue(
+            self, "CatalogItemsDeadLetterQueue",
+            queue_name="catalogItemsDLQ",
+            retention_period=Duration.days(14)
+        )
+        apply_tags(catalog_items_dlq)
+
         catalog_items_queue = sqs.Queue(
             self, "CatalogItemsQueue",
             queue_name="catalogItemsQueue",
-            visibility_timeout=Duration.seconds(10)
+            # Six times the consumer timeout, so a throttled batch is not
+            # redelivered while it is still being written
+            visibility_timeout=Duration.seconds(180),
+            # Poison messages are parked after three failed attempts instead
+            # of being redelivered (and re-billed) until they expire
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=3,
+                queue=catalog_items_dlq
+            )
         )
         apply_tags(catalog_items_queue)
 
@@ -157,21 +465,78 @@ class ProductServiceCdkStackStack(Stack):
             runtime=_lambda.Runtime.PYTHON_3_9,
             handler='catalog_batch_process.handler',
             code=_lambda.Code.from_asset('../src'),
+            layers=[product_schema_layer],
             environment={
                 'TABLE_NAME_PRODUCTS': 'products',
                 'TABLE_NAME_STOCKS': 'stocks',
-                'SNS_TOPIC_ARN': create_product_topic.topic_arn
+                'SNS_TOPIC_ARN': create_product_topic.topic_arn,
+                'TABLE_NAME_CATALOG_META': catalog_meta_table.table_name,
+                'TABLE_NAME_IDEMPOTENCY': idempotency_table.table_name,
+                'IDEMPOTENCY_CACHE_TTL_SECONDS': '300',
+                'CATALOG_BATCH_MAX_WORKERS': '8',
+                # Failed rows of packed messages are sent back in a new envelope,
+                # invalid ones are parked in the dead-letter queue
+                'CATALOG_QUEUE_URL': catalog_items_queue.queue_url,
+                'CATALOG_DLQ_URL': catalog_items_dlq.queue_url,
+                'MAX_PACKED_ATTEMPTS': '3'
             },
-            timeout=Duration.seconds(10)
+            timeout=Duration.seconds(30)
         )
         apply_tags(catalog_batch_process)
 
+        catalog_batch_process.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:BatchGetItem',
+                    'dynamodb:BatchWriteItem'
+                ],
+                resources=[
+                    idempotency_table.table_arn
+                ]
+            )
+        )
+
+        catalog_batch_process.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'dynamodb:UpdateItem'
+                ],
+                resources=[
+                    catalog_meta_table.table_arn
+                ]
+            )
+        )
+
+        catalog_batch_process.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                actions=[
+                    'sqs:SendMessage'
+                ],
+                resources=[
+                    catalog_items_queue.queue_arn,
+                    catalog_items_dlq.queue_arn
+                ]
+            )
+        )
+
         catalog_batch_process.add_event_source(
             lambda_events.SqsEventSource(
                 catalog_items_queue,
-                batch_size=5,
+                # CSV imports carry a version, so every imported record is its
+                # own TransactWriteItems call (product and stock, conditional
+                # on an older version) at twice the WCU of a plain write:
+                # 100 records take ~100 transaction and 10 PublishBatch calls,
+                # about 13 rounds on 8 workers. Unversioned records share
+                # BatchWriteItem calls, 12 products each. When
+                # import_file_parser packs 25 products per message, lower it
+                # to 10 (250 products, ~32 rounds)
+                batch_size=100,
                 max_batching_window=Duration.seconds(10),
-                max_concurrency=2
+                max_concurrency=2,
+                report_batch_item_failures=True
             )
         )
 
@@ -179,6 +544,9 @@ class ProductServiceCdkStackStack(Stack):
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
                 actions=[
+                    'dynamodb:BatchWriteItem',
+                    # Versioned updates: stored versions, then conditional puts
+                    'dynamodb:BatchGetItem',
                     'dynamodb:PutItem'
                 ],
                 resources=[
@@ -191,6 +559,7 @@ class ProductServiceCdkStackStack(Stack):
         catalog_batch_process.add_to_role_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
+                # Also authorizes PublishBatch
                 actions=[
                     'sns:Publish'
                 ],
@@ -204,9 +573,12 @@ class ProductServiceCdkStackStack(Stack):
             self, 'ProductServiceAPI',
             rest_api_name='ProductService',
             description="Product Service API Gateway",
+            # Lets handlers return gzip/brotli bodies as base64 with isBase64Encoded
+            binary_media_types=['*/*'],
             default_cors_preflight_options=apigw.CorsOptions(
                 allow_origins=apigw.Cors.ALL_ORIGINS,
-                allow_methods=['GET', 'OPTIONS']
+                allow_methods=['GET', 'POST', 'OPTIONS'],
+                allow_headers=apigw.Cors.DEFAULT_HEADERS + ['If-None-Match', 'Idempotency-Key']
             )
         )
         apply_tags(apigateway)
@@ -215,5 +587,17 @@ class ProductServiceCdkStackStack(Stack):
         products.add_method('GET', apigw.LambdaIntegration(get_products_list))
         products.add_method('POST', apigw.LambdaIntegration(create_product))
 
+        batch = products.add_resource('batch')
+        batch.add_method('POST', apigw.LambdaIntegration(create_products_batch))
+
+        search = products.add_resource('search')
+        search.add_method('GET', apigw.LambdaIntegration(search_products))
+
         product_by_id = products.add_resource('{productId}')
         product_by_id.add_method('GET', apigw.LambdaIntegration(get_product_by_id))
+
+        reserve = product_by_id.add_resource('reserve')
+        reserve.add_method('POST', apigw.LambdaIntegration(stock_reservation))
+
+        release = product_by_id.add_resource('release')
+        release.add_method('POST', apigw.LambdaIntegration(stock_reservation))
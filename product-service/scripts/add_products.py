@@ -20,6 +20,11 @@ import boto3
 import uuid
 import sys
 import random
+import time
+import zlib
+
+# Must match CATALOG_PARTITION_SHARDS in src/product_fields.py
+CATALOG_PARTITION_SHARDS = 8
 
 
 if len(sys.argv) != 2:
@@ -104,7 +109,10 @@ for product in products:
             'id': id,
             'title': product['title'],
             'description': product['description'],
-            'price': product['price']
+            'price': product['price'],
+            'catalog_partition': f"catalog#{zlib.crc32(id.encode('utf-8')) % CATALOG_PARTITION_SHARDS}",
+            'title_lower': product['title'].strip().lower(),
+            'updated_at': int(time.time() * 1000)
         }
     )
     print(f"Added product: {product['title']}")
@@ -0,0 +1,68 @@
+# AWS DynamoDB Products Index Backfill Script
+# -------------------------------------------
+# Requirements:
+# - Python 3.x
+# - boto3 (`pip install boto3`)
+# - Configured AWS CLI with valid profile
+# - Existing DynamoDB table: 'products' with 'price-index' and 'title-index'
+
+# Usage:
+# python backfill_index_attributes.py <aws-profile-name>
+
+# Example:
+# python backfill_index_attributes.py rs_school_aws_dev
+
+# Description:
+# Products written before the catalog indexes existed lack the 'catalog_partition'
+# and 'title_lower' attributes, so they are invisible to filtered/sorted listings.
+# The script scans the products table and sets both attributes on every item.
+# It also moves products from the old single 'catalog' partition onto the
+# sharded 'catalog#<n>' partitions; re-run it after changing
+# CATALOG_PARTITION_SHARDS in src/product_fields.py.
+# String prices (from early CSV imports) are converted to numbers, because the
+# price index only accepts numeric prices.
+
+
+import boto3
+import sys
+import zlib
+from decimal import Decimal
+
+# Must match CATALOG_PARTITION_SHARDS in src/product_fields.py
+CATALOG_PARTITION_SHARDS = 8
+
+
+if len(sys.argv) != 2:
+    print("Please provide AWS profile name!")
+    print("Usage: python backfill_index_attributes.py profile_name")
+    sys.exit(1)
+
+profile_name = sys.argv[1]
+print(f"Using profile: {profile_name}")
+
+session = boto3.Session(profile_name=profile_name)
+dynamodb = session.resource('dynamodb')
+products_table = dynamodb.Table('products')
+
+updated = 0
+scan_kwargs = {}
+while True:
+    response = products_table.scan(**scan_kwargs)
+    for product in response['Items']:
+        products_table.update_item(
+            Key={'id': product['id']},
+            UpdateExpression='SET catalog_partition = :partition, title_lower = :title, price = :price',
+            ExpressionAttributeValues={
+                ':partition': f"catalog#{zlib.crc32(product['id'].encode('utf-8')) % CATALOG_PARTITION_SHARDS}",
+                ':title': product['title'].strip().lower(),
+                ':price': Decimal(str(product['price']))
+            }
+        )
+        updated += 1
+        print(f"Updated product: {product['title']}")
+
+    if 'LastEvaluatedKey' not in response:
+        break
+    scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+print(f"Done! Updated {updated} products.")
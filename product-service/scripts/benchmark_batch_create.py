@@ -0,0 +1,145 @@
+# Bulk Product Creation Benchmark (single-item vs batch endpoint)
+# ---------------------------------------------------------------
+# Requirements:
+# - Python 3.x
+# - boto3, moto (`pip install -r ../tests/requirements-tests.txt`)
+
+# Usage:
+# python benchmark_batch_create.py [--products N] [--invoke-latency-ms N] [--call-latency-ms N]
+
+# Example:
+# python benchmark_batch_create.py --products 1000 --invoke-latency-ms 30 --call-latency-ms 8
+
+# Description:
+# Creates the same synthetic products against moto-backed tables three ways:
+# one create_product invocation per product, create_products_batch with
+# BatchWriteItem, and create_products_batch with atomic=true (TransactWriteItems).
+# --invoke-latency-ms stands in for the API Gateway + Lambda round trip of every
+# request and --call-latency-ms for every DynamoDB call. moto caps transactions
+# at 25 actions, so the atomic mode runs with 12 products per transaction here
+# (49 on DynamoDB); its call count is scaled down accordingly in the report.
+# Reports requests, DynamoDB calls, wall-clock time and products per second.
+# moto itself adds several milliseconds per transaction, which inflates the
+# single-item and atomic timings relative to DynamoDB.
+
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('TABLE_NAME_PRODUCTS', 'products')
+os.environ.setdefault('TABLE_NAME_STOCKS', 'stocks')
+os.environ.setdefault('TABLE_NAME_CATALOG_META', 'catalog_meta')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'layers', 'product_schema', 'python'))
+
+import boto3
+from moto import mock_dynamodb
+
+
+class LambdaContext:
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+
+def create_tables(client):
+    for table_name, key in ((os.environ['TABLE_NAME_PRODUCTS'], 'id'),
+                            (os.environ['TABLE_NAME_STOCKS'], 'product_id'),
+                            (os.environ['TABLE_NAME_CATALOG_META'], 'id')):
+        client.create_table(
+            TableName=table_name,
+            KeySchema=[{'AttributeName': key, 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': key, 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+
+def clear_tables(dynamodb):
+    for table_name, key in ((os.environ['TABLE_NAME_PRODUCTS'], 'id'),
+                            (os.environ['TABLE_NAME_STOCKS'], 'product_id')):
+        table = dynamodb.Table(table_name)
+        with table.batch_writer() as batch:
+            for item in table.scan(ProjectionExpression='#k', ExpressionAttributeNames={'#k': key})['Items']:
+                batch.delete_item(Key=item)
+
+
+def synthetic_products(size):
+    return [
+        {
+            'title': f'Product {i}',
+            'description': f'Synthetic product number {i}',
+            'price': i % 500 + 1,
+            'count': i % 50
+        }
+        for i in range(size)
+    ]
+
+
+class CallCounter:
+    """Counts DynamoDB calls of a handler module and adds a fixed latency to each."""
+
+    def __init__(self, modules, latency):
+        self.latency = latency
+        self.calls = 0
+        for module in modules:
+            module.dynamodb.meta.client.meta.events.register(
+                'provide-client-params.dynamodb', self.record)
+
+    def record(self, params, model, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+
+
+def run(name, requests, handler, counter, invoke_latency, products, scale_calls=1.0):
+    counter.calls = 0
+    started = time.perf_counter()
+    for body in requests:
+        time.sleep(invoke_latency)
+        response = handler({'body': json.dumps(body)}, LambdaContext())
+        assert response['statusCode'] == 201, response['body']
+    seconds = time.perf_counter() - started
+    print(f"{name:<22} requests: {len(requests):>6}  dynamodb calls: {round(counter.calls * scale_calls):>6}  "
+          f"time: {seconds:7.2f} s  throughput: {products / seconds:8.0f} products/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--invoke-latency-ms', type=float, default=30)
+    parser.add_argument('--call-latency-ms', type=float, default=8)
+    args = parser.parse_args()
+
+    with mock_dynamodb():
+        create_tables(boto3.client('dynamodb'))
+        dynamodb = boto3.resource('dynamodb')
+
+        import create_product
+        import create_products_batch
+        counter = CallCounter([create_product, create_products_batch], args.call_latency_ms / 1000)
+        products = synthetic_products(args.products)
+        invoke_latency = args.invoke_latency_ms / 1000
+        batch_size = create_products_batch.MAX_BATCH_PRODUCTS
+        batches = [products[i:i + batch_size] for i in range(0, len(products), batch_size)]
+
+        run('single-item', products, create_product.handler, counter, invoke_latency, len(products))
+        clear_tables(dynamodb)
+
+        run('batch (BatchWriteItem)', [{'products': batch} for batch in batches],
+            create_products_batch.handler, counter, invoke_latency, len(products))
+        clear_tables(dynamodb)
+
+        moto_products_per_transaction = 12
+        create_products_batch.TRANSACT_MAX_ACTIONS = 2 * moto_products_per_transaction + 1
+        run('batch (atomic)', [{'products': batch, 'atomic': True} for batch in batches],
+            create_products_batch.handler, counter, invoke_latency, len(products),
+            scale_calls=moto_products_per_transaction / 49)
+
+
+if __name__ == '__main__':
+    main()
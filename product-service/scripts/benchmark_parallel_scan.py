@@ -0,0 +1,164 @@
+# Full Catalog Scan Benchmark (serial vs segmented)
+# ------------------------------------------------
+# Requirements:
+# - Python 3.x
+# - boto3, moto (`pip install -r ../tests/requirements-tests.txt`)
+
+# Usage:
+# python benchmark_parallel_scan.py [--items N] [--page-items N] [--segments N] [--page-latency-ms N]
+
+# Example:
+# python benchmark_parallel_scan.py --items 20000 --segments 8
+
+# Description:
+# Seeds moto-backed 'products' and 'stocks' tables and lists the full catalog with
+# products_list, first with serial scans and then with the parallel segmented scan.
+# moto neither splits tables into segments nor cuts pages at 1 MB, so the script
+# serves scans from a snapshot of the moto tables: every page holds at most
+# --page-items items, and each segment only sees the items whose hash key falls
+# into it. --page-latency-ms adds a fixed delay per page to stand in for the
+# DynamoDB round trip.
+# Reports total pages, pages on the critical path (the longest serial chain of pages)
+# and wall-clock time for each mode.
+
+
+import argparse
+import os
+import sys
+import threading
+import time
+import zlib
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('TABLE_NAME_PRODUCTS', 'products')
+os.environ.setdefault('TABLE_NAME_STOCKS', 'stocks')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import boto3
+from moto import mock_dynamodb
+
+
+def create_tables(client):
+    for table_name, key in ((os.environ['TABLE_NAME_PRODUCTS'], 'id'),
+                            (os.environ['TABLE_NAME_STOCKS'], 'product_id')):
+        client.create_table(
+            TableName=table_name,
+            KeySchema=[{'AttributeName': key, 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': key, 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+
+def seed(dynamodb, items):
+    products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
+    stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
+    with products_table.batch_writer() as products, stocks_table.batch_writer() as stocks:
+        for i in range(items):
+            product_id = f'product-{i:06d}'
+            products.put_item(Item={
+                'id': product_id,
+                'title': f'Product {i}',
+                'description': 'x' * 200,
+                'price': i % 500 + 1
+            })
+            stocks.put_item(Item={'product_id': product_id, 'count': i % 50})
+
+
+class PageCounter:
+    def __init__(self, client, page_items, page_latency):
+        self.original_scan = client.scan
+        self.page_items = page_items
+        self.page_latency = page_latency
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.pages = {}
+
+    def table_items(self, table_name):
+        with self.lock:
+            if table_name not in self.tables:
+                response = self.original_scan(TableName=table_name)
+                items = response['Items']
+                while 'LastEvaluatedKey' in response:
+                    response = self.original_scan(
+                        TableName=table_name,
+                        ExclusiveStartKey=response['LastEvaluatedKey']
+                    )
+                    items.extend(response['Items'])
+                self.tables[table_name] = items
+            return self.tables[table_name]
+
+    def scan(self, **kwargs):
+        table_name = kwargs['TableName']
+        total_segments = kwargs.get('TotalSegments', 1)
+        segment = kwargs.get('Segment', 0)
+
+        time.sleep(self.page_latency)
+        with self.lock:
+            chain = (table_name, segment)
+            self.pages[chain] = self.pages.get(chain, 0) + 1
+
+        hash_key = 'id' if table_name == os.environ['TABLE_NAME_PRODUCTS'] else 'product_id'
+        items = [
+            item for item in self.table_items(table_name)
+            if zlib.crc32(item[hash_key].encode('utf-8')) % total_segments == segment
+        ]
+        offset = kwargs.get('ExclusiveStartKey', {}).get('offset', 0)
+        response = {'Items': items[offset:offset + self.page_items]}
+        if offset + self.page_items < len(items):
+            response['LastEvaluatedKey'] = {'offset': offset + self.page_items}
+        return response
+
+
+def run(products_list, counter, total_segments):
+    products_list.SCAN_TOTAL_SEGMENTS = total_segments
+    counter.pages = {}
+    started = time.perf_counter()
+    products = products_list.list_all_products()
+    elapsed = time.perf_counter() - started
+    pages = sum(counter.pages.values())
+    # Serial mode reads both tables one after the other: every page is on the critical path.
+    critical_path = max(counter.pages.values()) if total_segments > 1 else pages
+    return len(products), pages, critical_path, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--page-items', type=int, default=1000)
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--page-latency-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    with mock_dynamodb():
+        create_tables(boto3.client('dynamodb'))
+
+        import products_list
+        print(f"Seeding {args.items} products...")
+        seed(products_list.dynamodb, args.items)
+
+        # The serial path scans through the Table resources, the segmented path
+        # through the shared low-level client; route both through the counter.
+        client = products_list.dynamodb.meta.client
+        counter = PageCounter(client, args.page_items, args.page_latency_ms / 1000)
+        client.scan = counter.scan
+        for table_name in (os.environ['TABLE_NAME_PRODUCTS'], os.environ['TABLE_NAME_STOCKS']):
+            counter.table_items(table_name)
+
+        original_scan_all = products_list.scan_all
+        products_list.scan_all = lambda table, **kwargs: products_list.scan_segment(table.name, 0, 1, **kwargs)
+
+        results = [
+            ('serial', run(products_list, counter, 1)),
+            (f'segmented x{args.segments}', run(products_list, counter, args.segments)),
+        ]
+        products_list.scan_all = original_scan_all
+
+    print(f"{'mode':<16}{'products':>10}{'pages':>8}{'critical path':>15}{'wall time':>12}")
+    for mode, (products, pages, critical_path, elapsed) in results:
+        print(f"{mode:<16}{products:>10}{pages:>8}{critical_path:>15}{elapsed:>11.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# Product Schema Validation Benchmark
+# -----------------------------------
+# Requirements:
+# - Python 3.x
+
+# Usage:
+# python benchmark_product_schema.py [--rows N] [--invalid-ratio R] [--repeat N]
+
+# Example:
+# python benchmark_product_schema.py --rows 1000000 --invalid-ratio 0.05
+
+# Description:
+# Generates CSV-style rows (every value a string, as import_file_parser reads
+# them) and measures the per-row cost of the shared product_schema validator:
+# validate_product one row at a time against validate_many, which checks the
+# batch column by column. Each is timed alone, best of --repeat runs, with
+# its results dropped before the next run so neither pays for collecting the
+# other's garbage. Both must return the same products and errors.
+
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'layers', 'product_schema', 'python'))
+
+from product_schema import validate_product, validate_many
+
+
+def synthetic_rows(size, invalid_ratio, rng):
+    for i in range(size):
+        row = {
+            'id': f'product-{i:07d}',
+            'title': f'Product {i}',
+            'description': 'Synthetic product used to benchmark schema validation',
+            'price': f'{rng.randint(1, 99999) / 100:.2f}',
+            'count': str(rng.randint(0, 500))
+        }
+        if rng.random() < invalid_ratio:
+            row[rng.choice(['price', 'count', 'title'])] = ''
+        yield row
+
+
+def measure(name, rows, run, repeat):
+    seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run(rows)
+        elapsed = time.perf_counter() - started
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    print(f"{name:<24} {seconds:6.2f} s   {seconds / len(rows) * 1e6:6.2f} us/row   "
+          f"{len(rows) / seconds:10.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--invalid-ratio', type=float, default=0.05)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = list(synthetic_rows(args.rows, args.invalid_ratio, random.Random(42)))
+
+    products, errors = validate_many(rows)
+    print(f"rows:                    {len(rows)} ({products.count(None)} invalid)")
+    if list(zip(products, errors)) != [validate_product(row) for row in rows]:
+        sys.exit('validate_many disagrees with validate_product')
+    del products, errors
+
+    measure('validate_product', rows, lambda rows: [validate_product(row) for row in rows], args.repeat)
+    measure('validate_many', rows, validate_many, args.repeat)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# Product Search Index Benchmark
+# ------------------------------
+# Requirements:
+# - Python 3.x
+
+# Usage:
+# python benchmark_search_index.py [--products N] [--queries N]
+
+# Example:
+# python benchmark_search_index.py --products 100000 --queries 2000
+
+# Description:
+# Generates a synthetic catalog (100k products by default) and measures the
+# in-memory search index used by product_search: full build time, memory held
+# by the index (tracemalloc), incremental refresh time for a handful of new
+# products, and query latency percentiles for whole-word and prefix queries.
+
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from search_index import SearchIndex
+
+
+BRANDS = ['Sony', 'Apple', 'Bose', 'Sennheiser', 'Jabra', 'Beats', 'Anker', 'Google',
+          'Samsung', 'Nothing', 'Marshall', 'Audio-Technica', 'Shure', 'JBL', 'Skullcandy']
+KINDS = ['Headphones', 'Earbuds', 'Speaker', 'Soundbar', 'Microphone', 'Amplifier',
+         'Turntable', 'Headset', 'Receiver', 'Subwoofer']
+WORDS = ['wireless', 'noise', 'cancelling', 'bluetooth', 'premium', 'studio', 'portable',
+         'waterproof', 'bass', 'hi-res', 'spatial', 'audio', 'battery', 'charging', 'case',
+         'transparent', 'design', 'adaptive', 'equalizer', 'comfort', 'travel', 'gaming',
+         'surround', 'open-back', 'closed-back', 'monitor', 'reference', 'vinyl', 'digital']
+
+
+def synthetic_catalog(size, rng):
+    # A long tail of model names gives the vocabulary a realistic size
+    for i in range(size):
+        brand = rng.choice(BRANDS)
+        kind = rng.choice(KINDS)
+        model = f'{rng.choice("ABCDEFGHKMQRSTXZ")}{rng.randint(10, 99999)}'
+        yield {
+            'id': f'product-{i:06d}',
+            'title': f'{brand} {model} {kind}',
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 20)))
+        }
+
+
+def percentile(samples, fraction):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    catalog = list(synthetic_catalog(args.products, rng))
+
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.sync(catalog)
+    build_seconds = time.perf_counter() - started
+
+    # tracemalloc slows allocation down, so memory is measured on a second build
+    tracemalloc.start()
+    measured_index = SearchIndex()
+    measured_index.sync(catalog)
+    index_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del measured_index
+
+    new_products = list(synthetic_catalog(10, random.Random(7)))
+    for i, product in enumerate(new_products):
+        product['id'] = f'new-{i}'
+    started = time.perf_counter()
+    added, _, _ = index.sync(catalog + new_products)
+    refresh_seconds = time.perf_counter() - started
+
+    queries = []
+    for _ in range(args.queries):
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(rng.choice(BRANDS).lower())
+        elif kind < 0.7:
+            queries.append(f'{rng.choice(WORDS)} {rng.choice(KINDS).lower()}')
+        else:
+            # Autocomplete: the first few letters of a brand
+            queries.append(rng.choice(BRANDS).lower()[:rng.randint(2, 4)])
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, 20)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    print(f"products:          {len(index)}")
+    print(f"vocabulary:        {len(index.vocabulary)} tokens")
+    print(f"build time:        {build_seconds:.2f} s")
+    print(f"index memory:      {index_bytes / 1024 / 1024:.1f} MiB")
+    print(f"refresh:           {refresh_seconds * 1000:.0f} ms (+{added} products)")
+    print(f"query p50:         {statistics.median(latencies):.2f} ms")
+    print(f"query p95:         {percentile(latencies, 0.95):.2f} ms")
+    print(f"query p99:         {percentile(latencies, 0.99):.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
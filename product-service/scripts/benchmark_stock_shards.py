@@ -0,0 +1,139 @@
+# Hot Stock Counter Benchmark (one item vs sharded counters)
+# ----------------------------------------------------------
+# Requirements:
+# - Python 3.x
+# - boto3, moto (`pip install -r ../tests/requirements-tests.txt`)
+
+# Usage:
+# python benchmark_stock_shards.py [--stock N] [--reservations N] [--workers N] [--shards N] [--item-write-ms N]
+
+# Example:
+# python benchmark_stock_shards.py --stock 500 --reservations 600 --workers 32 --shards 8 --item-write-ms 20
+
+# Description:
+# Runs concurrent single-unit reservations of one product against moto-backed
+# tables, first with its stock in a single item, then spread over --shards
+# items. DynamoDB serializes writes to the same item, which moto does not, so
+# every write holds a per-item lock for --item-write-ms; a hot item then caps
+# throughput at 1000 / item-write-ms reservations per second however many
+# clients there are. Requests beyond the stock must fail: the run checks that
+# the successful reservations and the remaining stock add up to the initial
+# stock and that no shard went negative. moto caps transactions at 25 actions,
+# so keep --shards at 24 or below. moto spends a few milliseconds of CPU per
+# call under the GIL, which caps the sharded runs at roughly 100 requests/s
+# here; a hot item of DynamoDB sustains ~1000 writes/s, so the gap shows at
+# larger --item-write-ms values.
+
+
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('TABLE_NAME_STOCKS', 'stocks')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import boto3
+from botocore.config import Config
+from moto import mock_dynamodb
+
+PRODUCT_ID = 'hot-product'
+
+
+class ItemLocks:
+    """Holds a lock per written item for the duration of every write call, plus a fixed latency."""
+
+    def __init__(self, client, latency):
+        self.latency = latency
+        self.locks = defaultdict(threading.Lock)
+        self.guard = threading.Lock()
+        client.meta.events.register('provide-client-params.dynamodb.UpdateItem', self.update_keys)
+        client.meta.events.register('provide-client-params.dynamodb.TransactWriteItems', self.transaction_keys)
+        client.meta.events.register('before-call.dynamodb', self.acquire)
+        client.meta.events.register('after-call.dynamodb', self.release)
+
+    def update_keys(self, params, context, **kwargs):
+        context['item_keys'] = [params['Key']['product_id']]
+
+    def transaction_keys(self, params, context, **kwargs):
+        operations = [next(iter(action.values())) for action in params['TransactItems']]
+        context['item_keys'] = sorted(
+            (operation.get('Key') or operation['Item'])['product_id'] for operation in operations
+        )
+
+    def acquire(self, context, **kwargs):
+        keys = context.get('item_keys', [])
+        with self.guard:
+            locks = [self.locks[key] for key in keys]
+        for lock in locks:
+            lock.acquire()
+        context['item_locks'] = locks
+        if locks:
+            time.sleep(self.latency)
+
+    def release(self, context, **kwargs):
+        for lock in reversed(context.pop('item_locks', [])):
+            lock.release()
+
+
+def run(shard_count, stock_counters, stock, reservations, workers):
+    stock_counters.dynamodb.Table(stock_counters.stocks_table_name).put_item(
+        Item={'product_id': PRODUCT_ID, 'count': stock}
+    )
+    shards = stock_counters.configure_shards(PRODUCT_ID, shard_count)
+
+    def reserve(_):
+        try:
+            stock_counters.reserve(PRODUCT_ID, 1)
+            return True
+        except stock_counters.InsufficientStock:
+            return False
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        reserved = sum(executor.map(reserve, range(reservations)))
+    seconds = time.perf_counter() - started
+
+    _, counts = stock_counters.read_shards(PRODUCT_ID)
+    assert min(counts) >= 0, f'negative shard: {counts}'
+    assert reserved + sum(counts) == stock, f'{reserved} reserved, {sum(counts)} left of {stock}'
+    print(f"{len(shards):>3} shard(s)  reserved: {reserved:>6}  rejected: {reservations - reserved:>6}  "
+          f"left: {sum(counts):>6}  time: {seconds:7.2f} s  throughput: {reservations / seconds:8.0f} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stock', type=int, default=500)
+    parser.add_argument('--reservations', type=int, default=600)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--item-write-ms', type=float, default=20)
+    args = parser.parse_args()
+
+    with mock_dynamodb():
+        boto3.client('dynamodb').create_table(
+            TableName=os.environ['TABLE_NAME_STOCKS'],
+            KeySchema=[{'AttributeName': 'product_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'product_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+        import stock_counters
+        # One connection per worker, as in a fleet of concurrent Lambdas
+        stock_counters.dynamodb = boto3.resource(
+            'dynamodb', config=Config(max_pool_connections=args.workers)
+        )
+        ItemLocks(stock_counters.dynamodb.meta.client, args.item_write_ms / 1000)
+
+        for shards in (1, args.shards):
+            run(shards, stock_counters, args.stock, args.reservations, args.workers)
+
+
+if __name__ == '__main__':
+    main()
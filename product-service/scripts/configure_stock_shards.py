@@ -0,0 +1,51 @@
+# AWS DynamoDB Stock Sharding Script
+# ----------------------------------
+# Requirements:
+# - Python 3.x
+# - boto3 (`pip install boto3`)
+# - Configured AWS CLI with valid profile
+# - Existing DynamoDB table: 'stocks'
+
+# Usage:
+# python configure_stock_shards.py <aws-profile-name> <product-id> <shards>
+
+# Example:
+# python configure_stock_shards.py rs_school_aws_dev 7567ec4b-b10c-48c5-9345-fc73c48a80aa 8
+
+# Description:
+# Spreads a hot product's stock evenly over <shards> items of the stocks table
+# so that concurrent reservations update different items; 1 merges the shards
+# back into one item. The current total is kept, including reservations made
+# while the script runs. CSV imports that restock the product spread the new
+# count over the same number of shards, so the product stays sharded.
+
+
+import os
+import sys
+
+os.environ.setdefault('TABLE_NAME_STOCKS', 'stocks')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import boto3
+
+
+if len(sys.argv) != 4:
+    print("Please provide AWS profile name, product ID and number of shards!")
+    print("Usage: python configure_stock_shards.py profile_name product_id shards")
+    sys.exit(1)
+
+profile_name, product_id, shards = sys.argv[1], sys.argv[2], int(sys.argv[3])
+print(f"Using profile: {profile_name}")
+
+session = boto3.Session(profile_name=profile_name)
+
+import stock_counters
+stock_counters.dynamodb = session.resource('dynamodb')
+
+try:
+    counts = stock_counters.configure_shards(product_id, shards)
+except KeyError:
+    print(f"Error: no stock found for product {product_id}")
+    sys.exit(1)
+
+print(f"Stock of {product_id} ({sum(counts)} units) spread over {len(counts)} shard(s): {counts}")
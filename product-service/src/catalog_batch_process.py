@@ -2,63 +2,475 @@ import json
 import os
 import boto3
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import catalog_version
+import idempotency
+import stock_counters
+from catalog_envelope import decode_message, encode_envelope
+from dynamodb_batch import batch_get_items, batch_write_items, chunked, BATCH_WRITE_MAX_ITEMS
+from product_fields import index_attributes
+from product_schema import parse_product, ProductValidationError
+from sns_batch import publish_batch, PUBLISH_BATCH_MAX_ENTRIES
+from stock_counters import shard_count
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
+# The BatchWriteItem and PublishBatch calls of one invocation run on up to
+# this many threads; 1 keeps them serial.
+CATALOG_BATCH_MAX_WORKERS = int(os.environ.get('CATALOG_BATCH_MAX_WORKERS', '4'))
+# A product and its stock take two of the 25 items of a BatchWriteItem call
+PRODUCTS_PER_WRITE = BATCH_WRITE_MAX_ITEMS // 2
+
+# A connection per worker, so concurrent calls never wait for the pool
+client_config = Config(max_pool_connections=max(10, CATALOG_BATCH_MAX_WORKERS))
+dynamodb = boto3.resource('dynamodb', config=client_config)
+sns = boto3.client('sns', config=client_config)
+sqs = boto3.client('sqs')
 
 products_table_name = os.environ['TABLE_NAME_PRODUCTS']
 stocks_table_name = os.environ['TABLE_NAME_STOCKS']
 sns_topic_arn = os.environ['SNS_TOPIC_ARN']
+# Rows of a packed message that fail are sent again to this queue as a new
+# envelope, up to MAX_PACKED_ATTEMPTS times; without it (or after that) the
+# whole message is reported as failed and redelivered
+catalog_queue_url = os.environ.get('CATALOG_QUEUE_URL')
+MAX_PACKED_ATTEMPTS = int(os.environ.get('MAX_PACKED_ATTEMPTS', '3'))
+# Invalid rows of a packed message are parked in this queue (the catalog
+# dead-letter queue) with their errors; without it the whole message fails
+# and reaches the dead-letter queue through redelivery, like a plain one
+catalog_dlq_url = os.environ.get('CATALOG_DLQ_URL')
+
+def run_concurrently(function, chunks):
+    """function(chunk) for every chunk on the worker pool, results in order."""
+    if CATALOG_BATCH_MAX_WORKERS <= 1 or len(chunks) <= 1:
+        return [function(chunk) for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=min(CATALOG_BATCH_MAX_WORKERS, len(chunks))) as executor:
+        return list(executor.map(function, chunks))
+
+def product_item(product_data):
+    item = {
+        'id': product_data['id'],
+        'title': product_data['title'],
+        'description': product_data['description'],
+        'price': product_data['price'],
+        **index_attributes(product_data['id'], product_data['title'])
+    }
+    if 'version' in product_data:
+        item['version'] = product_data['version']
+    return item
+
+def stock_items(product_data, shards=1):
+    """Stock items of the product's count, spread over its shards (stock_counters)."""
+    attributes = {'version': product_data['version']} if 'version' in product_data else {}
+    return stock_counters.stock_items(product_data['id'], product_data['count'], shards, **attributes)
+
+def write_product_chunk(products):
+    writes = []
+    for product_data in products:
+        writes.append((products_table_name, {'PutRequest': {'Item': product_item(product_data)}}))
+        writes.append((stocks_table_name, {'PutRequest': {'Item': stock_items(product_data)[0]}}))
+
+    failed_ids = set()
+    # The client is thread-safe, unlike the resource it belongs to
+    for _, write_request in batch_write_items(dynamodb.meta.client, writes):
+        item = write_request['PutRequest']['Item']
+        failed_ids.add(item['id'] if 'id' in item else item['product_id'])
+    return failed_ids
+
+def write_products(products):
+    """
+    Writes products and their stocks with concurrent BatchWriteItem calls,
+    keeping each product and its stock in the same call. Products whose
+    stock is sharded are written with a transaction over every shard instead.
+    Returns the ids of products whose writes were left unprocessed.
+    """
+    products = list(products)
+    states = stored_state([product_data['id'] for product_data in products])
+    shards = {product_id: state['shards'] for product_id, state in states.items() if state['shards'] > 1}
+    chunks = list(chunked([product_data for product_data in products if product_data['id'] not in shards],
+                          PRODUCTS_PER_WRITE))
+    failed_ids = set().union(*run_concurrently(write_product_chunk, chunks))
+
+    sharded = [(product_data, shards[product_data['id']]) for product_data in products
+               if product_data['id'] in shards]
+    results = run_concurrently(lambda args: write_product(*args), sharded)
+    failed_ids.update(product_data['id'] for (product_data, _), result in zip(sharded, results)
+                      if result == 'failed')
+    return failed_ids
+
+def stored_state(product_ids):
+    """
+    {product_id: {'version', 'stock_version', 'shards'}} of the stored
+    products, read with one BatchGetItem over both tables. A version is None
+    when the item is unversioned or missing.
+    """
+    if not product_ids:
+        return {}
+    items = batch_get_items(dynamodb.meta.client, {
+        products_table_name: {
+            'Keys': [{'id': product_id} for product_id in product_ids],
+            'ProjectionExpression': '#id, #version',
+            'ExpressionAttributeNames': {'#id': 'id', '#version': 'version'}
+        },
+        stocks_table_name: {
+            'Keys': [{'product_id': product_id} for product_id in product_ids],
+            'ProjectionExpression': '#id, #version, #shards',
+            'ExpressionAttributeNames': {'#id': 'product_id', '#version': 'version', '#shards': 'shards'}
+        }
+    })
+    states = {product_id: {'version': None, 'stock_version': None, 'shards': 1} for product_id in product_ids}
+    for item in items[products_table_name]:
+        states[item['id']]['version'] = item.get('version')
+    for item in items[stocks_table_name]:
+        states[item['product_id']].update(stock_version=item.get('version'), shards=shard_count(item))
+    return states
+
+def newer_version_condition(key_name, version):
+    """Condition that only lets a write replace missing, unversioned or older items."""
+    return {
+        'ConditionExpression': 'attribute_not_exists(#key) OR attribute_not_exists(#version) '
+                               'OR #version < :version',
+        'ExpressionAttributeNames': {'#key': key_name, '#version': 'version'},
+        'ExpressionAttributeValues': {':version': version}
+    }
+
+def put_if_newer(table_name, key_name, item):
+    """PutItem that only replaces missing, unversioned or older items. False when stale."""
+    try:
+        dynamodb.meta.client.put_item(
+            TableName=table_name,
+            Item=item,
+            **newer_version_condition(key_name, item['version'])
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+    return True
+
+def put_action(table_name, key_name, item):
+    """Transaction Put, conditional on an older version for versioned items."""
+    put = {'TableName': table_name, 'Item': item}
+    if 'version' in item:
+        put.update(newer_version_condition(key_name, item['version']))
+    return {'Put': put}
+
+def stock_actions(product_data, shards):
+    """
+    Puts of the product's stock shards. Only shard 0 carries the version, so
+    only its write is conditional; the other shards follow it.
+    """
+    items = stock_items(product_data, shards)
+    return [put_action(stocks_table_name, 'product_id', items[0])] + [
+        {'Put': {'TableName': stocks_table_name, 'Item': item}} for item in items[1:]
+    ]
+
+def cancellation_codes(error):
+    """Per-action cancellation reasons of a cancelled transaction, else None."""
+    if error.response['Error']['Code'] != 'TransactionCanceledException':
+        return None
+    return [reason.get('Code') for reason in error.response.get('CancellationReasons', [])]
+
+def write_product(product_data, shards=1):
+    """
+    Writes the product and every shard of its stock in one transaction, the
+    product and shard 0 conditional on holding an older version, so a
+    failure never leaves one of them behind. The stock keeps its number of
+    shards. Returns 'written', 'stale' (a newer version is stored) or 'failed'.
+    """
+    item = product_item(product_data)
+    try:
+        dynamodb.meta.client.transact_write_items(
+            TransactItems=[put_action(products_table_name, 'id', item)] + stock_actions(product_data, shards)
+        )
+        return 'written'
+    except ClientError as e:
+        codes = cancellation_codes(e)
+        if codes and codes[0] == 'ConditionalCheckFailed':
+            return 'stale'
+        if codes and codes[1] == 'ConditionalCheckFailed':
+            # A newer stock count written in the meantime is kept
+            return write_versioned_item(products_table_name, 'id', item)
+        logger.error('Failed to write product %s: %s', product_data['id'], e)
+        return 'failed'
+
+def write_stock(product_data, shards=1):
+    """Writes the product's stock alone. Returns 'written', 'stale' or 'failed'."""
+    try:
+        dynamodb.meta.client.transact_write_items(TransactItems=stock_actions(product_data, shards))
+        return 'written'
+    except ClientError as e:
+        codes = cancellation_codes(e)
+        if codes and codes[0] == 'ConditionalCheckFailed':
+            return 'stale'
+        logger.error('Failed to write stock of %s: %s', product_data['id'], e)
+        return 'failed'
+
+def write_versioned_item(table_name, key_name, item):
+    """put_if_newer returning 'written', 'stale' or 'failed'."""
+    try:
+        return 'written' if put_if_newer(table_name, key_name, item) else 'stale'
+    except ClientError as e:
+        logger.error('Failed to write %s to %s: %s', item[key_name], table_name, e)
+        return 'failed'
+
+def write_versioned_products(products):
+    """
+    Writes versioned products with conditional writes, so an update never
+    replaces a newer version. Versions that are not newer than the stored
+    ones are dropped up front with one BatchGetItem, leaving the conditions
+    to catch concurrent writers. A product stored at this very version over
+    an older stock (left by a write that failed halfway before products and
+    stocks were written together) only gets its stock written.
+    Every product is its own transaction, at twice the WCU of a plain put;
+    BatchWriteItem cannot carry the version conditions.
+    Returns {product_id: 'written' | 'stale' | 'failed'}.
+    """
+    states = stored_state([product_data['id'] for product_data in products])
+    results = {}
+    pending = []
+    stock_pending = []
+    for product_data in products:
+        version = product_data['version']
+        state = states.get(product_data['id'], {})
+        stored_version, stock_version = state.get('version'), state.get('stock_version')
+        shards = state.get('shards', 1)
+        if stored_version is None or stored_version < version:
+            pending.append((product_data, shards))
+        elif stored_version == version and (stock_version is None or stock_version < version):
+            stock_pending.append((product_data, shards))
+        else:
+            results[product_data['id']] = 'stale'
+
+    for (product_data, _), result in zip(pending, run_concurrently(lambda args: write_product(*args), pending)):
+        results[product_data['id']] = result
+    stock_results = run_concurrently(lambda args: write_stock(*args), stock_pending)
+    for (product_data, _), result in zip(stock_pending, stock_results):
+        results[product_data['id']] = result
+    return results
+
+def publish_notifications(notifications):
+    """Concurrent PublishBatch calls. Returns the Ids of unpublished entries."""
+    chunks = list(chunked(notifications, PUBLISH_BATCH_MAX_ENTRIES))
+    return set().union(*run_concurrently(
+        lambda chunk: publish_batch(sns, sns_topic_arn, chunk), chunks
+    ))
+
+def requeue_rows(products, envelope):
+    """Sends failed rows of a packed message again as a new envelope. False when that is not possible."""
+    attempt = envelope['attempt'] + 1
+    if not catalog_queue_url or attempt >= MAX_PACKED_ATTEMPTS:
+        return False
+    try:
+        sqs.send_message(
+            QueueUrl=catalog_queue_url,
+            MessageBody=encode_envelope([json.dumps(product, default=str) for product in products],
+                                        compress=envelope['compressed'], attempt=attempt)
+        )
+    except ClientError as e:
+        logger.error('Failed to requeue %d products: %s', len(products), e)
+        return False
+    return True
+
+def park_invalid_rows(invalid_rows, envelope):
+    """
+    Sends the (row, errors) pairs of a packed message to the dead-letter
+    queue as an envelope carrying the errors. False when that is not possible.
+    """
+    if not catalog_dlq_url:
+        return False
+    try:
+        sqs.send_message(
+            QueueUrl=catalog_dlq_url,
+            MessageBody=encode_envelope([json.dumps(row, default=str) for row, _ in invalid_rows],
+                                        compress=envelope['compressed'], attempt=envelope['attempt'],
+                                        errors=[errors for _, errors in invalid_rows])
+        )
+    except ClientError as e:
+        logger.error('Failed to park %d invalid products: %s', len(invalid_rows), e)
+        return False
+    return True
 
 def handler(event, context):
+    """
+    Returns batchItemFailures (ReportBatchItemFailures) listing only the
+    messages that were invalid or could not be written; SQS redelivers those
+    and, after maxReceiveCount attempts, moves them to the dead-letter queue.
+    A message may pack several products in an envelope (catalog_envelope).
+    Its invalid rows are parked in the dead-letter queue with their errors
+    (park_invalid_rows); rows that fail to be written or announced are sent
+    again as a new envelope (requeue_rows), so the rows that succeeded are
+    not redone. Only when that is not possible is the whole message
+    reported as failed.
+    """
     logger.info('Incoming event: %s', json.dumps(event))
     logger.info('Context: RequestId: %s', context.aws_request_id)
 
+    processed_products = []
+    completed_records = []
+    failed_message_ids = []
+
     try:
-        products_table = dynamodb.Table(products_table_name)
-        stocks_table = dynamodb.Table(stocks_table_name)
+        message_keys = [None] * len(event['Records'])
+        already_processed = {}
+        if idempotency.is_enabled():
+            message_keys = [
+                idempotency.message_key('catalog_batch_process', record['body'])
+                for record in event['Records']
+            ]
+            already_processed = idempotency.get_records(message_keys)
 
-        processed_products = []
-        
-        for record in event['Records']:
-            product_data = json.loads(record['body'])
-            
-            product_id = product_data['id']
-            products_table.put_item(
-                Item={
-                    'id': product_id,
-                    'title': product_data['title'],
-                    'description': product_data['description'],
-                    'price': product_data['price']
-                }
-            )
-            
-            stocks_table.put_item(
-                Item={
-                    'product_id': product_id,
-                    'count': product_data['count']
+        # BatchWriteItem rejects two writes to the same key in one request, so
+        # messages for the same product are collapsed: the highest version
+        # wins, and among unversioned ones the last write wins
+        latest_products = {}
+        messages_by_product = {}
+        # messageId -> packed message state
+        packed_messages = {}
+        for record, message_key in zip(event['Records'], message_keys):
+            if message_key in already_processed:
+                logger.info('Skipping already processed message %s', message_key)
+                continue
+            if message_key:
+                # Duplicates within this batch are skipped as well
+                already_processed[message_key] = None
+
+            message_id = record.get('messageId')
+            try:
+                rows, envelope = decode_message(record['body'])
+            except ValueError as e:
+                logger.error('Invalid product message %s: %s', message_id, e)
+                failed_message_ids.append(message_id)
+                continue
+            if envelope:
+                packed_messages[message_id] = {
+                    **envelope, 'key': message_key, 'rows': len(rows), 'requeue': [], 'invalid': []
                 }
-            )
 
+            for row in rows:
+                try:
+                    # CSV imports deliver every field as a string; the schema coerces
+                    # price to Decimal and count to int
+                    product_data = parse_product(row)
+                    if 'id' not in product_data:
+                        raise ProductValidationError(["Missing required fields: id"])
+                except ValueError as e:
+                    if envelope:
+                        # Redelivery cannot fix the row, and the others are valid
+                        logger.error('Parking invalid product of message %s: %s', message_id, e)
+                        row_errors = e.errors if isinstance(e, ProductValidationError) else [str(e)]
+                        packed_messages[message_id]['invalid'].append((row, row_errors))
+                        continue
+                    logger.error('Invalid product message %s: %s', message_id, e)
+                    failed_message_ids.append(message_id)
+                    break
+
+                product_id = product_data['id']
+                previous = latest_products.get(product_id)
+                if not (previous and previous.get('version', -1) > product_data.get('version', -1)):
+                    latest_products[product_id] = product_data
+                messages_by_product.setdefault(product_id, []).append((message_id, message_key))
+
+        def fail_product(product_id):
+            for message_id, _ in messages_by_product[product_id]:
+                if message_id in packed_messages:
+                    packed_messages[message_id]['requeue'].append(latest_products[product_id])
+                else:
+                    failed_message_ids.append(message_id)
+
+        versioned = [product_data for product_data in latest_products.values() if 'version' in product_data]
+        results = write_versioned_products(versioned)
+        failed_ids = write_products(
+            product_data for product_data in latest_products.values() if 'version' not in product_data
+        )
+        failed_ids.update(product_id for product_id, result in results.items() if result == 'failed')
+        stale_ids = {product_id for product_id, result in results.items() if result == 'stale'}
+        if failed_ids:
+            logger.error('Failed to write %d products', len(failed_ids))
+        if stale_ids:
+            logger.info('Skipped %d stale product updates', len(stale_ids))
+        
+        # Notifications are buffered and sent with PublishBatch, 10 per call
+        notifications = []
+        notified_product_ids = []
+        for product_id, product_data in latest_products.items():
+            if product_id in failed_ids:
+                fail_product(product_id)
+                continue
+            if product_id in stale_ids:
+                # Nothing was written, so there is nothing to announce
+                completed_records.extend(
+                    idempotency.new_record(message_key, {'id': product_id, 'stale': True})
+                    for message_id, message_key in messages_by_product[product_id]
+                    if message_key and message_id not in packed_messages
+                )
+                continue
             processed_products.append(product_data)
 
-            message_attributes = {
-                'price': {
-                    'DataType': 'Number',
-                    'StringValue': str(product_data['price'])
+            notifications.append({
+                'Id': f'product-{len(notifications)}',
+                'Subject': 'New Product Created',
+                'Message': f'New product "{product_data["title"]}" created',
+                # The subscription filter policies route on price
+                'MessageAttributes': {
+                    'price': {
+                        'DataType': 'Number',
+                        'StringValue': str(product_data['price'])
+                    }
                 }
-            }
+            })
+            notified_product_ids.append(product_id)
 
-            sns.publish(
-                TopicArn=sns_topic_arn,
-                Subject='New Product Created',
-                Message=f'New product "{product_data["title"]}" created',
-                MessageAttributes=message_attributes
-            )
+        unpublished = publish_notifications(notifications)
+        for notification, product_id in zip(notifications, notified_product_ids):
+            if notification['Id'] in unpublished:
+                # Redelivery rewrites the product and notifies again
+                fail_product(product_id)
+                continue
+            for message_id, message_key in messages_by_product[product_id]:
+                if message_key and message_id not in packed_messages:
+                    completed_records.append(idempotency.new_record(message_key, {'id': product_id}))
+
+        for message_id, packed in packed_messages.items():
+            if message_id in failed_message_ids:
+                continue
+            if packed['requeue']:
+                logger.warning('Requeueing %d of %d products of message %s',
+                               len(packed['requeue']), packed['rows'], message_id)
+                if not requeue_rows(packed['requeue'], packed):
+                    failed_message_ids.append(message_id)
+                    continue
+            if packed['invalid'] and not park_invalid_rows(packed['invalid'], packed):
+                failed_message_ids.append(message_id)
+                continue
+            if packed['key']:
+                completed_records.append(idempotency.new_record(packed['key'], {
+                    'products': packed['rows'],
+                    'requeued': len(packed['requeue']),
+                    'invalid': len(packed['invalid'])
+                }))
 
     except Exception as e:
         logger.error(e)
-        raise
\ No newline at end of file
+        raise
+    finally:
+        if completed_records:
+            # Records of messages processed before a failure are kept so the
+            # redelivered batch only redoes the rest
+            unsaved = idempotency.save_records(completed_records)
+            if unsaved:
+                logger.warning('Failed to store %d idempotency records', len(unsaved))
+        if processed_products:
+            catalog_version.bump_version()
+
+    if failed_message_ids:
+        logger.warning('Reporting %d failed messages of %d', len(failed_message_ids), len(event['Records']))
+    return {
+        'batchItemFailures': [
+            {'itemIdentifier': message_id} for message_id in dict.fromkeys(failed_message_ids)
+        ]
+    }
@@ -0,0 +1,43 @@
+import os
+import boto3
+
+# A single counter item that every catalog writer bumps. Readers compare it
+# with the version their cached data was built from.
+CATALOG_VERSION_KEY = {'id': 'catalog'}
+
+dynamodb = boto3.resource('dynamodb')
+catalog_meta_table_name = os.environ.get('TABLE_NAME_CATALOG_META')
+
+def is_enabled():
+    return bool(catalog_meta_table_name)
+
+def get_version():
+    response = dynamodb.Table(catalog_meta_table_name).get_item(
+        Key=CATALOG_VERSION_KEY,
+        ConsistentRead=True
+    )
+    item = response.get('Item')
+    return int(item['version']) if item else 0
+
+def bump_version_action():
+    """TransactWriteItems action that bumps the catalog version."""
+    return {
+        'Update': {
+            'TableName': catalog_meta_table_name,
+            'Key': CATALOG_VERSION_KEY,
+            'UpdateExpression': 'ADD #version :one',
+            'ExpressionAttributeNames': {'#version': 'version'},
+            'ExpressionAttributeValues': {':one': 1}
+        }
+    }
+
+def bump_version():
+    if not is_enabled():
+        return
+    action = bump_version_action()['Update']
+    dynamodb.Table(catalog_meta_table_name).update_item(
+        Key=action['Key'],
+        UpdateExpression=action['UpdateExpression'],
+        ExpressionAttributeNames=action['ExpressionAttributeNames'],
+        ExpressionAttributeValues=action['ExpressionAttributeValues']
+    )
@@ -2,9 +2,16 @@ import json
 import os
 import boto3
 import uuid
+import time
 import logging
 from botocore.exceptions import ClientError
 
+import catalog_version
+import idempotency
+from http_response import get_request_body
+from product_fields import index_attributes, join_product
+from product_schema import validate_product, make_version
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -12,33 +19,50 @@ dynamodb = boto3.resource('dynamodb')
 products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
 stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
 
-def validate_product(body):
-    errors = []
+def build_product_items(product):
+    """Product and stock items of a validated product, under a new id."""
+    product_id = str(uuid.uuid4())
+    version = product.get('version', make_version(int(time.time() * 1000)))
     
-    required_fields = ['title', 'description', 'price', 'count']
-    missing_fields = [field for field in required_fields if field not in body]
-    if missing_fields:
-        errors.append(f"Missing required fields: {', '.join(missing_fields)}")
-        return errors
+    product_item = {
+        'id': product_id,
+        'title': product['title'],
+        'description': product['description'],
+        'price': product['price'],
+        'version': version
+    }
     
-    try:
-        if int(body['price']) <= 0:
-            errors.append("Price must be positive")
-    except ValueError:
-        errors.append("Price must be a number")
-        
-    try:
-        if int(body['count']) < 0:
-            errors.append("Count must be non-negative")
-    except ValueError:
-        errors.append("Count must be a number")
-        
-    if not body['title'].strip():
-        errors.append("Title cannot be empty")
-    if not body['description'].strip():
-        errors.append("Description cannot be empty")
-        
-    return errors
+    stock = {
+        'product_id': product_id,
+        'count': product['count'],
+        'version': version
+    }
+    return product_item, stock
+
+def replay_response(record, request_fingerprint):
+    if record.get('fingerprint') != request_fingerprint:
+        return {
+            "statusCode": 422,
+            "headers": {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            "body": json.dumps({
+                "error": "Idempotency-Key was already used with a different request body"
+            })
+        }
+
+    response = json.loads(record['response'])
+    logger.info('Replaying stored response for %s', record['id'])
+    return {
+        'statusCode': response['statusCode'],
+        'headers': {
+            "Access-Control-Allow-Origin": "*",
+            "Content-Type": "application/json",
+            "Idempotent-Replayed": "true"
+        },
+        'body': json.dumps(response['body'])
+    }
 
 def handler(event, context):
     logger.info('Incoming event: %s', json.dumps(event))
@@ -55,9 +79,18 @@ def handler(event, context):
                 }
             }
             
-        body = json.loads(event['body'])
+        body = json.loads(get_request_body(event))
+
+        idempotency_key = None
+        if idempotency.is_enabled():
+            idempotency_key = idempotency.request_key(event, 'create_product')
+        if idempotency_key:
+            request_fingerprint = idempotency.request_fingerprint(event)
+            record = idempotency.get_record(idempotency_key)
+            if record:
+                return replay_response(record, request_fingerprint)
         
-        validation_errors = validate_product(body)
+        product_data, validation_errors = validate_product(body)
         if validation_errors:
             return {
                 "statusCode": 400,
@@ -71,25 +104,13 @@ def handler(event, context):
                 })
             }
             
-        product_id = str(uuid.uuid4())
-        
-        product = {
-            'id': product_id,
-            'title': body['title'].strip(),
-            'description': body['description'].strip(),
-            'price': int(body['price'])
-        }
-        
-        stock = {
-            'product_id': product_id,
-            'count': int(body['count'])
-        }
+        product, stock = build_product_items(product_data)
         
         transaction_items = [
             {
                 'Put': {
                     'TableName': os.environ['TABLE_NAME_PRODUCTS'],
-                    'Item': product,
+                    'Item': {**product, **index_attributes(product['id'], product['title'])},
                     'ConditionExpression': 'attribute_not_exists(id)'
                 }
             },
@@ -101,11 +122,26 @@ def handler(event, context):
                 }
             }
         ]
+        if catalog_version.is_enabled():
+            transaction_items.append(catalog_version.bump_version_action())
+
+        response_item = join_product(product, stock['count'])
+        if idempotency_key:
+            # Storing the response in the same transaction means a concurrent
+            # retry either sees it or has its own transaction cancelled
+            record = idempotency.new_record(
+                idempotency_key, {'statusCode': 201, 'body': response_item}, request_fingerprint
+            )
+            transaction_items.append(idempotency.put_record_action(record))
         
         try:
             dynamodb.meta.client.transact_write_items(TransactItems=transaction_items)
         except ClientError as e:
             if e.response['Error']['Code'] == 'TransactionCanceledException':
+                if idempotency_key:
+                    record = idempotency.get_record(idempotency_key)
+                    if record:
+                        return replay_response(record, request_fingerprint)
                 return {
                     'statusCode': 500,
                     'headers': {
@@ -118,11 +154,9 @@ def handler(event, context):
                     })
                 }
             raise e
-        
-        response_item = {
-            **product,
-            'count': stock['count']
-        }
+
+        if idempotency_key:
+            idempotency.remember(record)
         return {
             'statusCode': 201,
             'headers': {
@@ -0,0 +1,211 @@
+import json
+import os
+import boto3
+import logging
+from botocore.exceptions import ClientError
+
+import catalog_version
+from create_product import build_product_items
+from dynamodb_batch import batch_write_items, chunked, BATCH_WRITE_MAX_ITEMS
+from http_response import get_request_body
+from product_fields import index_attributes, join_product
+from product_schema import validate_many
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_BATCH_PRODUCTS = 1000
+# TransactWriteItems takes at most 100 actions: two per product (product and
+# stock) plus the catalog version bump that every transaction carries.
+TRANSACT_MAX_ACTIONS = 100
+# A product and its stock take two of the 25 items of a BatchWriteItem call
+PRODUCTS_PER_WRITE = BATCH_WRITE_MAX_ITEMS // 2
+
+dynamodb = boto3.resource('dynamodb')
+products_table_name = os.environ['TABLE_NAME_PRODUCTS']
+stocks_table_name = os.environ['TABLE_NAME_STOCKS']
+
+def write_batches(entries):
+    """
+    BatchWriteItem with each product and its stock in the same call.
+    Returns {product_id: error} for failed writes. When only one of a
+    product's two items was written it is deleted again, so retrying the
+    product (under a new id) leaves no orphan behind.
+    """
+    unwritten = {}
+    for chunk in chunked(entries, PRODUCTS_PER_WRITE):
+        writes = []
+        for product, stock in chunk:
+            writes.append((products_table_name, {
+                'PutRequest': {'Item': {**product, **index_attributes(product['id'], product['title'])}}
+            }))
+            writes.append((stocks_table_name, {'PutRequest': {'Item': stock}}))
+        for table_name, write_request in batch_write_items(dynamodb, writes):
+            item = write_request['PutRequest']['Item']
+            product_id = item['id'] if 'id' in item else item['product_id']
+            unwritten.setdefault(product_id, set()).add(table_name)
+
+    cleanup = []
+    for product_id, tables in unwritten.items():
+        if tables == {products_table_name}:
+            cleanup.append((stocks_table_name, {'DeleteRequest': {'Key': {'product_id': product_id}}}))
+        elif tables == {stocks_table_name}:
+            cleanup.append((products_table_name, {'DeleteRequest': {'Key': {'id': product_id}}}))
+    orphaned = set()
+    for _, write_request in batch_write_items(dynamodb, cleanup):
+        key = write_request['DeleteRequest']['Key']
+        orphaned.add(key['id'] if 'id' in key else key['product_id'])
+    if orphaned:
+        logger.error('Could not remove half-written products: %s', sorted(orphaned))
+
+    return {
+        product_id: 'Product was only partly written under this id'
+        if product_id in orphaned else 'Write was not completed, retry this product'
+        for product_id in unwritten
+    }
+
+def write_transactions(entries):
+    """
+    TransactWriteItems in chunks of up to 100 actions; each chunk is
+    all-or-nothing. Returns {product_id: error} for products of failed chunks.
+    """
+    products_per_transaction = (TRANSACT_MAX_ACTIONS - 1) // 2
+    failed = {}
+    for chunk in chunked(entries, products_per_transaction):
+        transaction_items = []
+        for product, stock in chunk:
+            transaction_items.append({
+                'Put': {
+                    'TableName': products_table_name,
+                    'Item': {**product, **index_attributes(product['id'], product['title'])},
+                    'ConditionExpression': 'attribute_not_exists(id)'
+                }
+            })
+            transaction_items.append({
+                'Put': {
+                    'TableName': stocks_table_name,
+                    'Item': stock,
+                    'ConditionExpression': 'attribute_not_exists(product_id)'
+                }
+            })
+        if catalog_version.is_enabled():
+            transaction_items.append(catalog_version.bump_version_action())
+
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=transaction_items)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            logger.error('Transaction cancelled for %d products: %s', len(chunk), e)
+            for product, _ in chunk:
+                failed[product['id']] = 'Transaction cancelled'
+    return failed
+
+def handler(event, context):
+    # The body can hold thousands of products, so only its size is logged
+    logger.info('Incoming event: body of %d bytes', len(event.get('body') or ''))
+    logger.info('Context: RequestId: %s', context.aws_request_id)
+
+    try:
+        if not event.get('body'):
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"error": "Missing request body"}),
+                "headers": {
+                    "Access-Control-Allow-Origin": "*",
+                    "Content-Type": "application/json"
+                }
+            }
+
+        body = json.loads(get_request_body(event))
+        products = body.get('products') if isinstance(body, dict) else None
+        atomic = isinstance(body, dict) and body.get('atomic') is True
+        if not isinstance(products, list) or not products or len(products) > MAX_BATCH_PRODUCTS:
+            return {
+                "statusCode": 400,
+                "headers": {
+                    "Access-Control-Allow-Origin": "*",
+                    "Content-Type": "application/json"
+                },
+                "body": json.dumps({
+                    "error": f"Body must contain 'products': a list of 1 to {MAX_BATCH_PRODUCTS} products"
+                })
+            }
+        logger.info('Creating %d products (atomic: %s)', len(products), atomic)
+
+        results = [None] * len(products)
+        entries = []
+        valid_products, validation_errors = validate_many(products)
+        for index, product_data in enumerate(valid_products):
+            if product_data is None:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': validation_errors[index]}
+            else:
+                entries.append((index, build_product_items(product_data)))
+
+        items = [product_items for _, product_items in entries]
+        failed = write_transactions(items) if atomic else write_batches(items)
+        if not atomic and len(failed) < len(items):
+            catalog_version.bump_version()
+
+        for index, (product, stock) in entries:
+            if product['id'] in failed:
+                results[index] = {
+                    'index': index,
+                    'status': 'failed',
+                    'id': product['id'],
+                    'error': failed[product['id']]
+                }
+            else:
+                results[index] = {
+                    'index': index,
+                    'status': 'created',
+                    'product': join_product(product, stock['count'])
+                }
+
+        created = sum(1 for result in results if result['status'] == 'created')
+        invalid = sum(1 for result in results if result['status'] == 'invalid')
+        if created == len(results):
+            status_code = 201
+        elif invalid == len(results):
+            status_code = 400
+        else:
+            status_code = 207
+
+        return {
+            'statusCode': status_code,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'created': created,
+                'invalid': invalid,
+                'failed': len(results) - created - invalid,
+                'results': results
+            })
+        }
+    except ValueError as ve:
+        return {
+            'statusCode': 400,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'message': 'Invalid request body',
+                'error': str(ve)
+            })
+        }
+    except Exception as e:
+        logger.error(e)
+        return {
+            'statusCode': 500,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'message': 'Internal server error',
+                'error': str(e)
+            })
+        }
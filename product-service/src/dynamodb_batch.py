@@ -0,0 +1,89 @@
+import random
+import time
+import logging
+
+logger = logging.getLogger()
+
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+MAX_RETRIES = 5
+BASE_BACKOFF_SECONDS = 0.05
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def backoff(attempt):
+    # Full jitter keeps concurrent retries from hitting the table in lockstep
+    time.sleep(random.uniform(0, min(BASE_BACKOFF_SECONDS * (2 ** attempt), 1)))
+
+def batch_get_items(dynamodb, request_items):
+    """
+    BatchGetItem over any number of keys per table.
+    request_items: {table_name: {'Keys': [...], ...}}
+    Returns {table_name: [items]}. Keys are sent in chunks of 100 and
+    UnprocessedKeys are retried with exponential backoff.
+    """
+    results = {table_name: [] for table_name in request_items}
+
+    pending = []
+    for table_name, request in request_items.items():
+        options = {k: v for k, v in request.items() if k != 'Keys'}
+        for key in request['Keys']:
+            pending.append((table_name, key, options))
+
+    for chunk in chunked(pending, BATCH_GET_MAX_KEYS):
+        batch = {}
+        for table_name, key, options in chunk:
+            batch.setdefault(table_name, {**options, 'Keys': []})['Keys'].append(key)
+
+        attempt = 0
+        while batch:
+            response = dynamodb.batch_get_item(RequestItems=batch)
+            for table_name, items in response.get('Responses', {}).items():
+                results[table_name].extend(items)
+
+            batch = response.get('UnprocessedKeys') or {}
+            if batch:
+                if attempt >= MAX_RETRIES:
+                    raise RuntimeError('BatchGetItem left unprocessed keys after retries')
+                logger.warning('Retrying %d unprocessed keys',
+                               sum(len(r['Keys']) for r in batch.values()))
+                backoff(attempt)
+                attempt += 1
+
+    return results
+
+def batch_write_items(dynamodb, writes):
+    """
+    BatchWriteItem over any number of write requests.
+    writes: [(table_name, {'PutRequest': ...} or {'DeleteRequest': ...})]
+    Requests are sent in chunks of 25 and UnprocessedItems are retried with
+    exponential backoff. Returns the writes still unprocessed after the
+    last retry (empty when everything was written).
+    """
+    failed = []
+    for chunk in chunked(writes, BATCH_WRITE_MAX_ITEMS):
+        batch = {}
+        for table_name, write_request in chunk:
+            batch.setdefault(table_name, []).append(write_request)
+
+        attempt = 0
+        while batch:
+            response = dynamodb.batch_write_item(RequestItems=batch)
+            batch = response.get('UnprocessedItems') or {}
+            if not batch:
+                break
+            if attempt >= MAX_RETRIES:
+                failed.extend(
+                    (table_name, write_request)
+                    for table_name, write_requests in batch.items()
+                    for write_request in write_requests
+                )
+                break
+            logger.warning('Retrying %d unprocessed writes',
+                           sum(len(requests) for requests in batch.values()))
+            backoff(attempt)
+            attempt += 1
+
+    return failed
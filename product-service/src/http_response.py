@@ -0,0 +1,122 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_MAX_AGE_SECONDS = int(os.environ.get('CACHE_MAX_AGE_SECONDS', '0'))
+# Bodies smaller than this are sent as-is: compression and base64 would
+# cost more than they save.
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Expose-Headers": "ETag"
+}
+
+def get_header(event, name):
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+def compute_etag(body):
+    return '"' + hashlib.sha256(body.encode('utf-8')).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    # Weak comparison: W/"x" and "x" refer to the same representation
+    return '*' in candidates or etag in [
+        candidate[2:] if candidate.startswith('W/') else candidate
+        for candidate in candidates
+    ]
+
+def get_request_body(event):
+    body = event.get('body')
+    if body and event.get('isBase64Encoded'):
+        return base64.b64decode(body).decode('utf-8')
+    return body
+
+def accepted_encodings(accept_encoding):
+    encodings = set()
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+def choose_encoding(event):
+    encodings = accepted_encodings(get_header(event, 'Accept-Encoding'))
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+def compress(body, encoding):
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        return brotli.compress(raw, quality=5)
+    return gzip.compress(raw, compresslevel=6)
+
+def conditional_json_response(event, payload):
+    """
+    200 response with ETag and Cache-Control headers, or an empty
+    304 Not Modified when the client's If-None-Match already matches.
+    Large bodies are gzip/brotli compressed per Accept-Encoding and
+    returned base64-encoded for API Gateway.
+    """
+    body = json.dumps(payload)
+    etag = compute_etag(body)
+    headers = {
+        **CORS_HEADERS,
+        "Content-Type": "application/json",
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CACHE_MAX_AGE_SECONDS}, must-revalidate",
+        "Vary": "Accept-Encoding"
+    }
+
+    if etag_matches(get_header(event, 'If-None-Match'), etag):
+        return {
+            'statusCode': 304,
+            'headers': headers,
+            'body': ''
+        }
+
+    encoding = choose_encoding(event)
+    if encoding and len(body) >= COMPRESSION_MIN_BYTES:
+        # The compressed bytes differ from the identity representation, so
+        # the validator becomes weak; If-None-Match uses weak comparison.
+        headers.update({
+            "Content-Encoding": encoding,
+            "ETag": f"W/{etag}"
+        })
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'isBase64Encoded': True,
+            'body': base64.b64encode(compress(body, encoding)).decode('ascii')
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': body
+    }
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import time
+import boto3
+
+from dynamodb_batch import batch_get_items, batch_write_items
+from http_response import get_request_body, get_header
+from lru_cache import LRUCache, MISSING
+
+MAX_KEY_LENGTH = 255
+# How long a completed write can be replayed. DynamoDB TTL deletes expired
+# records lazily, so reads check expires_at themselves.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 60 * 60)))
+# Warm-container cache of completed records; a TTL of 0 disables it. Records
+# never change before they expire, so caching them is always safe.
+IDEMPOTENCY_CACHE_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_CACHE_TTL_SECONDS', '0'))
+IDEMPOTENCY_CACHE_MAX_ENTRIES = int(os.environ.get('IDEMPOTENCY_CACHE_MAX_ENTRIES', '1000'))
+IDEMPOTENCY_CACHE_MAX_BYTES = int(os.environ.get('IDEMPOTENCY_CACHE_MAX_BYTES', str(4 * 1024 * 1024)))
+CACHE_ENTRY_OVERHEAD_BYTES = 200
+
+dynamodb = boto3.resource('dynamodb')
+idempotency_table_name = os.environ.get('TABLE_NAME_IDEMPOTENCY')
+
+record_cache = LRUCache(IDEMPOTENCY_CACHE_MAX_ENTRIES, IDEMPOTENCY_CACHE_MAX_BYTES)
+
+def is_enabled():
+    return bool(idempotency_table_name)
+
+def fingerprint(payload):
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def request_key(event, scope):
+    """Idempotency key from the Idempotency-Key header, namespaced by scope."""
+    key = get_header(event, 'Idempotency-Key')
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters')
+    return f'{scope}:{key}'
+
+def request_fingerprint(event):
+    """Fingerprint of the JSON body that ignores key order and whitespace."""
+    return fingerprint(json.dumps(json.loads(get_request_body(event)), sort_keys=True))
+
+def message_key(scope, body):
+    """Key of an SQS message: redeliveries and resends of the same body share it."""
+    return f'{scope}:{fingerprint(body)}'
+
+def new_record(key, response, request_fingerprint=None):
+    record = {
+        'id': key,
+        'response': json.dumps(response),
+        'expires_at': int(time.time()) + IDEMPOTENCY_TTL_SECONDS
+    }
+    if request_fingerprint:
+        record['fingerprint'] = request_fingerprint
+    return record
+
+def is_live(record):
+    return record is not None and int(record['expires_at']) > time.time()
+
+def remember(record):
+    if IDEMPOTENCY_CACHE_TTL_SECONDS <= 0:
+        return
+    ttl_seconds = min(IDEMPOTENCY_CACHE_TTL_SECONDS, int(record['expires_at']) - time.time())
+    size = CACHE_ENTRY_OVERHEAD_BYTES + len(record['id']) + len(record['response'])
+    record_cache.set(record['id'], record, ttl_seconds, size)
+
+def cached_record(key):
+    if IDEMPOTENCY_CACHE_TTL_SECONDS <= 0:
+        return MISSING
+    return record_cache.get(key)
+
+def get_record(key):
+    """The completed record of key, or None when the key has not been used."""
+    record = cached_record(key)
+    if record is not MISSING:
+        return record
+
+    record = dynamodb.Table(idempotency_table_name).get_item(
+        Key={'id': key},
+        ConsistentRead=True
+    ).get('Item')
+    if not is_live(record):
+        return None
+    remember(record)
+    return record
+
+def get_records(keys):
+    """{key: record} for the keys that have been used, in one BatchGetItem."""
+    records, pending = {}, []
+    for key in dict.fromkeys(keys):
+        record = cached_record(key)
+        if record is MISSING:
+            pending.append(key)
+        else:
+            records[key] = record
+
+    if pending:
+        items = batch_get_items(dynamodb, {
+            idempotency_table_name: {
+                'Keys': [{'id': key} for key in pending],
+                'ConsistentRead': True
+            }
+        })[idempotency_table_name]
+        for record in items:
+            if is_live(record):
+                remember(record)
+                records[record['id']] = record
+    return records
+
+def put_record_action(record):
+    """
+    TransactWriteItems action that stores record, cancelling the transaction
+    when its key is already in use.
+    """
+    return {
+        'Put': {
+            'TableName': idempotency_table_name,
+            'Item': record,
+            'ConditionExpression': 'attribute_not_exists(id) OR expires_at < :now',
+            'ExpressionAttributeValues': {':now': int(time.time())}
+        }
+    }
+
+def save_records(records):
+    """Stores records with BatchWriteItem. Returns the records that were not written."""
+    failed = batch_write_items(dynamodb, [
+        (idempotency_table_name, {'PutRequest': {'Item': record}}) for record in records
+    ])
+    failed_keys = {write_request['PutRequest']['Item']['id'] for _, write_request in failed}
+    for record in records:
+        if record['id'] not in failed_keys:
+            remember(record)
+    return [record for record in records if record['id'] in failed_keys]
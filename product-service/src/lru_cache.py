@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+class LRUCache:
+    """
+    Least-recently-used cache with per-entry TTLs, bounded both by entry
+    count and by an approximate byte size supplied by the caller.
+    None is a valid value, which is what negative caching stores.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        value, size, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self._discard(key)
+            self.misses += 1
+            return MISSING
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl_seconds, size):
+        if key in self.entries:
+            self._discard(key)
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = (value, size, time.monotonic() + ttl_seconds)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            self._discard(oldest_key)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def _discard(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.bytes
+        }
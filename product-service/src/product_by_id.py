@@ -2,14 +2,148 @@ import json
 import os
 import boto3
 import logging
+import time
+
+import catalog_version
+from dynamodb_batch import batch_get_items
+from http_response import conditional_json_response
+from lru_cache import LRUCache, MISSING
+from product_fields import (
+    parse_fields, needs_stock, product_projection, stock_projection, join_product
+)
+from stock_counters import complete_counts
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Warm-container cache of product and stock items; a TTL of 0 disables it.
+# Stock counts change far more often than product attributes, so they
+# expire separately. Unknown ids are cached too (as None) for the product TTL.
+# Product writers bump the catalog version (catalog_version), and a changed
+# version empties the cache. The version is read at most once per
+# CATALOG_VERSION_CHECK_SECONDS, so a cache hit makes no DynamoDB call and
+# product writes show up within that interval. Stock reservations do not
+# bump it; their changes show up after the stock TTL.
+PRODUCT_CACHE_TTL_SECONDS = int(os.environ.get('PRODUCT_CACHE_TTL_SECONDS', '0'))
+STOCK_CACHE_TTL_SECONDS = int(os.environ.get('STOCK_CACHE_TTL_SECONDS', '0'))
+PRODUCT_CACHE_MAX_ENTRIES = int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', '10000'))
+PRODUCT_CACHE_MAX_BYTES = int(os.environ.get('PRODUCT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Rough per-entry overhead of the key tuple, OrderedDict node and item dict
+CACHE_ENTRY_OVERHEAD_BYTES = 200
+CATALOG_VERSION_CHECK_SECONDS = int(os.environ.get('CATALOG_VERSION_CHECK_SECONDS', '5'))
+
 dynamodb = boto3.resource('dynamodb')
 products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
 stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
 
+product_cache = LRUCache(PRODUCT_CACHE_MAX_ENTRIES, PRODUCT_CACHE_MAX_BYTES)
+# Catalog version the cached items were read at, and when it was last read
+product_cache_version = {'version': None, 'checked_at': None}
+
+def approximate_size(item):
+    return CACHE_ENTRY_OVERHEAD_BYTES + len(json.dumps(item, default=str))
+
+def fetch_products_cached(product_ids, fields=None):
+    """
+    fetch_products through the LRU cache: only the product and stock items
+    that are not cached (or have expired) are read, in one BatchGetItem.
+    Cached product items always hold every attribute so any fieldset can
+    be served from them.
+    """
+    product_ids = list(dict.fromkeys(product_ids))
+    with_stock = needs_stock(fields)
+    now = time.monotonic()
+    checked_at = product_cache_version['checked_at']
+    if catalog_version.is_enabled() and (
+            checked_at is None or now - checked_at >= CATALOG_VERSION_CHECK_SECONDS):
+        # Read before the items: a write that lands in between leaves the
+        # cache stamped with the older version, and the next check empties it
+        version = catalog_version.get_version()
+        if product_cache_version['version'] != version:
+            product_cache.clear()
+        product_cache_version.update(version=version, checked_at=now)
+
+    products, counts = {}, {}
+    missing_products, missing_stocks = [], []
+    for product_id in product_ids:
+        product = product_cache.get(('product', product_id))
+        if product is None:
+            # Known not to exist: no stock lookup either
+            continue
+        if product is MISSING:
+            missing_products.append(product_id)
+        else:
+            products[product_id] = product
+        if with_stock:
+            count = product_cache.get(('stock', product_id))
+            if count is MISSING:
+                missing_stocks.append(product_id)
+            else:
+                counts[product_id] = count
+
+    request_items = {}
+    if missing_products:
+        request_items[products_table.name] = {
+            'Keys': [{'id': product_id} for product_id in missing_products]
+        }
+    if missing_stocks:
+        request_items[stocks_table.name] = {
+            'Keys': [{'product_id': product_id} for product_id in missing_stocks],
+            **stock_projection()
+        }
+
+    if request_items:
+        items = batch_get_items(dynamodb, request_items)
+        found_products = {item['id']: item for item in items.get(products_table.name, [])}
+        found_counts = complete_counts(items.get(stocks_table.name, []))
+        for product_id in missing_products:
+            product = found_products.get(product_id)
+            product_cache.set(('product', product_id), product, PRODUCT_CACHE_TTL_SECONDS,
+                              approximate_size(product))
+            if product is not None:
+                products[product_id] = product
+        for product_id in missing_stocks:
+            count = found_counts.get(product_id, 0)
+            product_cache.set(('stock', product_id), count, STOCK_CACHE_TTL_SECONDS,
+                              CACHE_ENTRY_OVERHEAD_BYTES)
+            counts[product_id] = count
+
+    logger.info('Product cache: %s', product_cache.stats())
+    return {
+        product_id: join_product(product, counts.get(product_id, 0), fields)
+        for product_id, product in products.items()
+    }
+
+def fetch_products(product_ids, fields=None):
+    """
+    Reads products and their stock rows together with BatchGetItem, so a
+    single product costs one round trip instead of two sequential GetItems.
+    Returns {product_id: joined product} for the ids that exist; a missing
+    stock row counts as 0.
+    """
+    if PRODUCT_CACHE_TTL_SECONDS > 0:
+        return fetch_products_cached(product_ids, fields)
+
+    product_ids = list(dict.fromkeys(product_ids))
+    request_items = {
+        products_table.name: {
+            'Keys': [{'id': product_id} for product_id in product_ids],
+            **product_projection(fields)
+        }
+    }
+    if needs_stock(fields):
+        request_items[stocks_table.name] = {
+            'Keys': [{'product_id': product_id} for product_id in product_ids],
+            **stock_projection()
+        }
+
+    items = batch_get_items(dynamodb, request_items)
+    count_by_product_id = complete_counts(items.get(stocks_table.name, []))
+    return {
+        product['id']: join_product(product, count_by_product_id.get(product['id'], 0), fields)
+        for product in items[products_table.name]
+    }
+
 def handler(event, context):
     logger.info('Incoming event: %s', json.dumps(event))
     logger.info('Context: RequestId: %s', context.aws_request_id)
@@ -26,12 +160,24 @@ def handler(event, context):
                 }
             }
         
-        product_response = products_table.get_item(
-            Key={'id': product_id}
-        )
-        product = product_response.get('Item')
+        try:
+            fields = parse_fields(event.get('queryStringParameters') or {})
+        except ValueError as ve:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    "Access-Control-Allow-Origin": "*",
+                    "Content-Type": "application/json"
+                },
+                'body': json.dumps({
+                    'message': 'Invalid query parameters',
+                    'error': str(ve)
+                })
+            }
+
+        joined_product = fetch_products([product_id], fields).get(product_id)
         
-        if not product:
+        if not joined_product:
             return {
                 'statusCode': 404,
                 'headers': {
@@ -43,27 +189,7 @@ def handler(event, context):
                 })
             }
             
-        stock_response = stocks_table.get_item(
-            Key={'product_id': product_id}
-        )
-        stock = stock_response.get('Item', {'count': '0'})
-        
-        joined_product = {
-            'id': product['id'],
-            'title': product['title'],
-            'description': product['description'],
-            'price': float(product['price']),
-            'count': int(stock['count'])
-        }
-            
-        return {
-            'statusCode': 200,
-            'headers': {
-                "Access-Control-Allow-Origin": "*",
-                "Content-Type": "application/json"
-            },
-            'body': json.dumps(joined_product)
-        }
+        return conditional_json_response(event, joined_product)
     except Exception as e:
         return {
             'statusCode': 500,
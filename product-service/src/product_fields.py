@@ -0,0 +1,83 @@
+import time
+import zlib
+
+PRODUCT_FIELDS = ('id', 'title', 'description', 'price', 'count')
+
+# Products are spread over `catalog#0` .. `catalog#<n-1>` index partitions by
+# a stable hash of their id, so no single index partition takes every catalog
+# write. Sorted listings query every shard and merge the results. Changing the
+# shard count needs a run of scripts/backfill_index_attributes.py.
+CATALOG_PARTITION_SHARDS = 8
+PRICE_INDEX = 'price-index'
+TITLE_INDEX = 'title-index'
+# Products by `updated_at` (epoch milliseconds), for readers that only want
+# what changed since their last read
+UPDATED_INDEX = 'updated-index'
+
+def parse_fields(query_params):
+    """
+    Parses the `fields=` query parameter into a tuple of whitelisted fields
+    in canonical order, or None when all fields are requested.
+    """
+    fields = query_params.get('fields')
+    if fields is None:
+        return None
+
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    if not requested:
+        raise ValueError('fields must not be empty')
+    unknown = requested.difference(PRODUCT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in PRODUCT_FIELDS if field in requested)
+
+def needs_stock(fields):
+    return fields is None or 'count' in fields
+
+def projection(attributes):
+    # Every attribute goes through a placeholder: `count` is a DynamoDB reserved word
+    names = {f'#p{i}': attribute for i, attribute in enumerate(attributes)}
+    return {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+
+def product_projection(fields):
+    if fields is None:
+        return {}
+    attributes = ['id'] + [field for field in fields if field not in ('id', 'count')]
+    return projection(attributes)
+
+def stock_projection():
+    # shards: how many stock items the count is spread over (see stock_counters)
+    return projection(['product_id', 'count', 'shards'])
+
+def join_product(product, count, fields=None):
+    joined = {}
+    for field in fields or PRODUCT_FIELDS:
+        if field == 'count':
+            joined['count'] = count
+        elif field == 'price':
+            joined['price'] = float(product['price'])
+        else:
+            joined[field] = product[field]
+    return joined
+
+def select_fields(joined_product, fields):
+    if fields is None:
+        return joined_product
+    return {field: joined_product[field] for field in fields}
+
+def catalog_partition(product_id):
+    shard = zlib.crc32(product_id.encode('utf-8')) % CATALOG_PARTITION_SHARDS
+    return f'catalog#{shard}'
+
+def catalog_partitions():
+    return [f'catalog#{shard}' for shard in range(CATALOG_PARTITION_SHARDS)]
+
+def index_attributes(product_id, title):
+    return {
+        'catalog_partition': catalog_partition(product_id),
+        'title_lower': title.strip().lower(),
+        'updated_at': int(time.time() * 1000)
+    }
@@ -0,0 +1,101 @@
+from decimal import Decimal, InvalidOperation
+from boto3.dynamodb.conditions import Key, Attr
+
+from product_fields import PRICE_INDEX, TITLE_INDEX
+
+SORT_KEYS = {
+    'price': (PRICE_INDEX, 'price'),
+    'title': (TITLE_INDEX, 'title_lower')
+}
+
+def parse_price(query_params, name):
+    value = query_params.get(name)
+    if value is None:
+        return None
+    try:
+        price = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'{name} must be a number')
+    if not price.is_finite() or price < 0:
+        raise ValueError(f'{name} must be a non-negative number')
+    return price
+
+def price_condition(condition, min_price, max_price):
+    if min_price is not None and max_price is not None:
+        return condition('price').between(min_price, max_price)
+    if min_price is not None:
+        return condition('price').gte(min_price)
+    if max_price is not None:
+        return condition('price').lte(max_price)
+    return None
+
+def parse_query(query_params):
+    """
+    Translates minPrice/maxPrice/titlePrefix/sort/order into a query on one
+    of the catalog indexes, or None when no option is given.
+    The sort index takes the matching option as its key condition; the
+    other option, if any, becomes a filter on the matched items.
+    shard_query_kwargs() turns the result into Query arguments per shard.
+    """
+    min_price = parse_price(query_params, 'minPrice')
+    max_price = parse_price(query_params, 'maxPrice')
+    title_prefix = query_params.get('titlePrefix')
+    sort = query_params.get('sort')
+    order = query_params.get('order')
+
+    if all(option is None for option in (min_price, max_price, title_prefix, sort, order)):
+        return None
+
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValueError('minPrice must not be greater than maxPrice')
+    if title_prefix is not None:
+        title_prefix = title_prefix.strip().lower()
+        if not title_prefix:
+            raise ValueError('titlePrefix must not be empty')
+    if sort is None:
+        sort = 'title' if title_prefix else 'price'
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+    if order not in (None, 'asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+
+    index_name, sort_key = SORT_KEYS[sort]
+    sort_condition = None
+    filter_expression = None
+
+    if sort == 'price':
+        sort_condition = price_condition(Key, min_price, max_price)
+        if title_prefix:
+            filter_expression = Attr('title_lower').begins_with(title_prefix)
+    else:
+        if title_prefix:
+            sort_condition = Key('title_lower').begins_with(title_prefix)
+        filter_expression = price_condition(Attr, min_price, max_price)
+
+    return {
+        'index_name': index_name,
+        'sort_key': sort_key,
+        'sort_condition': sort_condition,
+        'filter_expression': filter_expression,
+        'forward': order != 'desc'
+    }
+
+def shard_query_kwargs(query, partition):
+    key_condition = Key('catalog_partition').eq(partition)
+    if query['sort_condition'] is not None:
+        key_condition = key_condition & query['sort_condition']
+
+    query_kwargs = {
+        'IndexName': query['index_name'],
+        'KeyConditionExpression': key_condition,
+        'ScanIndexForward': query['forward']
+    }
+    if query['filter_expression'] is not None:
+        query_kwargs['FilterExpression'] = query['filter_expression']
+    return query_kwargs
+
+def cursor_key_attributes(query):
+    """Attributes of the LastEvaluatedKey a scan or index query returns."""
+    if query is None:
+        return {'id'}
+    return {'id', 'catalog_partition', query['sort_key']}
@@ -0,0 +1,191 @@
+import json
+import os
+import boto3
+import logging
+import time
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import catalog_version
+from dynamodb_batch import batch_get_items
+from http_response import conditional_json_response
+from product_fields import (
+    projection, stock_projection, join_product, catalog_partitions, UPDATED_INDEX
+)
+from search_index import SearchIndex
+from stock_counters import complete_counts
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_QUERY_LENGTH = 200
+# Upper bound on index staleness for writes that do not bump the catalog version
+SEARCH_INDEX_TTL_SECONDS = int(os.environ.get('SEARCH_INDEX_TTL_SECONDS', '300'))
+# Incremental refreshes re-read this much before the newest change already
+# seen: writer clocks differ and the updated-index is eventually consistent.
+CHANGE_LOOKBACK_MS = 60 * 1000
+
+SEARCHABLE_ATTRIBUTES = ['id', 'title', 'description', 'price', 'updated_at']
+
+dynamodb = boto3.resource('dynamodb')
+products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
+stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
+
+# Built lazily on the first search and kept for the life of the warm container
+search_index = SearchIndex()
+index_state = {}
+
+def scan_searchable_products():
+    scan_kwargs = projection(SEARCHABLE_ATTRIBUTES)
+    response = products_table.scan(**scan_kwargs)
+    products = response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = products_table.scan(ExclusiveStartKey=response['LastEvaluatedKey'], **scan_kwargs)
+        products.extend(response['Items'])
+    return products
+
+def query_changed_products(since):
+    """Products written at or after `since` (epoch ms), from every catalog shard."""
+    products = []
+    for partition in catalog_partitions():
+        query_kwargs = {
+            'IndexName': UPDATED_INDEX,
+            'KeyConditionExpression': Key('catalog_partition').eq(partition) & Key('updated_at').gte(since),
+            **projection(SEARCHABLE_ATTRIBUTES)
+        }
+        response = products_table.query(**query_kwargs)
+        products.extend(response['Items'])
+        while 'LastEvaluatedKey' in response:
+            response = products_table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **query_kwargs)
+            products.extend(response['Items'])
+    return products
+
+def latest_change(products, since=0):
+    return max((int(product['updated_at']) for product in products if 'updated_at' in product),
+               default=since)
+
+def refresh_index():
+    """
+    Builds the index from a full scan on a cold start; after that only reads
+    products changed since the last refresh, through the updated-index,
+    falling back to the full scan while that index does not exist.
+    Deleted products are only dropped by the next cold start; the only
+    deletes are create_products_batch removing half-written products.
+    """
+    version = catalog_version.get_version() if catalog_version.is_enabled() else None
+    now = time.monotonic()
+    if (index_state and index_state['version'] == version
+            and now - index_state['loaded_at'] < SEARCH_INDEX_TTL_SECONDS):
+        return
+
+    started = time.perf_counter()
+    products = None
+    if index_state:
+        try:
+            products = query_changed_products(index_state['changed_at'] - CHANGE_LOOKBACK_MS)
+        except ClientError as e:
+            # The updated-index is rolled out in its own deployment
+            # (catalogIndexes); until it exists every refresh is a full scan
+            if e.response['Error']['Code'] not in ('ValidationException', 'ResourceNotFoundException'):
+                raise
+            logger.warning('Cannot query %s, rebuilding from a full scan: %s', UPDATED_INDEX, e)
+
+    if products is None:
+        source = 'full scan'
+        products = scan_searchable_products()
+        added, updated, removed = search_index.sync(products)
+        index_state.update(
+            products={product['id']: product for product in products},
+            # Items written before updated_at existed carry none
+            changed_at=latest_change(products)
+        )
+    else:
+        source = 'changes only'
+        added, updated = search_index.update(products)
+        removed = 0
+        index_state['products'].update((product['id'], product) for product in products)
+        index_state['changed_at'] = max(index_state['changed_at'], latest_change(products))
+    index_state.update(version=version, loaded_at=now)
+    logger.info('Search index refreshed (version %s, %s): %d read, %d added, %d updated, '
+                '%d removed, %d documents, %d tokens in %.1f ms',
+                version, source, len(products),
+                added, updated, removed, len(search_index),
+                len(search_index.postings), (time.perf_counter() - started) * 1000)
+
+def parse_search(query_params):
+    query = (query_params.get('q') or '').strip()
+    if not query:
+        raise ValueError('Missing search query')
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValueError(f'q must be at most {MAX_QUERY_LENGTH} characters')
+
+    limit = query_params.get('limit')
+    if limit is None:
+        return query, DEFAULT_SEARCH_LIMIT
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_SEARCH_LIMIT}')
+    return query, limit
+
+def handler(event, context):
+    logger.info('Incoming event: %s', json.dumps(event))
+    logger.info('Context: RequestId: %s', context.aws_request_id)
+
+    try:
+        try:
+            query, limit = parse_search(event.get('queryStringParameters') or {})
+        except ValueError as ve:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    "Access-Control-Allow-Origin": "*",
+                    "Content-Type": "application/json"
+                },
+                'body': json.dumps({
+                    'message': 'Invalid query parameters',
+                    'error': str(ve)
+                })
+            }
+
+        refresh_index()
+        matches = search_index.search(query, limit)
+
+        stocks = []
+        if matches:
+            stocks = batch_get_items(dynamodb, {
+                stocks_table.name: {
+                    'Keys': [{'product_id': product_id} for product_id, _ in matches],
+                    **stock_projection()
+                }
+            })[stocks_table.name]
+        count_by_product_id = complete_counts(stocks)
+
+        products = index_state['products']
+        items = [
+            {
+                **join_product(products[product_id], count_by_product_id.get(product_id, 0)),
+                'score': round(score, 4)
+            }
+            for product_id, score in matches
+        ]
+        return conditional_json_response(event, {'items': items})
+    except Exception as e:
+        error_message = str(e)
+        logger.error('Unexpected error occurred: %s', error_message)
+        return {
+            'statusCode': 500,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'message': 'Internal server error',
+                'error': error_message
+            })
+        }
@@ -1,49 +1,387 @@
+import base64
+import heapq
 import json
 import os
 import boto3
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import catalog_version
+from dynamodb_batch import batch_get_items
+from http_response import conditional_json_response
+from product_by_id import fetch_products
+from product_fields import (
+    parse_fields, needs_stock, projection, product_projection, stock_projection,
+    join_product, select_fields, catalog_partitions
+)
+from product_query import parse_query, shard_query_kwargs, cursor_key_attributes
+from stock_counters import sum_stock_items, complete_counts
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+DEFAULT_PAGE_LIMIT = int(os.environ.get('PRODUCTS_PAGE_LIMIT', '20'))
+MAX_PAGE_LIMIT = 100
+MAX_BATCH_IDS = 500
+
+# Full catalog listing: 1 keeps the serial scans, N > 1 scans both tables
+# concurrently with N parallel-scan segments per table.
+SCAN_TOTAL_SEGMENTS = int(os.environ.get('SCAN_TOTAL_SEGMENTS', '1'))
+SCAN_MAX_WORKERS = int(os.environ.get('SCAN_MAX_WORKERS', '8'))
+
+# Warm-container cache of the full catalog listing. 0 disables it. The TTL
+# bounds staleness for writes that do not bump the catalog version.
+CATALOG_CACHE_TTL_SECONDS = int(os.environ.get('CATALOG_CACHE_TTL_SECONDS', '0'))
+# Stock counts of the cached listing expire on their own, much sooner:
+# reservations change them without bumping the catalog version. 0 reads
+# them with every listing.
+CATALOG_STOCK_CACHE_TTL_SECONDS = int(os.environ.get('CATALOG_STOCK_CACHE_TTL_SECONDS', '0'))
+
 dynamodb = boto3.resource('dynamodb')
 products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
 stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
 
+catalog_cache = {}
+
+def encode_cursor(last_evaluated_key):
+    if not last_evaluated_key:
+        return None
+    # Index keys carry the Decimal price; it travels as a string
+    raw = json.dumps(last_evaluated_key, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_key(key, key_attributes):
+    if (not isinstance(key, dict) or set(key) != key_attributes
+            or not all(isinstance(value, str) for value in key.values())):
+        raise ValueError('Invalid cursor')
+    if 'price' in key:
+        try:
+            key['price'] = Decimal(key['price'])
+        except ArithmeticError:
+            raise ValueError('Invalid cursor')
+    return key
+
+def decode_cursor(cursor, key_attributes):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if 'catalog_partition' not in key_attributes:
+        return decode_key(cursor, key_attributes)
+
+    # Index cursors hold one position per catalog shard still to be read:
+    # {} for a shard not read yet, its last key otherwise
+    if not isinstance(cursor, dict) or not cursor or not set(cursor) <= set(catalog_partitions()):
+        raise ValueError('Invalid cursor')
+    positions = {}
+    for partition, key in cursor.items():
+        if key == {}:
+            positions[partition] = None
+            continue
+        key = decode_key(key, key_attributes)
+        if key['catalog_partition'] != partition:
+            raise ValueError('Invalid cursor')
+        positions[partition] = key
+    return positions
+
+def parse_pagination(query_params, key_attributes=frozenset({'id'}), required=False):
+    limit = query_params.get('limit')
+    cursor = query_params.get('cursor')
+    if limit is None and cursor is None and not required:
+        return None
+
+    if limit is None:
+        limit = DEFAULT_PAGE_LIMIT
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if not 1 <= limit <= MAX_PAGE_LIMIT:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_LIMIT}')
+
+    exclusive_start_key = decode_cursor(cursor, key_attributes) if cursor else None
+    return limit, exclusive_start_key
+
+def parse_ids(query_params):
+    ids = query_params.get('ids')
+    if ids is None:
+        return None
+
+    product_ids = list(dict.fromkeys(
+        product_id.strip() for product_id in ids.split(',') if product_id.strip()
+    ))
+    if not product_ids:
+        raise ValueError('ids must not be empty')
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise ValueError(f'At most {MAX_BATCH_IDS} ids can be requested at once')
+    listing_options = ('limit', 'cursor', 'minPrice', 'maxPrice', 'titlePrefix', 'sort', 'order')
+    if any(option in query_params for option in listing_options):
+        raise ValueError('ids cannot be combined with pagination, filtering or sorting')
+    return product_ids
+
+def get_products_by_ids(product_ids, fields=None):
+    found = fetch_products(product_ids, fields)
+    return {
+        'items': [found[product_id] for product_id in product_ids if product_id in found],
+        'missing': [product_id for product_id in product_ids if product_id not in found]
+    }
+
+def scan_all(table, **scan_kwargs):
+    response = table.scan(**scan_kwargs)
+    items = response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'], **scan_kwargs)
+        items.extend(response['Items'])
+    return items
+
+def scan_segment(table_name, segment, total_segments, **scan_options):
+    scan_kwargs = {
+        **scan_options,
+        'TableName': table_name,
+        'Segment': segment,
+        'TotalSegments': total_segments
+    }
+    items = []
+    while True:
+        response = dynamodb.meta.client.scan(**scan_kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return items
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def parallel_scan(scans, total_segments, max_workers):
+    """scans: {table_name: scan options}. Returns {table_name: [items]}."""
+    workers = max(1, min(max_workers, len(scans) * total_segments))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            table_name: [
+                executor.submit(scan_segment, table_name, segment, total_segments, **scan_options)
+                for segment in range(total_segments)
+            ]
+            for table_name, scan_options in scans.items()
+        }
+        return {
+            table_name: [item for future in table_futures for item in future.result()]
+            for table_name, table_futures in futures.items()
+        }
+
+def join_products(products, count_by_product_id, fields=None):
+    return [
+        join_product(product, count_by_product_id.get(product['id'], 0), fields)
+        for product in products
+    ]
+
+def scan_catalog(scans):
+    """scans: {table_name: scan options}. Returns {table_name: [items]}."""
+    if SCAN_TOTAL_SEGMENTS > 1:
+        return parallel_scan(scans, SCAN_TOTAL_SEGMENTS, SCAN_MAX_WORKERS)
+    return {
+        table.name: scan_all(table, **scans[table.name])
+        for table in (products_table, stocks_table)
+        if table.name in scans
+    }
+
+def list_all_products(fields=None):
+    scans = {products_table.name: product_projection(fields)}
+    if needs_stock(fields):
+        scans[stocks_table.name] = stock_projection()
+
+    items = scan_catalog(scans)
+    # The scan returns every stock shard item; sum_stock_items adds them up
+    counts = sum_stock_items(items.get(stocks_table.name, []))
+    return join_products(items[products_table.name], counts, fields)
+
+def list_all_products_cached(fields=None):
+    if CATALOG_CACHE_TTL_SECONDS <= 0 or not catalog_version.is_enabled():
+        return list_all_products(fields)
+
+    # The cache always holds every attribute; sparse fieldsets are cut from
+    # it in memory, which is cheaper than any DynamoDB read.
+    products, counts = get_cached_catalog(needs_stock(fields))
+    return join_products(products, counts, fields)
+
+def get_cached_catalog(with_stock=True):
+    """
+    (product items, {product_id: count}) of the whole catalog. Product items
+    are kept until the catalog version changes or CATALOG_CACHE_TTL_SECONDS
+    pass; counts only for CATALOG_STOCK_CACHE_TTL_SECONDS, because stock
+    reservations change them without bumping the version.
+    """
+    # Read the version before scanning: a write that lands during the scan
+    # leaves the cache stamped with the older version and forces a reload.
+    version = catalog_version.get_version()
+    now = time.monotonic()
+    scans = {}
+    if (catalog_cache.get('version') == version
+            and now - catalog_cache['loaded_at'] < CATALOG_CACHE_TTL_SECONDS):
+        logger.info('Catalog cache hit (version %s)', version)
+    else:
+        logger.info('Catalog cache miss (version %s)', version)
+        scans[products_table.name] = {}
+    if with_stock and not ('counts' in catalog_cache
+                           and now - catalog_cache['counts_loaded_at'] < CATALOG_STOCK_CACHE_TTL_SECONDS):
+        scans[stocks_table.name] = stock_projection()
+
+    if scans:
+        # Both tables are scanned together when both have expired
+        items = scan_catalog(scans)
+        if products_table.name in items:
+            catalog_cache.update(version=version, loaded_at=now, products=items[products_table.name])
+        if stocks_table.name in items:
+            catalog_cache.update(counts=sum_stock_items(items[stocks_table.name]), counts_loaded_at=now)
+    return catalog_cache['products'], (catalog_cache['counts'] if with_stock else {})
+
+def query_shard(query, partition, start_key, read_kwargs):
+    query_kwargs = {
+        **read_kwargs,
+        **shard_query_kwargs(query, partition),
+        'TableName': products_table.name
+    }
+    if start_key:
+        query_kwargs['ExclusiveStartKey'] = start_key
+    return dynamodb.meta.client.query(**query_kwargs)
+
+def query_catalog_page(limit, positions, fields, query):
+    """
+    Reads one page of an index query across the catalog shards.
+    positions: {partition: last key read, or None to start} for every shard
+    still to be read. Each shard returns up to `limit` items in index order;
+    they are merged, and the page stops early at the first item past the
+    point where some shard stopped reading, so no item of that shard is
+    skipped. Returns (items, positions for the next page).
+    """
+    sort_key = query['sort_key']
+    read_kwargs = {'Limit': limit}
+    if fields is not None:
+        # The merge and the next cursor need each item's index key
+        read_kwargs.update(projection(list(dict.fromkeys(
+            ['id', 'catalog_partition', sort_key]
+            + [field for field in fields if field not in ('id', 'count')]
+        ))))
+
+    partitions = list(positions)
+    with ThreadPoolExecutor(max_workers=max(1, min(SCAN_MAX_WORKERS, len(partitions)))) as executor:
+        responses = dict(zip(partitions, executor.map(
+            lambda partition: query_shard(query, partition, positions[partition], read_kwargs),
+            partitions
+        )))
+
+    forward = query['forward']
+    # Nothing past the lowest (highest, descending) stopping point is certain to be in order
+    stops = [
+        response['LastEvaluatedKey'][sort_key]
+        for response in responses.values() if 'LastEvaluatedKey' in response
+    ]
+    bound = (min(stops) if forward else max(stops)) if stops else None
+
+    items = []
+    taken = dict.fromkeys(partitions, 0)
+    merged = heapq.merge(
+        *[[(item, partition) for item in response['Items']] for partition, response in responses.items()],
+        key=lambda entry: entry[0][sort_key],
+        reverse=not forward
+    )
+    for item, partition in merged:
+        if len(items) == limit:
+            break
+        if bound is not None and (item[sort_key] > bound if forward else item[sort_key] < bound):
+            break
+        items.append(item)
+        taken[partition] += 1
+
+    next_positions = {}
+    for partition, response in responses.items():
+        shard_items = response['Items']
+        if taken[partition] < len(shard_items):
+            if taken[partition]:
+                last = shard_items[taken[partition] - 1]
+                next_positions[partition] = {
+                    'id': last['id'],
+                    'catalog_partition': partition,
+                    sort_key: last[sort_key]
+                }
+            else:
+                next_positions[partition] = positions[partition]
+        elif 'LastEvaluatedKey' in response:
+            next_positions[partition] = response['LastEvaluatedKey']
+    return items, next_positions
+
+def encode_positions(positions):
+    if not positions:
+        return None
+    return encode_cursor({partition: key or {} for partition, key in positions.items()})
+
+def list_products_page(limit, exclusive_start_key, fields=None, query=None):
+    if query:
+        # With a filter, Limit caps the items read, so a page may hold fewer
+        # items than requested and still carry a nextCursor.
+        positions = exclusive_start_key or dict.fromkeys(catalog_partitions())
+        products, next_positions = query_catalog_page(limit, positions, fields, query)
+        next_cursor = encode_positions(next_positions)
+    else:
+        read_kwargs = {'Limit': limit, **product_projection(fields)}
+        if exclusive_start_key:
+            read_kwargs['ExclusiveStartKey'] = exclusive_start_key
+        products_response = products_table.scan(**read_kwargs)
+        products = products_response['Items']
+        next_cursor = encode_cursor(products_response.get('LastEvaluatedKey'))
+
+    counts = {}
+    if products and needs_stock(fields):
+        stocks = batch_get_items(dynamodb, {
+            stocks_table.name: {
+                'Keys': [{'product_id': product['id']} for product in products],
+                **stock_projection()
+            }
+        })[stocks_table.name]
+        counts = complete_counts(stocks)
+
+    return {
+        'items': join_products(products, counts, fields),
+        'nextCursor': next_cursor
+    }
+
 def handler(event, context):
     logger.info('Incoming event: %s', json.dumps(event))
     logger.info('Context: RequestId: %s', context.aws_request_id)
-    
+
     try:
-        products_response = products_table.scan()
-        products = products_response['Items']
-        
-        stocks_response = stocks_table.scan()
-        stocks = stocks_response['Items']
-        
-        stock_by_product_id = {
-            stock['product_id']: int(stock['count'])
-            for stock in stocks
-        }
-        
-        joined_products = []
-        for product in products:
-            joined_product = {
-                'id': product['id'],
-                'title': product['title'],
-                'description': product['description'],
-                'price': float(product['price']),
-                'count': stock_by_product_id.get(product['id'], 0)
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            product_ids = parse_ids(query_params)
+            query = parse_query(query_params)
+            # Index queries are always paginated
+            pagination = parse_pagination(
+                query_params,
+                cursor_key_attributes(query),
+                required=query is not None
+            )
+            fields = parse_fields(query_params)
+        except ValueError as ve:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    "Access-Control-Allow-Origin": "*",
+                    "Content-Type": "application/json"
+                },
+                'body': json.dumps({
+                    'message': 'Invalid query parameters',
+                    'error': str(ve)
+                })
             }
-            joined_products.append(joined_product)
-        return {
-            'statusCode': 200,
-            'headers': {
-                "Access-Control-Allow-Origin": "*",
-                "Content-Type": "application/json"
-            },
-            'body': json.dumps(joined_products)
-        }
+
+        if product_ids:
+            result = get_products_by_ids(product_ids, fields)
+        elif pagination:
+            result = list_products_page(*pagination, fields=fields, query=query)
+        else:
+            result = list_all_products_cached(fields)
+
+        return conditional_json_response(event, result)
     except Exception as e:
         error_message = str(e)
         logger.error('Unexpected error occurred: %s', error_message)
@@ -57,4 +395,4 @@ def handler(event, context):
                 'message': 'Internal server error',
                 'error': error_message
             })
-        }
\ No newline at end of file
+        }
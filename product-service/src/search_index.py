@@ -0,0 +1,150 @@
+import bisect
+import heapq
+import math
+import re
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# A title hit says more about a product than a description hit
+FIELD_WEIGHTS = {'title': 3.0, 'description': 1.0}
+# Prefix expansions (autocomplete) rank below whole-word matches
+PREFIX_MATCH_FACTOR = 0.5
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def document_digest(product):
+    # Only used within one warm container, so the per-process hash seed is fine
+    return hash((product.get('title'), product.get('description')))
+
+class SearchIndex:
+    """
+    Inverted index over product title and description.
+    postings: token -> {product_id: weighted term frequency}
+    vocabulary: sorted tokens, for prefix lookups with bisect
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []
+        self.documents = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, product, update_vocabulary=True):
+        product_id = product['id']
+        if product_id in self.documents:
+            self.remove(product_id, update_vocabulary)
+
+        weights = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(product.get(field) or ''):
+                weights[token] += weight
+
+        for token, weight in weights.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                if update_vocabulary:
+                    bisect.insort(self.vocabulary, token)
+            postings[product_id] = weight
+
+        self.documents[product_id] = {
+            'digest': document_digest(product),
+            'tokens': tuple(weights)
+        }
+
+    def remove(self, product_id, update_vocabulary=True):
+        document = self.documents.pop(product_id, None)
+        if document is None:
+            return
+        for token in document['tokens']:
+            postings = self.postings[token]
+            del postings[product_id]
+            if not postings:
+                del self.postings[token]
+                if update_vocabulary:
+                    del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def update(self, products):
+        """
+        Adds or replaces the given products, skipping unchanged ones.
+        Returns (added, updated) counts.
+        """
+        added = updated = 0
+        for product in products:
+            document = self.documents.get(product['id'])
+            if document is None:
+                added += 1
+            elif document['digest'] != document_digest(product):
+                updated += 1
+            else:
+                continue
+            self.add(product, update_vocabulary=False)
+
+        # One sort after a bulk change is cheaper than an insort per new token
+        if added or updated:
+            self.vocabulary = sorted(self.postings)
+        return added, updated
+
+    def sync(self, products):
+        """
+        Brings the index in line with a full list of products, touching only
+        documents that were added, changed or removed.
+        Returns (added, updated, removed) counts.
+        """
+        added, updated = self.update(products)
+
+        seen = {product['id'] for product in products}
+        stale = [product_id for product_id in self.documents if product_id not in seen]
+        for product_id in stale:
+            self.remove(product_id, update_vocabulary=False)
+        if stale:
+            self.vocabulary = sorted(self.postings)
+        return added, updated, len(stale)
+
+    def expand(self, term):
+        """Vocabulary tokens starting with term: [(token, match factor)]."""
+        matches = []
+        position = bisect.bisect_left(self.vocabulary, term)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(term):
+            token = self.vocabulary[position]
+            matches.append((token, 1.0 if token == term else PREFIX_MATCH_FACTOR))
+            position += 1
+        return matches
+
+    def search(self, query, limit=20):
+        """
+        Returns [(product_id, score)] best first. Every query term must
+        match a token exactly or as a prefix; scores are tf-idf weighted.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.documents:
+            return []
+
+        total_documents = len(self.documents)
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for token, factor in self.expand(term):
+                postings = self.postings[token]
+                idf = 1.0 + math.log(total_documents / len(postings))
+                for product_id, weight in postings.items():
+                    score = weight * idf * factor
+                    if score > term_scores.get(product_id, 0.0):
+                        term_scores[product_id] = score
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    product_id: score + term_scores[product_id]
+                    for product_id, score in scores.items()
+                    if product_id in term_scores
+                }
+            if not scores:
+                return []
+
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,38 @@
+import logging
+from botocore.exceptions import ClientError
+
+from dynamodb_batch import chunked
+
+logger = logging.getLogger()
+
+PUBLISH_BATCH_MAX_ENTRIES = 10
+
+def publish_batch(sns, topic_arn, entries):
+    """
+    PublishBatch over any number of entries.
+    entries: [{'Id': ..., 'Message': ..., 'Subject': ..., 'MessageAttributes': ...}]
+    with Ids unique across the list. Entries are sent 10 per call; the ones
+    listed in Failed are retried one by one with Publish, unless SNS blamed
+    the entry itself. Returns the Ids of entries that were not published.
+    """
+    unpublished = []
+    for chunk in chunked(entries, PUBLISH_BATCH_MAX_ENTRIES):
+        response = sns.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=chunk)
+        failures = response.get('Failed') or []
+        if not failures:
+            continue
+
+        entries_by_id = {entry['Id']: entry for entry in chunk}
+        logger.warning('Retrying %d failed PublishBatch entries', len(failures))
+        for failure in failures:
+            entry = entries_by_id[failure['Id']]
+            if failure.get('SenderFault'):
+                logger.error('SNS rejected entry %s: %s', failure['Id'], failure.get('Message'))
+                unpublished.append(entry['Id'])
+                continue
+            try:
+                sns.publish(TopicArn=topic_arn, **{k: v for k, v in entry.items() if k != 'Id'})
+            except ClientError as e:
+                logger.error('Failed to publish entry %s: %s', entry['Id'], e)
+                unpublished.append(entry['Id'])
+    return unpublished
@@ -0,0 +1,333 @@
+import os
+import random
+import boto3
+import logging
+from botocore.exceptions import ClientError
+
+from dynamodb_batch import batch_get_items, backoff
+from lru_cache import LRUCache, MISSING
+from product_fields import stock_projection
+
+logger = logging.getLogger()
+
+# A product's stock can be spread over several items of the stocks table so
+# that concurrent reservations of a hot product update different items. The
+# item keyed by the product id is shard 0 and records the number of shards;
+# shard n > 0 is keyed "<product id>#shard-<n>". The product's stock is the
+# sum of its shards. Writers that store an absolute count (imports) spread
+# it over the product's shards with stock_items, so a sharded product stays
+# sharded; shard items beyond the recorded number are ignored.
+SHARD_SEPARATOR = '#shard-'
+# configure_shards rewrites every old and new shard in one transaction, and
+# an import writes the product and every shard in one, which takes at most
+# 100 actions
+MAX_SHARDS = 99
+MAX_RESERVE_ATTEMPTS = 3
+
+# Warm-container cache of the extra shards' sum per sharded product; a TTL
+# of 0 disables it. Shard 0 is always read, so the cache only hides the
+# counts moved to the other shards for up to the TTL.
+STOCK_AGGREGATE_CACHE_TTL_SECONDS = int(os.environ.get('STOCK_AGGREGATE_CACHE_TTL_SECONDS', '0'))
+STOCK_AGGREGATE_CACHE_MAX_ENTRIES = 10000
+CACHE_ENTRY_OVERHEAD_BYTES = 200
+
+# Warm-container cache of each product's shard count for reserve/release,
+# so a hot product's shard 0 is not read on every request; 0 disables it.
+# A stale count only makes a decrement or an ADD miss, and a miss re-reads
+# the count consistently before giving up.
+SHARD_COUNT_CACHE_TTL_SECONDS = int(os.environ.get('SHARD_COUNT_CACHE_TTL_SECONDS', '0'))
+
+dynamodb = boto3.resource('dynamodb')
+stocks_table_name = os.environ['TABLE_NAME_STOCKS']
+
+aggregate_cache = LRUCache(STOCK_AGGREGATE_CACHE_MAX_ENTRIES,
+                           STOCK_AGGREGATE_CACHE_MAX_ENTRIES * CACHE_ENTRY_OVERHEAD_BYTES)
+shard_count_cache = LRUCache(STOCK_AGGREGATE_CACHE_MAX_ENTRIES,
+                             STOCK_AGGREGATE_CACHE_MAX_ENTRIES * CACHE_ENTRY_OVERHEAD_BYTES)
+
+class InsufficientStock(Exception):
+    pass
+
+def shard_key(product_id, shard):
+    return product_id if shard == 0 else f'{product_id}{SHARD_SEPARATOR}{shard}'
+
+def shard_count(stock_item):
+    return int(stock_item.get('shards', 1))
+
+def spread_count(total, shards):
+    """total split as evenly as possible over shards, the remainder on the first ones."""
+    return [total // shards + (1 if shard < total % shards else 0) for shard in range(shards)]
+
+def stock_items(product_id, count, shards=1, **attributes):
+    """
+    Items that store an absolute count spread over the product's shards,
+    shard 0 first. Shard 0 keeps the number of shards and the attributes.
+    """
+    counts = spread_count(count, shards)
+    base_item = {'product_id': product_id, 'count': counts[0], **attributes}
+    if shards > 1:
+        base_item['shards'] = shards
+    return [base_item] + [
+        {'product_id': shard_key(product_id, shard), 'count': counts[shard]}
+        for shard in range(1, shards)
+    ]
+
+def sum_stock_items(items):
+    """{product_id: count} from shard 0 and shard items, e.g. a full table scan."""
+    base_items, shard_items = {}, []
+    for item in items:
+        if SHARD_SEPARATOR in item['product_id']:
+            shard_items.append(item)
+        else:
+            base_items[item['product_id']] = item
+
+    counts = {product_id: int(item['count']) for product_id, item in base_items.items()}
+    for item in shard_items:
+        product_id, shard = item['product_id'].rsplit(SHARD_SEPARATOR, 1)
+        base_item = base_items.get(product_id)
+        if base_item is not None and int(shard) < shard_count(base_item):
+            counts[product_id] += int(item['count'])
+    return counts
+
+def complete_counts(base_items):
+    """
+    {product_id: count} from shard 0 items read by key. The other shards of
+    sharded products are read with one more BatchGetItem, or taken from the
+    aggregate cache.
+    """
+    counts = {item['product_id']: int(item['count']) for item in base_items}
+    pending = []
+    for item in base_items:
+        shards = shard_count(item)
+        if shards == 1:
+            continue
+        cache_key = (item['product_id'], shards)
+        extra = aggregate_cache.get(cache_key) if STOCK_AGGREGATE_CACHE_TTL_SECONDS > 0 else MISSING
+        if extra is MISSING:
+            pending.append(cache_key)
+        else:
+            counts[item['product_id']] += extra
+
+    if pending:
+        shard_items = batch_get_items(dynamodb, {
+            stocks_table_name: {
+                'Keys': [
+                    {'product_id': shard_key(product_id, shard)}
+                    for product_id, shards in pending for shard in range(1, shards)
+                ],
+                **stock_projection()
+            }
+        })[stocks_table_name]
+        extras = {cache_key: 0 for cache_key in pending}
+        shards_by_product = dict(pending)
+        for item in shard_items:
+            product_id = item['product_id'].rsplit(SHARD_SEPARATOR, 1)[0]
+            extras[(product_id, shards_by_product[product_id])] += int(item['count'])
+        for (product_id, shards), extra in extras.items():
+            counts[product_id] += extra
+            if STOCK_AGGREGATE_CACHE_TTL_SECONDS > 0:
+                aggregate_cache.set((product_id, shards), extra, STOCK_AGGREGATE_CACHE_TTL_SECONDS,
+                                    CACHE_ENTRY_OVERHEAD_BYTES)
+    return counts
+
+def read_shards(product_id):
+    """Consistent read of (shard 0 item, [count of every shard])."""
+    table = dynamodb.Table(stocks_table_name)
+    base_item = table.get_item(Key={'product_id': product_id}, ConsistentRead=True).get('Item')
+    if base_item is None:
+        return None, []
+    shards = shard_count(base_item)
+    counts = [int(base_item['count'])] + [0] * (shards - 1)
+    if shards > 1:
+        items = batch_get_items(dynamodb, {
+            stocks_table_name: {
+                'Keys': [{'product_id': shard_key(product_id, shard)} for shard in range(1, shards)],
+                'ConsistentRead': True
+            }
+        })[stocks_table_name]
+        for item in items:
+            counts[int(item['product_id'].rsplit(SHARD_SEPARATOR, 1)[1])] = int(item['count'])
+    return base_item, counts
+
+def get_shard_count(product_id):
+    """Number of shards of the product's stock; KeyError for unknown products."""
+    # Consistent, so a product that was just merged back into fewer shards
+    # is never sent to a deleted shard
+    item = dynamodb.Table(stocks_table_name).get_item(
+        Key={'product_id': product_id},
+        ProjectionExpression='product_id, shards',
+        ConsistentRead=True
+    ).get('Item')
+    if item is None:
+        raise KeyError(product_id)
+    shards = shard_count(item)
+    if SHARD_COUNT_CACHE_TTL_SECONDS > 0:
+        shard_count_cache.set(product_id, shards, SHARD_COUNT_CACHE_TTL_SECONDS, CACHE_ENTRY_OVERHEAD_BYTES)
+    return shards
+
+def shard_counts(product_id):
+    """
+    Shard counts to try in turn: the cached one, then a consistent read if
+    it differs. Unknown products (KeyError) are never cached.
+    """
+    cached = shard_count_cache.get(product_id) if SHARD_COUNT_CACHE_TTL_SECONDS > 0 else MISSING
+    if cached is MISSING:
+        yield get_shard_count(product_id)
+        return
+    yield cached
+    shards = get_shard_count(product_id)
+    if shards != cached:
+        yield shards
+
+def is_condition_failure(error):
+    return error.response['Error']['Code'] in ('ConditionalCheckFailedException', 'TransactionCanceledException')
+
+def configure_shards(product_id, shards):
+    """
+    Spreads the product's current stock evenly over `shards` items (1 merges
+    them back). Every old and new shard is rewritten in one transaction that
+    is conditional on the counts it read, so concurrent reservations are
+    never lost; the transaction is retried when one of them got in between.
+    """
+    if not 1 <= shards <= MAX_SHARDS:
+        raise ValueError(f'shards must be between 1 and {MAX_SHARDS}')
+
+    for attempt in range(MAX_RESERVE_ATTEMPTS):
+        base_item, counts = read_shards(product_id)
+        if base_item is None:
+            raise KeyError(product_id)
+        total = sum(counts)
+        new_counts = spread_count(total, shards)
+
+        actions = [{
+            'Put': {
+                'TableName': stocks_table_name,
+                'Item': {**base_item, 'count': new_counts[0], 'shards': shards},
+                'ConditionExpression': '#count = :count',
+                'ExpressionAttributeNames': {'#count': 'count'},
+                'ExpressionAttributeValues': {':count': counts[0]}
+            }
+        }]
+        for shard in range(1, max(shards, len(counts))):
+            key = shard_key(product_id, shard)
+            if shard < len(counts):
+                condition = {
+                    'ConditionExpression': 'attribute_not_exists(#count) OR #count = :count',
+                    'ExpressionAttributeNames': {'#count': 'count'},
+                    'ExpressionAttributeValues': {':count': counts[shard]}
+                }
+            else:
+                condition = {}
+            if shard < shards:
+                actions.append({'Put': {
+                    'TableName': stocks_table_name,
+                    'Item': {'product_id': key, 'count': new_counts[shard]},
+                    **condition
+                }})
+            else:
+                actions.append({'Delete': {
+                    'TableName': stocks_table_name,
+                    'Key': {'product_id': key},
+                    **condition
+                }})
+
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=actions)
+            logger.info('Stock of %s spread over %d shards: %s', product_id, shards, new_counts)
+            return new_counts
+        except ClientError as e:
+            if not is_condition_failure(e):
+                raise
+            backoff(attempt)
+    raise RuntimeError(f'Stock of {product_id} kept changing while configuring shards')
+
+def take_from_shard(product_id, shard, quantity):
+    """Atomic conditional decrement of one shard. False when it holds too little."""
+    try:
+        dynamodb.meta.client.update_item(
+            TableName=stocks_table_name,
+            Key={'product_id': shard_key(product_id, shard)},
+            UpdateExpression='ADD #count :decrement',
+            ConditionExpression='#count >= :quantity',
+            ExpressionAttributeNames={'#count': 'count'},
+            ExpressionAttributeValues={':decrement': -quantity, ':quantity': quantity}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+    return True
+
+def take_across_shards(product_id, quantity):
+    """Takes quantity from several shards in one transaction, when no single shard holds it."""
+    for attempt in range(MAX_RESERVE_ATTEMPTS):
+        _, counts = read_shards(product_id)
+        if sum(counts) < quantity:
+            return False
+
+        actions, remaining = [], quantity
+        for shard, count in sorted(enumerate(counts), key=lambda shard_count: -shard_count[1]):
+            take = min(count, remaining)
+            if take <= 0:
+                break
+            actions.append({'Update': {
+                'TableName': stocks_table_name,
+                'Key': {'product_id': shard_key(product_id, shard)},
+                'UpdateExpression': 'ADD #count :decrement',
+                'ConditionExpression': '#count >= :take',
+                'ExpressionAttributeNames': {'#count': 'count'},
+                'ExpressionAttributeValues': {':decrement': -take, ':take': take}
+            }})
+            remaining -= take
+
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=actions)
+            return True
+        except ClientError as e:
+            if not is_condition_failure(e):
+                raise
+            backoff(attempt)
+    return False
+
+def reserve(product_id, quantity):
+    """
+    Takes quantity units of the product's stock, or raises InsufficientStock
+    (KeyError for unknown products).
+    Every decrement is conditional on the shard holding enough, so stock can
+    never go negative. A random shard is tried first to spread concurrent
+    reservations; the others follow before falling back to a transaction
+    over several shards.
+    """
+    if quantity <= 0:
+        raise ValueError('quantity must be positive')
+
+    for shards in shard_counts(product_id):
+        for shard in random.sample(range(shards), shards):
+            if take_from_shard(product_id, shard, quantity):
+                return
+        if shards > 1 and take_across_shards(product_id, quantity):
+            return
+    raise InsufficientStock(f'Not enough stock of {product_id} to reserve {quantity}')
+
+def release(product_id, quantity):
+    """Returns quantity units to the product's stock with an atomic ADD on a random shard."""
+    if quantity <= 0:
+        raise ValueError('quantity must be positive')
+
+    for shards in shard_counts(product_id):
+        try:
+            dynamodb.meta.client.update_item(
+                TableName=stocks_table_name,
+                Key={'product_id': shard_key(product_id, random.randrange(shards))},
+                UpdateExpression='ADD #count :quantity',
+                # ADD would otherwise create stock for an unknown product,
+                # or a shard that a stale count still lists
+                ConditionExpression='attribute_exists(#count)',
+                ExpressionAttributeNames={'#count': 'count'},
+                ExpressionAttributeValues={':quantity': quantity}
+            )
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    raise KeyError(product_id)
@@ -0,0 +1,108 @@
+import json
+import logging
+
+from http_response import get_request_body
+from stock_counters import reserve, release, InsufficientStock
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ACTIONS = {
+    'reserve': reserve,
+    'release': release
+}
+
+def parse_quantity(event):
+    body = json.loads(get_request_body(event) or '{}')
+    quantity = body.get('quantity', 1) if isinstance(body, dict) else None
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+        raise ValueError("'quantity' must be a positive whole number")
+    return quantity
+
+def handler(event, context):
+    """
+    POST /products/{productId}/reserve and /release with body {"quantity": n}.
+    Catalog versions are not bumped: that single item would become the hot
+    key sharding avoids. Cached counts expire on their own, shorter TTL
+    (STOCK_CACHE_TTL_SECONDS, CATALOG_STOCK_CACHE_TTL_SECONDS).
+    """
+    logger.info('Incoming event: %s', json.dumps(event))
+    logger.info('Context: RequestId: %s', context.aws_request_id)
+
+    try:
+        product_id = (event.get('pathParameters') or {}).get('productId')
+        action = (event.get('resource') or event.get('path') or '').rstrip('/').rsplit('/', 1)[-1]
+        if not product_id or action not in ACTIONS:
+            return {
+                "statusCode": 400,
+                "body": json.dumps({"error": "Missing product ID or unknown stock action"}),
+                "headers": {
+                    "Access-Control-Allow-Origin": "*",
+                    "Content-Type": "application/json"
+                }
+            }
+
+        quantity = parse_quantity(event)
+        ACTIONS[action](product_id, quantity)
+        logger.info('%s %d of %s', action.capitalize(), quantity, product_id)
+
+        return {
+            'statusCode': 200,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'productId': product_id,
+                'action': action,
+                'quantity': quantity
+            })
+        }
+    except InsufficientStock as e:
+        return {
+            'statusCode': 409,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'message': 'Insufficient stock',
+                'error': str(e)
+            })
+        }
+    except KeyError:
+        return {
+            'statusCode': 404,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'message': 'Product not found'
+            })
+        }
+    except ValueError as ve:
+        return {
+            'statusCode': 400,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'message': 'Invalid request body',
+                'error': str(ve)
+            })
+        }
+    except Exception as e:
+        logger.error(e)
+        return {
+            'statusCode': 500,
+            'headers': {
+                "Access-Control-Allow-Origin": "*",
+                "Content-Type": "application/json"
+            },
+            'body': json.dumps({
+                'message': 'Internal server error',
+                'error': str(e)
+            })
+        }
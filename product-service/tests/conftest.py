@@ -1,5 +1,6 @@
 import os
 import json
+import zlib
 import pytest
 from moto import mock_dynamodb, mock_sns, mock_sqs
 import boto3
@@ -26,6 +27,8 @@ def pytest_configure(config):
     os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
     os.environ['TABLE_NAME_PRODUCTS'] = 'products'
     os.environ['TABLE_NAME_STOCKS'] = 'stocks'
+    os.environ['TABLE_NAME_CATALOG_META'] = 'catalog_meta'
+    os.environ['TABLE_NAME_IDEMPOTENCY'] = 'idempotency'
     os.environ['SNS_TOPIC_ARN'] = f"arn:aws:sns:{os.environ['AWS_DEFAULT_REGION']}:123456789012:test-topic"
 
 @pytest.fixture
@@ -37,7 +40,29 @@ def dynamodb_client():
         client.create_table(
             TableName=os.environ['TABLE_NAME_PRODUCTS'],
             KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
-            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'catalog_partition', 'AttributeType': 'S'},
+                {'AttributeName': 'price', 'AttributeType': 'N'},
+                {'AttributeName': 'title_lower', 'AttributeType': 'S'},
+                {'AttributeName': 'updated_at', 'AttributeType': 'N'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': index_name,
+                    'KeySchema': [
+                        {'AttributeName': 'catalog_partition', 'KeyType': 'HASH'},
+                        {'AttributeName': sort_key, 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'},
+                    'ProvisionedThroughput': {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+                }
+                for index_name, sort_key in (
+                    ('price-index', 'price'),
+                    ('title-index', 'title_lower'),
+                    ('updated-index', 'updated_at')
+                )
+            ],
             ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
         )
         
@@ -47,6 +72,20 @@ def dynamodb_client():
             AttributeDefinitions=[{'AttributeName': 'product_id', 'AttributeType': 'S'}],
             ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
         )
+
+        client.create_table(
+            TableName=os.environ['TABLE_NAME_CATALOG_META'],
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+        )
+
+        client.create_table(
+            TableName=os.environ['TABLE_NAME_IDEMPOTENCY'],
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+        )
         
         yield client
 
@@ -70,6 +109,7 @@ def test_event():
     """Provide test event data"""
     return {
         'Records': [{
+            'messageId': 'message-1',
             'body': json.dumps({
                 'id': '1',
                 'title': 'Test Product',
@@ -85,8 +125,40 @@ def invalid_test_event():
     """Provide invalid test event data"""
     return {
         'Records': [{
+            'messageId': 'message-invalid',
             'body': json.dumps({
                 'id': '1'
             })
         }]
-    }
\ No newline at end of file
+    }
+
+def segment_of(item, total_segments):
+    hash_key = item['id'] if 'id' in item else item['product_id']
+    return zlib.crc32(hash_key.encode('utf-8')) % total_segments
+
+@pytest.fixture
+def segmented_scan(dynamodb_client):
+    """
+    moto ignores Segment/TotalSegments and returns the whole table for every
+    segment. Patch the shared DynamoDB client so each segment only sees its
+    own share of the items, and record every scan call.
+    """
+    from src import products_list
+
+    client = products_list.dynamodb.meta.client
+    original_scan = client.scan
+    calls = []
+
+    def scan(**kwargs):
+        calls.append(kwargs)
+        response = original_scan(**kwargs)
+        if 'TotalSegments' in kwargs:
+            response['Items'] = [
+                item for item in response['Items']
+                if segment_of(item, kwargs['TotalSegments']) == kwargs['Segment']
+            ]
+        return response
+
+    client.scan = scan
+    yield calls
+    del client.scan
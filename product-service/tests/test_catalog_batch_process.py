@@ -44,5 +44,381 @@ def test_sns_notification(dynamodb_client, sns_client, sqs_client, test_event, l
     assert 'Test Product' in message_body['Message']
 
 def test_invalid_product_data(dynamodb_client, sns_client, invalid_test_event, lambda_context):
-    with pytest.raises(KeyError):
-        handler(invalid_test_event, lambda_context)
\ No newline at end of file
+    response = handler(invalid_test_event, lambda_context)
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'message-invalid'}]}
+
+def test_catalog_version_bumped(dynamodb_client, sns_client, test_event, lambda_context):
+    dynamodb = boto3.resource('dynamodb', region_name=os.environ['AWS_DEFAULT_REGION'])
+    meta_table = dynamodb.Table(os.environ['TABLE_NAME_CATALOG_META'])
+    second_body = {**json.loads(test_event['Records'][0]['body']), 'id': '2'}
+
+    handler(test_event, lambda_context)
+    handler({'Records': [{'body': json.dumps(second_body)}]}, lambda_context)
+
+    assert meta_table.get_item(Key={'id': 'catalog'})['Item']['version'] == 2
+
+def test_redelivered_messages_are_skipped(dynamodb_client, sns_client, sqs_client, test_event, lambda_context):
+    queue_url = sqs_client.create_queue(QueueName='test-queue')['QueueUrl']
+    queue_arn = sqs_client.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=['QueueArn']
+    )['Attributes']['QueueArn']
+    sns_client.subscribe(TopicArn=os.environ['SNS_TOPIC_ARN'], Protocol='sqs', Endpoint=queue_arn)
+    meta_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_CATALOG_META'])
+    duplicated_event = {'Records': test_event['Records'] * 2}
+
+    handler(duplicated_event, lambda_context)
+    handler(test_event, lambda_context)
+
+    messages = sqs_client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)
+    assert len(messages['Messages']) == 1
+    assert meta_table.get_item(Key={'id': 'catalog'})['Item']['version'] == 1
+
+def test_invalid_record_does_not_fail_the_batch(dynamodb_client, sns_client, test_event,
+                                               invalid_test_event, lambda_context):
+    dynamodb = boto3.resource('dynamodb')
+    event = {'Records': invalid_test_event['Records'] + test_event['Records']}
+
+    response = handler(event, lambda_context)
+
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'message-invalid'}]
+    assert dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS']).get_item(Key={'id': '1'})['Item']['title'] == 'Test Product'
+    records = dynamodb.Table(os.environ['TABLE_NAME_IDEMPOTENCY']).scan()['Items']
+    assert [json.loads(record['response']) for record in records] == [{'id': '1'}]
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {'envelope': 'catalog-products/1'},
+        {'envelope': 'catalog-products/1', 'encoding': 'gzip'},
+        {'envelope': 'catalog-products/1', 'encoding': 'gzip', 'data': ['not', 'a', 'string']},
+        {'envelope': 'catalog-products/1', 'encoding': 'gzip', 'data': 'bm90IGd6aXA='},
+        {'envelope': 'catalog-products/1', 'encoding': 'gzip', 'data': 'H4sIAAAAAAAA'},
+        {'envelope': 'catalog-products/1', 'attempt': [], 'products': []},
+    ],
+    ids=["no_products", "no_data", "data_not_a_string", "data_not_gzip", "truncated_gzip", "bad_attempt"]
+)
+def test_malformed_envelope_does_not_fail_the_batch(dynamodb_client, sns_client, test_event,
+                                                    lambda_context, body):
+    dynamodb = boto3.resource('dynamodb')
+    record = {'messageId': 'message-malformed', 'body': json.dumps(body)}
+    event = {'Records': [record] + test_event['Records']}
+
+    response = handler(event, lambda_context)
+
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'message-malformed'}]
+    assert dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS']).get_item(Key={'id': '1'})['Item']['title'] == 'Test Product'
+
+def product_record(product_id, **overrides):
+    return {'messageId': f'message-{product_id}', 'body': json.dumps({
+        'id': product_id,
+        'title': f'Product {product_id}',
+        'description': 'Description',
+        'price': '10.50',
+        'count': '3',
+        **overrides
+    })}
+
+def test_records_are_written_in_batches(dynamodb_client, sns_client, lambda_context):
+    from src import catalog_batch_process
+    calls = []
+    record_call = lambda params, model, **kwargs: calls.append(model.name)
+    events = catalog_batch_process.dynamodb.meta.client.meta.events
+    events.register('provide-client-params.dynamodb', record_call)
+
+    handler({'Records': [product_record(str(i)) for i in range(30)]}, lambda_context)
+    events.unregister('provide-client-params.dynamodb', record_call)
+
+    # 60 product and stock items in chunks of 25
+    assert calls.count('BatchWriteItem') == 3
+    assert 'PutItem' not in calls
+    stocks = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_STOCKS']).scan()['Items']
+    assert len(stocks) == 30
+
+def test_duplicate_ids_in_a_batch_last_write_wins(dynamodb_client, sns_client, lambda_context):
+    handler({'Records': [
+        product_record('1', title='First', count='1'),
+        product_record('2'),
+        product_record('1', title='Second', count='2')
+    ]}, lambda_context)
+
+    dynamodb = boto3.resource('dynamodb')
+    assert dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS']).get_item(Key={'id': '1'})['Item']['title'] == 'Second'
+    assert dynamodb.Table(os.environ['TABLE_NAME_STOCKS']).get_item(Key={'product_id': '1'})['Item']['count'] == 2
+
+def test_unprocessed_writes_are_reported(dynamodb_client, sns_client, lambda_context, monkeypatch):
+    from src import catalog_batch_process
+    monkeypatch.setattr(catalog_batch_process, 'write_products', lambda products: {'2'})
+    event = {'Records': [product_record('1'), product_record('2'),
+                         {**product_record('2', title='Retried'), 'messageId': 'message-2-update'}]}
+
+    response = handler(event, lambda_context)
+
+    # Both messages of the collapsed product are redelivered
+    assert response['batchItemFailures'] == [{'itemIdentifier': 'message-2'}, {'itemIdentifier': 'message-2-update'}]
+
+def test_notifications_are_published_in_batches(dynamodb_client, sns_client, sqs_client, lambda_context):
+    from src import catalog_batch_process
+    queue_url = sqs_client.create_queue(QueueName='expensive')['QueueUrl']
+    queue_arn = sqs_client.get_queue_attributes(
+        QueueUrl=queue_url,
+        AttributeNames=['QueueArn']
+    )['Attributes']['QueueArn']
+    sns_client.subscribe(
+        TopicArn=os.environ['SNS_TOPIC_ARN'],
+        Protocol='sqs',
+        Endpoint=queue_arn,
+        Attributes={'FilterPolicy': json.dumps({'price': [{'numeric': ['>=', 50]}]})}
+    )
+    calls = []
+    record_call = lambda params, model, **kwargs: calls.append(model.name)
+    events = catalog_batch_process.sns.meta.events
+    events.register('provide-client-params.sns', record_call)
+
+    records = [product_record(str(i), price=str(10 + i * 2)) for i in range(23)]
+    response = handler({'Records': records}, lambda_context)
+    events.unregister('provide-client-params.sns', record_call)
+
+    assert response == {'batchItemFailures': []}
+    assert calls == ['PublishBatch'] * 3
+    # Prices 50 and up still reach the filtered subscription
+    received = 0
+    while True:
+        messages = sqs_client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10).get('Messages', [])
+        if not messages:
+            break
+        received += len(messages)
+        sqs_client.delete_message_batch(QueueUrl=queue_url, Entries=[
+            {'Id': str(i), 'ReceiptHandle': message['ReceiptHandle']} for i, message in enumerate(messages)
+        ])
+    assert received == len([i for i in range(23) if 10 + i * 2 >= 50])
+
+def test_batch_calls_run_concurrently(dynamodb_client, sns_client, lambda_context, monkeypatch):
+    import threading
+    import time
+    from src import catalog_batch_process
+    monkeypatch.setattr(catalog_batch_process, 'CATALOG_BATCH_MAX_WORKERS', 4)
+    threads = {'BatchWriteItem': set(), 'PublishBatch': set()}
+    def record_call(params, model, **kwargs):
+        if model.name in threads:
+            threads[model.name].add(threading.get_ident())
+            time.sleep(0.05)
+    clients = [catalog_batch_process.dynamodb.meta.client, catalog_batch_process.sns]
+    for client in clients:
+        client.meta.events.register('provide-client-params', record_call)
+
+    records = [product_record(str(i)) for i in range(100)]
+    response = handler({'Records': records}, lambda_context)
+    for client in clients:
+        client.meta.events.unregister('provide-client-params', record_call)
+
+    assert response == {'batchItemFailures': []}
+    assert len(threads['BatchWriteItem']) > 1
+    assert len(threads['PublishBatch']) > 1
+    products = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS']).scan()['Items']
+    assert len(products) == 100
+
+def test_failed_chunk_only_reports_its_own_records(dynamodb_client, sns_client, lambda_context, monkeypatch):
+    from src import catalog_batch_process
+    monkeypatch.setattr(catalog_batch_process, 'CATALOG_BATCH_MAX_WORKERS', 4)
+    original_write_product_chunk = catalog_batch_process.write_product_chunk
+    def write_product_chunk(products):
+        if any(product['id'] == '13' for product in products):
+            return {product['id'] for product in products}
+        return original_write_product_chunk(products)
+    monkeypatch.setattr(catalog_batch_process, 'write_product_chunk', write_product_chunk)
+
+    response = handler({'Records': [product_record(str(i)) for i in range(30)]}, lambda_context)
+
+    # Products 12-23 share a BatchWriteItem call
+    assert response['batchItemFailures'] == [{'itemIdentifier': f'message-{i}'} for i in range(12, 24)]
+
+def stored_product(product_id):
+    return boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS']).get_item(Key={'id': product_id})['Item']
+
+def test_stale_versions_are_skipped_without_writes(dynamodb_client, sns_client, lambda_context):
+    from src import catalog_batch_process
+    handler({'Records': [product_record('1', title='Current', version=2)]}, lambda_context)
+    calls = []
+    record_call = lambda params, model, **kwargs: calls.append(model.name)
+    events = catalog_batch_process.sns.meta.events
+    events.register('provide-client-params', record_call)
+    catalog_batch_process.dynamodb.meta.client.meta.events.register('provide-client-params.dynamodb', record_call)
+
+    response = handler({'Records': [
+        product_record('1', title='Older', version=1),
+        {**product_record('1', title='Same version', version=2), 'messageId': 'message-1-again'}
+    ]}, lambda_context)
+    events.unregister('provide-client-params', record_call)
+    catalog_batch_process.dynamodb.meta.client.meta.events.unregister('provide-client-params.dynamodb', record_call)
+
+    assert response == {'batchItemFailures': []}
+    assert stored_product('1')['title'] == 'Current'
+    # One BatchGetItem of the stored versions, no writes and no notifications
+    assert calls == ['BatchGetItem']
+
+def test_newer_version_replaces_stored_product(dynamodb_client, sns_client, lambda_context):
+    handler({'Records': [product_record('1', title='Old', version=1)]}, lambda_context)
+
+    handler({'Records': [product_record('1', title='New', count='9', version=5)]}, lambda_context)
+
+    assert stored_product('1')['title'] == 'New'
+    assert stored_product('1')['version'] == 5
+    stock = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_STOCKS']).get_item(Key={'product_id': '1'})['Item']
+    assert stock['count'] == 9
+
+def test_highest_version_in_a_batch_wins(dynamodb_client, sns_client, lambda_context):
+    handler({'Records': [
+        product_record('1', title='Second', version=2),
+        {**product_record('1', title='Third', version=3), 'messageId': 'message-1-v3'},
+        {**product_record('1', title='First', version=1), 'messageId': 'message-1-v1'}
+    ]}, lambda_context)
+
+    assert stored_product('1')['title'] == 'Third'
+
+def test_concurrent_newer_write_is_not_overwritten(dynamodb_client, sns_client, lambda_context, monkeypatch):
+    from src import catalog_batch_process
+    handler({'Records': [product_record('1', title='Newest', version=7)]}, lambda_context)
+    # The version check ran before another writer stored version 7
+    monkeypatch.setattr(catalog_batch_process, 'stored_state', lambda product_ids: {})
+
+    response = handler({'Records': [product_record('1', title='Older', version=6)]}, lambda_context)
+
+    assert response == {'batchItemFailures': []}
+    assert stored_product('1')['title'] == 'Newest'
+
+def stored_stock(product_id):
+    return boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_STOCKS']).get_item(Key={'product_id': product_id})['Item']
+
+def test_failed_stock_write_is_redone_on_redelivery(dynamodb_client, sns_client, lambda_context, monkeypatch):
+    from botocore.exceptions import ClientError
+    from src import catalog_batch_process
+    handler({'Records': [product_record('1', title='Old', count='5', version=1)]}, lambda_context)
+    client = catalog_batch_process.dynamodb.meta.client
+    transact_write_items = client.transact_write_items
+    def fail_stock_put_once(**kwargs):
+        monkeypatch.setattr(client, 'transact_write_items', transact_write_items)
+        raise ClientError({
+            'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+            'CancellationReasons': [{'Code': 'None'}, {'Code': 'ProvisionedThroughputExceeded'}]
+        }, 'TransactWriteItems')
+    monkeypatch.setattr(client, 'transact_write_items', fail_stock_put_once)
+    record = product_record('1', title='New', count='9', version=2)
+
+    assert handler({'Records': [record]}, lambda_context) == {'batchItemFailures': [{'itemIdentifier': 'message-1'}]}
+    # Neither item was written, so the redelivered message is not stale
+    assert stored_product('1')['version'] == 1
+    assert handler({'Records': [record]}, lambda_context) == {'batchItemFailures': []}
+
+    assert stored_product('1')['title'] == 'New'
+    assert stored_stock('1')['count'] == 9
+    assert stored_stock('1')['version'] == 2
+
+def test_stock_left_behind_by_a_half_written_product_is_repaired(dynamodb_client, sns_client, lambda_context):
+    handler({'Records': [product_record('1', title='Old', count='5', version=1)]}, lambda_context)
+    # The product of version 2 was written but its stock write failed
+    products_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS'])
+    products_table.put_item(Item={**stored_product('1'), 'title': 'New', 'version': 2})
+
+    response = handler({'Records': [product_record('1', title='New', count='9', version=2)]}, lambda_context)
+
+    assert response == {'batchItemFailures': []}
+    assert stored_stock('1')['count'] == 9
+    assert stored_stock('1')['version'] == 2
+    # Another message of the same version no longer touches the stock
+    boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_STOCKS']).update_item(
+        Key={'product_id': '1'}, UpdateExpression='ADD #count :one',
+        ExpressionAttributeNames={'#count': 'count'}, ExpressionAttributeValues={':one': -1}
+    )
+    handler({'Records': [product_record('1', title='New', count='7', version=2)]}, lambda_context)
+    assert stored_stock('1')['count'] == 8
+
+def packed_record(message_id, products, compress=False, attempt=0):
+    from catalog_envelope import encode_envelope
+    return {'messageId': message_id, 'body': encode_envelope(
+        [json.dumps(product) for product in products], compress=compress, attempt=attempt
+    )}
+
+def packed_product(product_id, **overrides):
+    return {
+        'id': product_id,
+        'title': f'Product {product_id}',
+        'description': 'Description',
+        'price': '10.50',
+        'count': '3',
+        'version': 1,
+        **overrides
+    }
+
+def test_packed_messages_are_unpacked(dynamodb_client, sns_client, sqs_client, lambda_context, monkeypatch):
+    from catalog_envelope import decode_message
+    from src import catalog_batch_process
+    dlq_url = sqs_client.create_queue(QueueName='catalog-dlq')['QueueUrl']
+    monkeypatch.setattr(catalog_batch_process, 'catalog_dlq_url', dlq_url)
+    event = {'Records': [
+        packed_record('packed-1', [packed_product('1'), packed_product('2'), {'id': '3'}]),
+        packed_record('packed-2', [packed_product('4'), packed_product('5')], compress=True),
+        product_record('6')
+    ]}
+
+    response = handler(event, lambda_context)
+
+    # The invalid row is parked without failing its message
+    assert response == {'batchItemFailures': []}
+    stocks = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_STOCKS']).scan()['Items']
+    assert sorted(stock['product_id'] for stock in stocks) == ['1', '2', '4', '5', '6']
+    messages = sqs_client.receive_message(QueueUrl=dlq_url, MaxNumberOfMessages=10)['Messages']
+    assert len(messages) == 1
+    assert decode_message(messages[0]['Body'])[0] == [{'id': '3'}]
+    assert json.loads(messages[0]['Body'])['errors'] == [
+        ['Missing required fields: title, description, price, count']
+    ]
+
+def test_invalid_rows_fail_the_message_without_a_dead_letter_queue(dynamodb_client, sns_client, lambda_context):
+    response = handler({'Records': [
+        packed_record('packed', [packed_product('1'), {'id': '2', 'title': 'No price'}])
+    ]}, lambda_context)
+
+    # Redelivery takes the whole message to the dead-letter queue
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'packed'}]}
+
+def test_unknown_envelope_fails_its_message(dynamodb_client, sns_client, lambda_context):
+    event = {'Records': [
+        {'messageId': 'future', 'body': json.dumps({'envelope': 'catalog-products/2', 'products': []})},
+        product_record('1')
+    ]}
+
+    response = handler(event, lambda_context)
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'future'}]}
+
+def test_failed_rows_of_packed_message_are_requeued(dynamodb_client, sns_client, sqs_client,
+                                                    lambda_context, monkeypatch):
+    from catalog_envelope import decode_message
+    from src import catalog_batch_process
+    queue_url = sqs_client.create_queue(QueueName='catalog')['QueueUrl']
+    monkeypatch.setattr(catalog_batch_process, 'catalog_queue_url', queue_url)
+    written = []
+    def write_versioned_products(products):
+        written.extend(product['id'] for product in products)
+        return {product['id']: 'failed' if product['id'] == '2' else 'written' for product in products}
+    monkeypatch.setattr(catalog_batch_process, 'write_versioned_products', write_versioned_products)
+
+    response = handler({'Records': [
+        packed_record('packed', [packed_product('1'), packed_product('2'), packed_product('3')], compress=True)
+    ]}, lambda_context)
+
+    # The message succeeds; only the failed row travels on in a new envelope
+    assert response == {'batchItemFailures': []}
+    messages = sqs_client.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)['Messages']
+    assert len(messages) == 1
+    products, envelope = decode_message(messages[0]['Body'])
+    assert [product['id'] for product in products] == ['2']
+    assert envelope == {'attempt': 1, 'compressed': True}
+
+    # Once the attempts are used up the whole message is redelivered
+    response = handler({'Records': [
+        packed_record('last-attempt', [packed_product('2')], attempt=catalog_batch_process.MAX_PACKED_ATTEMPTS - 1)
+    ]}, lambda_context)
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'last-attempt'}]}
@@ -0,0 +1,107 @@
+import json
+import os
+import boto3
+import pytest
+
+import idempotency
+from src.create_product import handler
+
+PRODUCT = {
+    'title': 'Test Product',
+    'description': 'Test Description',
+    'price': 100,
+    'count': 5
+}
+
+def create(lambda_context, body, key=None):
+    event = {'body': json.dumps(body)}
+    if key:
+        event['headers'] = {'idempotency-key': key}
+    return handler(event, lambda_context)
+
+def stored_product_ids():
+    table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS'])
+    return [item['id'] for item in table.scan()['Items']]
+
+def test_create_product(dynamodb_client, lambda_context):
+    response = create(lambda_context, PRODUCT)
+
+    assert response['statusCode'] == 201
+    assert stored_product_ids() == [json.loads(response['body'])['id']]
+
+def test_retry_with_idempotency_key_replays_response(dynamodb_client, lambda_context):
+    first = create(lambda_context, PRODUCT, key='order-1')
+    # Same product, different key order and whitespace
+    retry = handler({
+        'headers': {'Idempotency-Key': 'order-1'},
+        'body': json.dumps(dict(reversed(list(PRODUCT.items()))), indent=2)
+    }, lambda_context)
+
+    assert retry['statusCode'] == 201
+    assert retry['headers']['Idempotent-Replayed'] == 'true'
+    assert json.loads(retry['body']) == json.loads(first['body'])
+    assert len(stored_product_ids()) == 1
+
+def test_requests_without_key_are_not_deduplicated(dynamodb_client, lambda_context):
+    create(lambda_context, PRODUCT)
+    create(lambda_context, PRODUCT)
+
+    assert len(stored_product_ids()) == 2
+
+def test_key_reused_with_different_body_is_rejected(dynamodb_client, lambda_context):
+    create(lambda_context, PRODUCT, key='order-1')
+
+    response = create(lambda_context, {**PRODUCT, 'price': 200}, key='order-1')
+
+    assert response['statusCode'] == 422
+    assert len(stored_product_ids()) == 1
+
+def test_concurrent_retry_replays_the_winning_response(dynamodb_client, lambda_context, monkeypatch):
+    first = create(lambda_context, PRODUCT, key='order-1')
+    # The retry misses the record on its first lookup, as if both requests
+    # arrived together, and loses the transaction
+    lookups = []
+    original_get_record = idempotency.get_record
+    def get_record(key):
+        lookups.append(key)
+        return None if len(lookups) == 1 else original_get_record(key)
+    monkeypatch.setattr(idempotency, 'get_record', get_record)
+
+    retry = create(lambda_context, PRODUCT, key='order-1')
+
+    assert len(lookups) == 2
+    assert json.loads(retry['body']) == json.loads(first['body'])
+    assert len(stored_product_ids()) == 1
+
+def test_front_cache_skips_table_lookup(dynamodb_client, lambda_context, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_CACHE_TTL_SECONDS', 60)
+    monkeypatch.setattr(idempotency, 'record_cache',
+                        idempotency.LRUCache(10, 1024 * 1024))
+    first = create(lambda_context, PRODUCT, key='order-1')
+    table_reads = []
+    record_read = lambda params, **kwargs: table_reads.append(params)
+    events = idempotency.dynamodb.meta.client.meta.events
+    events.register('provide-client-params.dynamodb.GetItem', record_read)
+
+    retry = create(lambda_context, PRODUCT, key='order-1')
+    idempotency.record_cache.entries.clear()
+    create(lambda_context, PRODUCT, key='order-1')
+    events.unregister('provide-client-params.dynamodb.GetItem', record_read)
+
+    assert json.loads(retry['body']) == json.loads(first['body'])
+    # Only the lookup after the cache was cleared reached the table
+    assert len(table_reads) == 1
+
+@pytest.mark.parametrize("key", ["", "x" * 256], ids=["blank", "too_long"])
+def test_invalid_idempotency_key(dynamodb_client, lambda_context, key):
+    response = handler({'headers': {'Idempotency-Key': key}, 'body': json.dumps(PRODUCT)}, lambda_context)
+
+    assert response['statusCode'] == 400
+
+def test_create_product_with_fractional_price(dynamodb_client, lambda_context):
+    response = create(lambda_context, {**PRODUCT, 'price': 349.99, 'count': '15'})
+
+    assert response['statusCode'] == 201
+    assert json.loads(response['body'])['price'] == 349.99
+    table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS'])
+    assert str(table.scan()['Items'][0]['price']) == '349.99'
@@ -0,0 +1,105 @@
+import json
+import pytest
+import boto3
+import os
+
+from src import create_products_batch
+from src.create_products_batch import handler
+from src.product_fields import catalog_partition
+
+def product(i, **overrides):
+    return {
+        'title': f'Product {i}',
+        'description': f'Description {i}',
+        'price': 10 + i,
+        'count': i,
+        **overrides
+    }
+
+def create(lambda_context, products, **options):
+    response = handler({'body': json.dumps({'products': products, **options})}, lambda_context)
+    return response['statusCode'], json.loads(response['body'])
+
+def stored_products():
+    dynamodb = boto3.resource('dynamodb')
+    products = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS']).scan()['Items']
+    stocks = dynamodb.Table(os.environ['TABLE_NAME_STOCKS']).scan()['Items']
+    return {item['id']: item for item in products}, {item['product_id']: item for item in stocks}
+
+def test_batch_creates_all_products(dynamodb_client, lambda_context):
+    status_code, body = create(lambda_context, [product(i) for i in range(60)])
+
+    assert status_code == 201
+    assert body['created'] == 60
+    products, stocks = stored_products()
+    for i, result in enumerate(body['results']):
+        assert result['index'] == i
+        assert result['status'] == 'created'
+        product_id = result['product']['id']
+        assert products[product_id]['title'] == f'Product {i}'
+        assert products[product_id]['catalog_partition'] == catalog_partition(product_id)
+        assert stocks[product_id]['count'] == i
+
+def test_batch_reports_invalid_items_and_creates_the_rest(dynamodb_client, lambda_context):
+    status_code, body = create(lambda_context, [
+        product(0),
+        product(1, price=-5),
+        'not a product',
+        product(3, title=7),
+    ])
+
+    assert status_code == 207
+    assert [result['status'] for result in body['results']] == ['created', 'invalid', 'invalid', 'invalid']
+    assert body['results'][1]['errors'] == ['Price must be positive']
+    assert len(stored_products()[0]) == 1
+
+def test_atomic_batch_uses_transactions(dynamodb_client, lambda_context, monkeypatch):
+    # moto caps TransactWriteItems at 25 actions: 12 products per transaction
+    monkeypatch.setattr(create_products_batch, 'TRANSACT_MAX_ACTIONS', 25)
+
+    status_code, body = create(lambda_context, [product(i) for i in range(30)], atomic=True)
+
+    assert status_code == 201
+    products, stocks = stored_products()
+    assert len(products) == len(stocks) == 30
+    meta_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_CATALOG_META'])
+    assert meta_table.get_item(Key={'id': 'catalog'})['Item']['version'] == 3
+
+def test_half_written_products_are_removed(dynamodb_client, lambda_context, monkeypatch):
+    batch_write_items = create_products_batch.batch_write_items
+    calls = []
+    def drop_writes(dynamodb, writes):
+        calls.append(len(writes))
+        if len(calls) > 1:
+            return batch_write_items(dynamodb, writes)
+        # The stock of the first product and the product of the second are left unprocessed
+        dropped = [writes[1], writes[2]]
+        batch_write_items(dynamodb, [writes[0]] + writes[3:])
+        return dropped
+    monkeypatch.setattr(create_products_batch, 'batch_write_items', drop_writes)
+
+    status_code, body = create(lambda_context, [product(i) for i in range(13)])
+
+    assert status_code == 207
+    # Every product and its stock share a call; the last call deletes the halves
+    assert calls == [24, 2, 2]
+    failed = [result for result in body['results'] if result['status'] == 'failed']
+    assert [result['index'] for result in failed] == [0, 1]
+    products, stocks = stored_products()
+    assert len(products) == len(stocks) == 11
+    assert not {result['id'] for result in failed} & (set(products) | set(stocks))
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {'products': []},
+        {'products': {'title': 'x'}},
+        [{'title': 'x'}],
+        {'products': [product(i) for i in range(1001)]},
+    ],
+    ids=["empty_list", "not_a_list", "bare_list", "too_many"]
+)
+def test_batch_rejects_malformed_body(dynamodb_client, lambda_context, body):
+    response = handler({'body': json.dumps(body)}, lambda_context)
+
+    assert response['statusCode'] == 400
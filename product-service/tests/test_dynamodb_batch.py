@@ -0,0 +1,77 @@
+import pytest
+
+from src import dynamodb_batch
+from src.dynamodb_batch import batch_get_items, batch_write_items
+
+class FlakyDynamoDB:
+    """Returns the first key of every request as unprocessed once."""
+
+    def __init__(self):
+        self.requests = []
+        self.throttled = set()
+
+    def batch_get_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        responses, unprocessed = {}, {}
+        for table_name, request in RequestItems.items():
+            for key in request['Keys']:
+                marker = (table_name, tuple(key.items()))
+                if marker not in self.throttled:
+                    self.throttled.add(marker)
+                    unprocessed.setdefault(table_name, {**request, 'Keys': []})['Keys'].append(key)
+                else:
+                    responses.setdefault(table_name, []).append(dict(key))
+        return {'Responses': responses, 'UnprocessedKeys': unprocessed}
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(dynamodb_batch, 'backoff', lambda attempt: None)
+
+def test_batch_get_items_retries_unprocessed_keys_and_chunks():
+    dynamodb = FlakyDynamoDB()
+
+    results = batch_get_items(dynamodb, {
+        'products': {'Keys': [{'id': str(i)} for i in range(120)], 'ProjectionExpression': 'id'},
+        'stocks': {'Keys': [{'product_id': str(i)} for i in range(30)]}
+    })
+
+    assert sorted(item['id'] for item in results['products']) == sorted(str(i) for i in range(120))
+    assert len(results['stocks']) == 30
+    assert all(sum(len(r['Keys']) for r in request.values()) <= 100 for request in dynamodb.requests)
+    assert all(request['products']['ProjectionExpression'] == 'id'
+               for request in dynamodb.requests if 'products' in request)
+
+def test_batch_get_items_gives_up_after_max_retries():
+    class AlwaysThrottled:
+        def batch_get_item(self, RequestItems):
+            return {'Responses': {}, 'UnprocessedKeys': RequestItems}
+
+    with pytest.raises(RuntimeError):
+        batch_get_items(AlwaysThrottled(), {'products': {'Keys': [{'id': '1'}]}})
+
+def test_batch_write_items_retries_unprocessed_items_and_chunks():
+    class FlakyWrites:
+        def __init__(self):
+            self.requests = []
+
+        def batch_write_item(self, RequestItems):
+            self.requests.append(RequestItems)
+            # Every first attempt leaves the last write of the chunk unprocessed
+            if len(self.requests) % 2:
+                table_name = next(reversed(RequestItems))
+                return {'UnprocessedItems': {table_name: RequestItems[table_name][-1:]}}
+            return {'UnprocessedItems': {}}
+
+    dynamodb = FlakyWrites()
+    writes = [('products', {'PutRequest': {'Item': {'id': str(i)}}}) for i in range(40)]
+
+    assert batch_write_items(dynamodb, writes) == []
+    assert [sum(len(r) for r in request.values()) for request in dynamodb.requests] == [25, 1, 15, 1]
+
+def test_batch_write_items_returns_writes_left_after_max_retries():
+    class AlwaysThrottled:
+        def batch_write_item(self, RequestItems):
+            return {'UnprocessedItems': RequestItems}
+
+    write = ('products', {'PutRequest': {'Item': {'id': '1'}}})
+    assert batch_write_items(AlwaysThrottled(), [write]) == [write]
@@ -0,0 +1,56 @@
+import base64
+import gzip
+import json
+import pytest
+
+from src.http_response import conditional_json_response, accepted_encodings
+
+LARGE_PAYLOAD = [{'id': str(i), 'description': 'Test Description ' * 10} for i in range(50)]
+
+def test_large_body_is_gzipped_when_accepted():
+    response = conditional_json_response({'headers': {'Accept-Encoding': 'gzip, deflate'}}, LARGE_PAYLOAD)
+
+    assert response['statusCode'] == 200
+    assert response['isBase64Encoded'] is True
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert response['headers']['Vary'] == 'Accept-Encoding'
+    assert response['headers']['ETag'].startswith('W/"')
+    body = gzip.decompress(base64.b64decode(response['body']))
+    assert json.loads(body) == LARGE_PAYLOAD
+
+def test_brotli_preferred_when_available():
+    brotli = pytest.importorskip('brotli')
+
+    response = conditional_json_response({'headers': {'accept-encoding': 'gzip, br'}}, LARGE_PAYLOAD)
+
+    assert response['headers']['Content-Encoding'] == 'br'
+    body = brotli.decompress(base64.b64decode(response['body']))
+    assert json.loads(body) == LARGE_PAYLOAD
+
+@pytest.mark.parametrize(
+    "event,payload",
+    [
+        ({'headers': {'Accept-Encoding': 'gzip'}}, {'id': '1'}),
+        ({'headers': {}}, LARGE_PAYLOAD),
+        ({'headers': {'Accept-Encoding': 'gzip;q=0'}}, LARGE_PAYLOAD),
+    ],
+    ids=["small_body", "no_accept_encoding", "gzip_refused"]
+)
+def test_body_sent_uncompressed(event, payload):
+    response = conditional_json_response(event, payload)
+
+    assert response['statusCode'] == 200
+    assert 'isBase64Encoded' not in response
+    assert 'Content-Encoding' not in response['headers']
+    assert json.loads(response['body']) == payload
+
+def test_compressed_etag_revalidates():
+    event = {'headers': {'Accept-Encoding': 'gzip'}}
+    etag = conditional_json_response(event, LARGE_PAYLOAD)['headers']['ETag']
+
+    response = conditional_json_response({'headers': {**event['headers'], 'If-None-Match': etag}}, LARGE_PAYLOAD)
+
+    assert response['statusCode'] == 304
+
+def test_accepted_encodings_parses_quality_values():
+    assert accepted_encodings('gzip;q=0.8, br;q=0, identity') == {'gzip', 'identity'}
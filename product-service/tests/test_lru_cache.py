@@ -0,0 +1,39 @@
+from src import lru_cache
+from src.lru_cache import LRUCache, MISSING
+
+def test_evicts_least_recently_used_by_entry_count():
+    cache = LRUCache(max_entries=2, max_bytes=1000)
+    cache.set('a', 1, 60, 10)
+    cache.set('b', 2, 60, 10)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3, 60, 10)
+
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+
+def test_evicts_until_under_byte_budget():
+    cache = LRUCache(max_entries=100, max_bytes=100)
+    for key in 'abcd':
+        cache.set(key, key, 60, 30)
+
+    assert len(cache) == 3
+    assert cache.bytes == 90
+    assert cache.get('a') is MISSING
+
+    cache.set('huge', 'x', 60, 101)
+    assert cache.get('huge') is MISSING
+    assert len(cache) == 3
+
+def test_negative_entries_and_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(lru_cache.time, 'monotonic', lambda: now[0])
+    cache = LRUCache(max_entries=10, max_bytes=1000)
+    cache.set('unknown', None, 5, 10)
+
+    assert cache.get('unknown') is None
+    now[0] += 5
+    assert cache.get('unknown') is MISSING
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 0, 'bytes': 0}
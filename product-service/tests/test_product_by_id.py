@@ -61,4 +61,172 @@ def test_invalid_request(dynamodb_client, lambda_context):
     
     assert response['statusCode'] == 500
     body = json.loads(response['body'])
-    assert 'message' in body
\ No newline at end of file
+    assert 'message' in body
+
+def test_conditional_get_returns_304_until_product_changes(dynamodb_client, lambda_context):
+    dynamodb = boto3.resource('dynamodb')
+    products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
+    stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
+    products_table.put_item(Item={
+        'id': '1',
+        'title': 'Test Product',
+        'description': 'Test Description',
+        'price': 100
+    })
+    stocks_table.put_item(Item={'product_id': '1', 'count': 5})
+    event = {'pathParameters': {'productId': '1'}}
+
+    first = handler(event, lambda_context)
+    assert first['statusCode'] == 200
+    etag = first['headers']['ETag']
+    assert 'max-age' in first['headers']['Cache-Control']
+    assert first['headers']['Access-Control-Allow-Origin'] == '*'
+
+    second = handler({**event, 'headers': {'if-none-match': etag}}, lambda_context)
+    assert second['statusCode'] == 304
+    assert second['body'] == ''
+    assert second['headers']['ETag'] == etag
+
+    stocks_table.put_item(Item={'product_id': '1', 'count': 4})
+    third = handler({**event, 'headers': {'If-None-Match': etag}}, lambda_context)
+    assert third['statusCode'] == 200
+    assert third['headers']['ETag'] != etag
+    assert json.loads(third['body'])['count'] == 4
+
+def test_sparse_fieldset(dynamodb_client, lambda_context):
+    dynamodb = boto3.resource('dynamodb')
+    dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS']).put_item(Item={
+        'id': '1',
+        'title': 'Test Product',
+        'description': 'Test Description',
+        'price': 100
+    })
+    dynamodb.Table(os.environ['TABLE_NAME_STOCKS']).put_item(Item={'product_id': '1', 'count': 5})
+
+    response = handler({
+        'pathParameters': {'productId': '1'},
+        'queryStringParameters': {'fields': 'title,count'}
+    }, lambda_context)
+
+    assert response['statusCode'] == 200
+    assert json.loads(response['body']) == {'title': 'Test Product', 'count': 5}
+
+    invalid = handler({
+        'pathParameters': {'productId': '1'},
+        'queryStringParameters': {'fields': 'weight'}
+    }, lambda_context)
+    assert invalid['statusCode'] == 400
+
+def test_single_round_trip_and_default_stock(dynamodb_client, lambda_context):
+    from src import product_by_id
+    boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS']).put_item(Item={
+        'id': '1',
+        'title': 'Test Product',
+        'description': 'Test Description',
+        'price': 100
+    })
+
+    operations = []
+    def record(model, **kwargs):
+        operations.append(model.name)
+    events = product_by_id.dynamodb.meta.client.meta.events
+    events.register('before-call.dynamodb', record)
+    try:
+        response = handler({'pathParameters': {'productId': '1'}}, lambda_context)
+    finally:
+        events.unregister('before-call.dynamodb', record)
+
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['count'] == 0
+    assert operations == ['BatchGetItem']
+
+@pytest.fixture
+def cached_requests(monkeypatch):
+    """Enables the product cache and records the DynamoDB requests made."""
+    from src import product_by_id
+    monkeypatch.setattr(product_by_id, 'PRODUCT_CACHE_TTL_SECONDS', 300)
+    monkeypatch.setattr(product_by_id, 'STOCK_CACHE_TTL_SECONDS', 0)
+    monkeypatch.setattr(product_by_id, 'product_cache', product_by_id.LRUCache(100, 1024 * 1024))
+    monkeypatch.setattr(product_by_id, 'product_cache_version', {'version': None, 'checked_at': None})
+
+    # Catalog version reads are left out; test_cache_hits_make_no_dynamodb_calls covers them
+    requests = []
+    def record(params, model, **kwargs):
+        requests.append((model.name, sorted(params.get('RequestItems', {}))))
+    events = product_by_id.dynamodb.meta.client.meta.events
+    events.register('provide-client-params.dynamodb', record)
+    yield requests
+    events.unregister('provide-client-params.dynamodb', record)
+
+def test_cache_serves_products_and_refreshes_stock_separately(dynamodb_client, cached_requests, lambda_context):
+    dynamodb = boto3.resource('dynamodb')
+    dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS']).put_item(Item={
+        'id': '1',
+        'title': 'Test Product',
+        'description': 'Test Description',
+        'price': 100
+    })
+    stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
+    stocks_table.put_item(Item={'product_id': '1', 'count': 5})
+    event = {'pathParameters': {'productId': '1'}}
+
+    assert json.loads(handler(event, lambda_context)['body'])['count'] == 5
+    stocks_table.put_item(Item={'product_id': '1', 'count': 3})
+    assert json.loads(handler(event, lambda_context)['body'])['count'] == 3
+
+    assert cached_requests == [
+        ('BatchGetItem', [os.environ['TABLE_NAME_PRODUCTS'], os.environ['TABLE_NAME_STOCKS']]),
+        ('BatchGetItem', [os.environ['TABLE_NAME_STOCKS']]),
+    ]
+
+    # Fieldsets without count are served from the cache alone
+    response = handler({**event, 'queryStringParameters': {'fields': 'id,title'}}, lambda_context)
+    assert json.loads(response['body']) == {'id': '1', 'title': 'Test Product'}
+    assert len(cached_requests) == 2
+
+def test_cache_remembers_unknown_products(dynamodb_client, cached_requests, lambda_context):
+    from src import product_by_id
+    event = {'pathParameters': {'productId': 'non-existent'}}
+
+    assert handler(event, lambda_context)['statusCode'] == 404
+    assert handler(event, lambda_context)['statusCode'] == 404
+
+    assert len(cached_requests) == 1
+    assert product_by_id.product_cache.stats()['hits'] == 1
+
+def test_catalog_writes_empty_the_cache(dynamodb_client, cached_requests, lambda_context):
+    from src import catalog_version, product_by_id
+    products_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS'])
+    products_table.put_item(Item={'id': '1', 'title': 'Old', 'description': 'Test Description', 'price': 100})
+    event = {'pathParameters': {'productId': '1'}}
+    assert json.loads(handler(event, lambda_context)['body'])['title'] == 'Old'
+
+    products_table.update_item(Key={'id': '1'}, UpdateExpression='SET title = :title',
+                               ExpressionAttributeValues={':title': 'New'})
+    # Until the writer bumps the catalog version the cached item is served
+    assert json.loads(handler(event, lambda_context)['body'])['title'] == 'Old'
+    catalog_version.bump_version()
+    # The version is only read again once the check interval has passed
+    assert json.loads(handler(event, lambda_context)['body'])['title'] == 'Old'
+    product_by_id.product_cache_version['checked_at'] -= product_by_id.CATALOG_VERSION_CHECK_SECONDS
+    assert json.loads(handler(event, lambda_context)['body'])['title'] == 'New'
+
+def test_cache_hits_make_no_dynamodb_calls(dynamodb_client, cached_requests, lambda_context):
+    from src import product_by_id
+    boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS']).put_item(
+        Item={'id': '1', 'title': 'Test Product', 'description': 'Test Description', 'price': 100}
+    )
+    event = {'pathParameters': {'productId': '1'}, 'queryStringParameters': {'fields': 'id,title'}}
+    assert handler(event, lambda_context)['statusCode'] == 200
+
+    operations = []
+    def record(model, **kwargs):
+        operations.append(model.name)
+    events = product_by_id.catalog_version.dynamodb.meta.client.meta.events
+    events.register('provide-client-params.dynamodb', record)
+    for _ in range(3):
+        assert handler(event, lambda_context)['statusCode'] == 200
+    events.unregister('provide-client-params.dynamodb', record)
+
+    assert operations == []
+    assert len(cached_requests) == 1
@@ -0,0 +1,118 @@
+import pytest
+from decimal import Decimal
+
+from product_schema import validate_product, validate_many, parse_product, ProductValidationError
+
+def test_coerces_csv_strings():
+    product, errors = validate_product({
+        'id': ' abc ',
+        'title': ' Sony WH-1000XM4 ',
+        'description': 'Headphones',
+        'price': '349.99',
+        'count': '15',
+        'unknown': 'dropped'
+    })
+
+    assert errors == []
+    assert product == {
+        'id': 'abc',
+        'title': 'Sony WH-1000XM4',
+        'description': 'Headphones',
+        'price': Decimal('349.99'),
+        'count': 15
+    }
+
+@pytest.mark.parametrize(
+    "price, expected",
+    [(349.99, Decimal('349.99')), (10, Decimal('10')), (Decimal('0.01'), Decimal('0.01'))],
+    ids=["float", "int", "decimal"]
+)
+def test_price_keeps_its_digits(price, expected):
+    product, _ = validate_product({'title': 't', 'description': 'd', 'price': price, 'count': 1})
+
+    assert product['price'] == expected
+
+def test_collects_every_error():
+    product, errors = validate_product({
+        'title': '  ',
+        'description': 7,
+        'price': 'NaN',
+        'count': '1.5'
+    })
+
+    assert product is None
+    assert errors == [
+        "Title cannot be empty",
+        "Description must be a string",
+        "Price must be a number",
+        "Count must be a whole number"
+    ]
+
+@pytest.mark.parametrize(
+    "data, expected_errors",
+    [
+        ({'title': 't'}, ["Missing required fields: description, price, count"]),
+        ({'title': 't', 'description': 'd', 'price': 0, 'count': 1}, ["Price must be positive"]),
+        ({'title': 't', 'description': 'd', 'price': 1, 'count': -1}, ["Count must be non-negative"]),
+        ({'title': 't', 'description': 'd', 'price': True, 'count': 1}, ["Price must be a number"]),
+        (['not', 'a', 'product'], ["Product must be an object"])
+    ],
+    ids=["missing_fields", "zero_price", "negative_count", "bool_price", "not_an_object"]
+)
+def test_rejects_invalid_products(data, expected_errors):
+    assert validate_product(data) == (None, expected_errors)
+
+def test_validate_many_aligns_results_with_rows():
+    rows = [
+        {'title': 'a', 'description': 'd', 'price': '1.50', 'count': '2'},
+        {'title': 'b'},
+        {'title': 'c', 'description': 'd', 'price': 3, 'count': 0}
+    ]
+
+    products, errors = validate_many(rows)
+
+    assert [product and product['title'] for product in products] == ['a', None, 'c']
+    assert [bool(row_errors) for row_errors in errors] == [False, True, False]
+
+def test_validate_many_matches_validate_product():
+    import random
+    from decimal import Decimal
+    rng = random.Random(7)
+    choices = {
+        'id': [None, '', 'abc', ' x ', 'i' * 65, 5],
+        'title': [None, '', ' t ', 'title', 't' * 201, 7],
+        'description': [None, 'd', '   ', 'description'],
+        'price': [None, '', '1.50', ' 2 ', '0', '-1', 'abc', 'NaN', 'Infinity', 3, 2.5, True, Decimal('4.2')],
+        'count': [None, '', '0', ' 3 ', '-1', '1.5', 'x', 4, -2, 3.0, False, Decimal('2')],
+        'version': [None, '', '7', '-7', 'v', 9]
+    }
+    rows = [['not', 'a', 'product']]
+    for _ in range(2000):
+        row = {name: rng.choice(values) for name, values in choices.items()}
+        rows.append({name: value for name, value in row.items() if value is not None})
+    # Clean batches take the column fast paths
+    clean = [{'title': f't{i}', 'description': 'd', 'price': f'{i + 1}.25', 'count': str(i)} for i in range(50)]
+
+    for batch in (rows, clean, [row for row in rows if validate_product(row)[0]]):
+        expected = [validate_product(row) for row in batch]
+        products, errors = validate_many(batch)
+        assert list(zip(products, errors)) == expected
+
+def test_parse_product_raises_with_all_errors():
+    with pytest.raises(ProductValidationError) as error:
+        parse_product({'title': '', 'description': '', 'price': 1, 'count': 1})
+
+    assert error.value.errors == ["Title cannot be empty", "Description cannot be empty"]
+
+def test_optional_columns_may_be_empty():
+    product, errors = validate_product({
+        'id': 'abc', 'title': 't', 'description': 'd', 'price': '1', 'count': '1', 'version': ''
+    })
+
+    assert errors == []
+    assert 'version' not in product
+
+def test_make_version_orders_updates_within_a_millisecond():
+    from product_schema import make_version
+
+    assert make_version(1000, 2) > make_version(1000, 1) > make_version(999, 10 ** 6)
@@ -0,0 +1,122 @@
+import json
+import pytest
+import boto3
+import os
+
+from src import product_search
+from src.product_search import handler
+from src.search_index import SearchIndex
+from src.product_fields import index_attributes
+
+PRODUCTS = [
+    ('1', 'Sony WH-1000XM4', 'Wireless noise cancelling over-ear headphones', 349),
+    ('2', 'Apple AirPods Pro', 'Active noise cancellation earbuds', 249),
+    ('3', 'Sennheiser HD 660S', 'Open-back headphones for audiophiles', 499),
+    ('4', 'Jabra Elite 85t', 'Wireless earbuds with advanced ANC', 179),
+]
+
+@pytest.fixture
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(product_search, 'search_index', SearchIndex())
+    monkeypatch.setattr(product_search, 'index_state', {})
+
+def seed_products(products):
+    dynamodb = boto3.resource('dynamodb')
+    products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
+    stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
+    for product_id, title, description, price in products:
+        products_table.put_item(Item={
+            'id': product_id,
+            'title': title,
+            'description': description,
+            'price': price,
+            **index_attributes(product_id, title)
+        })
+        stocks_table.put_item(Item={'product_id': product_id, 'count': int(product_id) * 10})
+
+def search(lambda_context, q, **params):
+    response = handler({'queryStringParameters': {'q': q, **params}}, lambda_context)
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])['items']
+
+def test_search_ranks_title_matches_first(dynamodb_client, fresh_index, lambda_context):
+    seed_products(PRODUCTS)
+
+    items = search(lambda_context, 'headphones')
+
+    assert {item['id'] for item in items} == {'1', '3'}
+    assert items[0]['count'] == int(items[0]['id']) * 10
+
+    items = search(lambda_context, 'earbuds wireless')
+    assert [item['id'] for item in items] == ['4']
+
+def test_search_prefix_matching_for_autocomplete(dynamodb_client, fresh_index, lambda_context):
+    seed_products(PRODUCTS)
+
+    items = search(lambda_context, 'senn')
+
+    assert [item['id'] for item in items] == ['3']
+    assert items[0]['title'] == 'Sennheiser HD 660S'
+
+def test_search_refreshes_incrementally_on_version_bump(dynamodb_client, fresh_index, lambda_context):
+    seed_products(PRODUCTS)
+    assert search(lambda_context, 'bose') == []
+
+    seed_products([
+        ('5', 'Bose QuietComfort', 'Noise cancelling headphones', 299),
+        ('2', 'Apple AirPods Max', 'Over-ear headphones', 549),
+    ])
+    product_search.catalog_version.bump_version()
+
+    calls = []
+    def record_call(params, model, **kwargs):
+        calls.append(model.name)
+    events = product_search.dynamodb.meta.client.meta.events
+    events.register('provide-client-params.dynamodb', record_call)
+    found = search(lambda_context, 'bose')
+    events.unregister('provide-client-params.dynamodb', record_call)
+
+    assert [item['id'] for item in found] == ['5']
+    assert 'Scan' not in calls and 'Query' in calls
+    assert len(product_search.search_index) == 5
+    assert [item['title'] for item in search(lambda_context, 'airpods')] == ['Apple AirPods Max']
+    assert search(lambda_context, 'earbuds active') == []
+
+def test_search_falls_back_to_a_full_scan_without_the_updated_index(dynamodb_client, fresh_index,
+                                                                     lambda_context, monkeypatch):
+    from botocore.exceptions import ClientError
+    seed_products(PRODUCTS)
+    assert search(lambda_context, 'bose') == []
+
+    def missing_index(since):
+        raise ClientError({'Error': {'Code': 'ValidationException',
+                                     'Message': 'The table does not have the specified index'}}, 'Query')
+    monkeypatch.setattr(product_search, 'query_changed_products', missing_index)
+    seed_products([('5', 'Bose QuietComfort', 'Noise cancelling headphones', 299)])
+    product_search.catalog_version.bump_version()
+
+    assert [item['id'] for item in search(lambda_context, 'bose')] == ['5']
+
+def test_search_requires_query(dynamodb_client, fresh_index, lambda_context):
+    response = handler({'queryStringParameters': {'q': '  '}}, lambda_context)
+
+    assert response['statusCode'] == 400
+
+def test_index_sync_adds_updates_and_removes():
+    index = SearchIndex()
+    products = [
+        {'id': '1', 'title': 'Red Shoes', 'description': 'Leather'},
+        {'id': '2', 'title': 'Blue Shoes', 'description': 'Canvas'},
+    ]
+    assert index.sync(products) == (2, 0, 0)
+
+    products = [
+        {'id': '1', 'title': 'Red Boots', 'description': 'Leather'},
+        {'id': '3', 'title': 'Green Hat', 'description': 'Wool'},
+    ]
+    assert index.sync(products) == (1, 1, 1)
+
+    assert index.search('shoes') == []
+    assert [product_id for product_id, _ in index.search('boo')] == ['1']
+    assert 'blue' not in index.vocabulary
+    assert index.vocabulary == sorted(index.postings)
@@ -4,6 +4,7 @@ import boto3
 import os
 
 from src.products_list import handler
+from src.product_fields import index_attributes, catalog_partitions
 
 def test_handler_success(dynamodb_client, lambda_context):
 
@@ -94,4 +95,355 @@ def test_handler_structure(dynamodb_client, lambda_context):
     assert 'title' in first_product
     assert 'description' in first_product
     assert 'price' in first_product
-    assert 'count' in first_product
\ No newline at end of file
+    assert 'count' in first_product
+
+def seed_catalog(size):
+    dynamodb = boto3.resource('dynamodb')
+    products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
+    stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
+
+    for i in range(size):
+        products_table.put_item(Item={
+            'id': f'product-{i:03d}',
+            'title': f'Product {i}',
+            'description': f'Description {i}',
+            'price': 10 + i
+        })
+        stocks_table.put_item(Item={
+            'product_id': f'product-{i:03d}',
+            'count': i
+        })
+
+def test_pagination_returns_every_item_exactly_once(dynamodb_client, lambda_context):
+    seed_catalog(23)
+
+    seen_ids = []
+    pages = 0
+    cursor = None
+    while True:
+        params = {'limit': '5'}
+        if cursor:
+            params['cursor'] = cursor
+        response = handler({'queryStringParameters': params}, lambda_context)
+        assert response['statusCode'] == 200
+
+        body = json.loads(response['body'])
+        assert len(body['items']) <= 5
+        for product in body['items']:
+            assert product['count'] == int(product['id'].split('-')[1])
+        seen_ids.extend(product['id'] for product in body['items'])
+        pages += 1
+
+        cursor = body['nextCursor']
+        if not cursor:
+            break
+
+    assert len(seen_ids) == 23
+    assert len(set(seen_ids)) == 23
+    assert pages >= 5
+
+def test_pagination_without_params_returns_full_list(dynamodb_client, lambda_context):
+    seed_catalog(12)
+
+    response = handler({'queryStringParameters': None}, lambda_context)
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert isinstance(body, list)
+    assert len(body) == 12
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {'limit': 'abc'},
+        {'limit': '0'},
+        {'limit': '1000'},
+        {'cursor': 'not-a-cursor'},
+    ],
+    ids=["non_numeric_limit", "zero_limit", "limit_too_large", "garbage_cursor"]
+)
+def test_pagination_invalid_params(dynamodb_client, lambda_context, params):
+    response = handler({'queryStringParameters': params}, lambda_context)
+
+    assert response['statusCode'] == 400
+    body = json.loads(response['body'])
+    assert body['message'] == 'Invalid query parameters'
+
+def test_full_catalog_parallel_scan(segmented_scan, lambda_context, monkeypatch):
+    from src import products_list
+    monkeypatch.setattr(products_list, 'SCAN_TOTAL_SEGMENTS', 4)
+    seed_catalog(30)
+
+    response = handler({}, lambda_context)
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert sorted(product['id'] for product in body) == [f'product-{i:03d}' for i in range(30)]
+    for product in body:
+        assert product['count'] == int(product['id'].split('-')[1])
+
+    scanned = {(call['TableName'], call['Segment']) for call in segmented_scan}
+    assert scanned == {
+        (table_name, segment)
+        for table_name in (os.environ['TABLE_NAME_PRODUCTS'], os.environ['TABLE_NAME_STOCKS'])
+        for segment in range(4)
+    }
+
+def test_full_catalog_cache_invalidated_by_version_bump(dynamodb_client, lambda_context, monkeypatch):
+    from src import products_list
+    monkeypatch.setattr(products_list, 'CATALOG_CACHE_TTL_SECONDS', 60)
+    monkeypatch.setattr(products_list, 'catalog_cache', {})
+    seed_catalog(3)
+
+    first = json.loads(handler({}, lambda_context)['body'])
+    assert len(first) == 3
+
+    # A write that does not bump the version is not visible until the TTL expires
+    products_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS'])
+    products_table.put_item(Item={
+        'id': 'product-new',
+        'title': 'New Product',
+        'description': 'New Description',
+        'price': 1
+    })
+    cached = json.loads(handler({}, lambda_context)['body'])
+    assert len(cached) == 3
+
+    products_list.catalog_version.bump_version()
+    refreshed = json.loads(handler({}, lambda_context)['body'])
+    assert len(refreshed) == 4
+
+def test_full_catalog_cache_expires_after_ttl(dynamodb_client, lambda_context, monkeypatch):
+    from src import products_list
+    monkeypatch.setattr(products_list, 'CATALOG_CACHE_TTL_SECONDS', 60)
+    monkeypatch.setattr(products_list, 'catalog_cache', {})
+    seed_catalog(2)
+
+    assert len(json.loads(handler({}, lambda_context)['body'])) == 2
+    seed_catalog(5)
+    products_list.catalog_cache['loaded_at'] -= 61
+
+    assert len(json.loads(handler({}, lambda_context)['body'])) == 5
+
+def test_full_catalog_cache_reads_counts_separately(dynamodb_client, lambda_context, monkeypatch):
+    from src import products_list
+    monkeypatch.setattr(products_list, 'CATALOG_CACHE_TTL_SECONDS', 300)
+    monkeypatch.setattr(products_list, 'CATALOG_STOCK_CACHE_TTL_SECONDS', 10)
+    monkeypatch.setattr(products_list, 'catalog_cache', {})
+    seed_catalog(2)
+    stocks_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_STOCKS'])
+    counts = {item['id']: item['count'] for item in json.loads(handler({}, lambda_context)['body'])}
+
+    # Reservations change counts without bumping the catalog version
+    stocks_table.update_item(Key={'product_id': 'product-001'}, UpdateExpression='ADD #count :one',
+                             ExpressionAttributeNames={'#count': 'count'}, ExpressionAttributeValues={':one': -1})
+    items = {item['id']: item for item in json.loads(handler({}, lambda_context)['body'])}
+    assert items['product-001']['count'] == counts['product-001']
+
+    scanned = []
+    monkeypatch.setattr(products_list, 'scan_catalog', lambda scans: (
+        scanned.append(sorted(scans)) or products_list.parallel_scan(scans, 1, 1)
+    ))
+    products_list.catalog_cache['counts_loaded_at'] -= 10
+    items = {item['id']: item for item in json.loads(handler({}, lambda_context)['body'])}
+    assert items['product-001']['count'] == counts['product-001'] - 1
+    # The product items are still served from the cache
+    assert scanned == [[os.environ['TABLE_NAME_STOCKS']]]
+
+def test_conditional_get_returns_304_for_unchanged_catalog(dynamodb_client, lambda_context):
+    seed_catalog(3)
+
+    first = handler({}, lambda_context)
+    assert first['statusCode'] == 200
+    etag = first['headers']['ETag']
+    assert 'Cache-Control' in first['headers']
+
+    second = handler({'headers': {'If-None-Match': etag}}, lambda_context)
+    assert second['statusCode'] == 304
+    assert second['body'] == ''
+
+    weak = handler({'headers': {'If-None-Match': f'"stale", W/{etag}'}}, lambda_context)
+    assert weak['statusCode'] == 304
+
+    seed_catalog(4)
+    changed = handler({'headers': {'If-None-Match': etag}}, lambda_context)
+    assert changed['statusCode'] == 200
+    assert len(json.loads(changed['body'])) == 4
+
+def test_sparse_fieldset_pages(dynamodb_client, lambda_context):
+    seed_catalog(6)
+
+    response = handler({'queryStringParameters': {'limit': '4', 'fields': 'price,id,count'}}, lambda_context)
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert len(body['items']) == 4
+    for product in body['items']:
+        assert list(product) == ['id', 'price', 'count']
+        assert product['count'] == int(product['id'].split('-')[1])
+
+def test_sparse_fieldset_skips_stocks_without_count(segmented_scan, lambda_context, monkeypatch):
+    from src import products_list
+    monkeypatch.setattr(products_list, 'SCAN_TOTAL_SEGMENTS', 2)
+    seed_catalog(5)
+
+    response = handler({'queryStringParameters': {'fields': 'id,title'}}, lambda_context)
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert len(body) == 5
+    assert all(set(product) == {'id', 'title'} for product in body)
+    assert {call['TableName'] for call in segmented_scan} == {os.environ['TABLE_NAME_PRODUCTS']}
+    assert all('ProjectionExpression' in call for call in segmented_scan)
+
+def test_sparse_fieldset_rejects_unknown_fields(dynamodb_client, lambda_context):
+    response = handler({'queryStringParameters': {'fields': 'id,secret'}}, lambda_context)
+
+    assert response['statusCode'] == 400
+    assert 'secret' in json.loads(response['body'])['error']
+
+INDEXED_PRODUCTS = [
+    ('a1', 'Apple AirPods Pro', 249),
+    ('a2', 'Apple AirPods Max', 549),
+    ('b1', 'Bose QuietComfort', 299),
+    ('b2', 'Beats Fit Pro', 199),
+    ('s1', 'Sony WH-1000XM4', 349),
+    ('s2', 'Sennheiser HD 660S', 499),
+    ('n1', 'Nothing Ear (2)', 149),
+]
+
+def seed_indexed_catalog():
+    dynamodb = boto3.resource('dynamodb')
+    products_table = dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS'])
+    stocks_table = dynamodb.Table(os.environ['TABLE_NAME_STOCKS'])
+    for product_id, title, price in INDEXED_PRODUCTS:
+        products_table.put_item(Item={
+            'id': product_id,
+            'title': title,
+            'description': f'{title} description',
+            'price': price,
+            **index_attributes(product_id, title)
+        })
+        stocks_table.put_item(Item={'product_id': product_id, 'count': price // 100})
+
+def query_all_pages(lambda_context, params):
+    items = []
+    cursor = None
+    while True:
+        page_params = dict(params)
+        if cursor:
+            page_params['cursor'] = cursor
+        response = handler({'queryStringParameters': page_params}, lambda_context)
+        assert response['statusCode'] == 200, response['body']
+        body = json.loads(response['body'])
+        items.extend(body['items'])
+        cursor = body['nextCursor']
+        if not cursor:
+            return items
+
+def test_price_range_sorted_by_price(dynamodb_client, lambda_context):
+    seed_indexed_catalog()
+
+    items = query_all_pages(lambda_context, {'minPrice': '199', 'maxPrice': '349', 'limit': '2'})
+
+    assert [item['price'] for item in items] == [199, 249, 299, 349]
+    assert [item['count'] for item in items] == [1, 2, 2, 3]
+
+def test_title_prefix_sorted_by_title_descending(dynamodb_client, lambda_context):
+    seed_indexed_catalog()
+
+    items = query_all_pages(lambda_context, {'titlePrefix': 'apple', 'order': 'desc'})
+
+    assert [item['title'] for item in items] == ['Apple AirPods Pro', 'Apple AirPods Max']
+
+def test_title_prefix_with_price_filter_sorted_by_price(dynamodb_client, lambda_context):
+    seed_indexed_catalog()
+
+    items = query_all_pages(lambda_context, {
+        'titlePrefix': 's', 'maxPrice': '400', 'sort': 'price', 'limit': '3'
+    })
+
+    assert [item['id'] for item in items] == ['s1']
+
+def test_sort_by_title_paginates_without_losing_items(dynamodb_client, lambda_context):
+    seed_indexed_catalog()
+
+    items = query_all_pages(lambda_context, {'sort': 'title', 'limit': '3', 'fields': 'id,title'})
+
+    titles = [item['title'] for item in items]
+    assert titles == sorted(title for _, title, _ in INDEXED_PRODUCTS)
+    assert all(set(item) == {'id', 'title'} for item in items)
+
+def test_index_queries_merge_every_catalog_shard(dynamodb_client, lambda_context):
+    products_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_PRODUCTS'])
+    prices = {f'product-{i:03d}': (i * 37) % 101 for i in range(80)}
+    for product_id, price in prices.items():
+        title = f'Product {price:03d} {product_id}'
+        products_table.put_item(Item={
+            'id': product_id,
+            'title': title,
+            'description': 'description',
+            'price': price,
+            **index_attributes(product_id, title)
+        })
+    partitions = {item['catalog_partition'] for item in products_table.scan()['Items']}
+    assert partitions == set(catalog_partitions())
+
+    items = query_all_pages(lambda_context, {
+        'maxPrice': '40', 'titlePrefix': 'product 0', 'order': 'desc', 'limit': '5', 'fields': 'id,price'
+    })
+
+    expected = sorted((price for price in prices.values() if price <= 40), reverse=True)
+    assert [item['price'] for item in items] == expected
+    assert len({item['id'] for item in items}) == len(items)
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {'minPrice': 'cheap'},
+        {'minPrice': '10', 'maxPrice': '5'},
+        {'sort': 'rating'},
+        {'titlePrefix': ' '},
+        {'sort': 'price', 'cursor': 'eyJpZCI6ImExIn0'},
+    ],
+    ids=["non_numeric_price", "inverted_range", "unknown_sort", "blank_prefix", "scan_cursor_on_index"]
+)
+def test_query_invalid_params(dynamodb_client, lambda_context, params):
+    response = handler({'queryStringParameters': params}, lambda_context)
+
+    assert response['statusCode'] == 400
+
+def test_batch_lookup_preserves_order_and_reports_missing(dynamodb_client, lambda_context):
+    seed_catalog(150)
+    requested = [f'product-{i:03d}' for i in range(149, -1, -2)] + ['unknown-1', 'product-000', 'unknown-2']
+
+    response = handler({'queryStringParameters': {'ids': ','.join(requested)}}, lambda_context)
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    expected = [product_id for product_id in dict.fromkeys(requested) if product_id.startswith('product-')]
+    assert [item['id'] for item in body['items']] == expected
+    assert all(item['count'] == int(item['id'].split('-')[1]) for item in body['items'])
+    assert body['missing'] == ['unknown-1', 'unknown-2']
+
+def test_batch_lookup_with_fields(dynamodb_client, lambda_context):
+    seed_catalog(3)
+
+    response = handler({'queryStringParameters': {'ids': 'product-002,product-000', 'fields': 'title'}}, lambda_context)
+
+    body = json.loads(response['body'])
+    assert body['items'] == [{'title': 'Product 2'}, {'title': 'Product 0'}]
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {'ids': ' , '},
+        {'ids': ','.join(str(i) for i in range(501))},
+        {'ids': 'a,b', 'limit': '10'},
+    ],
+    ids=["empty_ids", "too_many_ids", "ids_with_pagination"]
+)
+def test_batch_lookup_invalid_params(dynamodb_client, lambda_context, params):
+    response = handler({'queryStringParameters': params}, lambda_context)
+
+    assert response['statusCode'] == 400
@@ -0,0 +1,43 @@
+from botocore.exceptions import ClientError
+
+from src.sns_batch import publish_batch
+
+class FlakySNS:
+    """Fails the given entry Ids in PublishBatch; Publish fails for `unavailable` messages."""
+
+    def __init__(self, failures, unavailable=()):
+        self.failures = failures
+        self.unavailable = unavailable
+        self.batches = []
+        self.published = []
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        self.batches.append([entry['Id'] for entry in PublishBatchRequestEntries])
+        return {
+            'Successful': [],
+            'Failed': [
+                {'Id': entry['Id'], 'SenderFault': self.failures[entry['Id']], 'Code': 'Error'}
+                for entry in PublishBatchRequestEntries if entry['Id'] in self.failures
+            ]
+        }
+
+    def publish(self, TopicArn, Message, **kwargs):
+        if Message in self.unavailable:
+            raise ClientError({'Error': {'Code': 'InternalError', 'Message': 'boom'}}, 'Publish')
+        self.published.append((Message, kwargs))
+
+def entry(i):
+    return {
+        'Id': f'entry-{i}',
+        'Message': f'message {i}',
+        'MessageAttributes': {'price': {'DataType': 'Number', 'StringValue': str(i)}}
+    }
+
+def test_publish_batch_chunks_and_retries_failed_entries_individually():
+    sns = FlakySNS({'entry-3': False, 'entry-12': False, 'entry-14': True}, unavailable={'message 12'})
+
+    unpublished = publish_batch(sns, 'topic', [entry(i) for i in range(25)])
+
+    assert [len(batch) for batch in sns.batches] == [10, 10, 5]
+    assert sns.published == [('message 3', {'MessageAttributes': entry(3)['MessageAttributes']})]
+    assert unpublished == ['entry-12', 'entry-14']
@@ -0,0 +1,221 @@
+import json
+import os
+import boto3
+import pytest
+
+from src.stock_counters import (
+    shard_key, sum_stock_items, complete_counts, configure_shards, read_shards,
+    reserve, release, InsufficientStock
+)
+from src.stock_reservation import handler
+
+def put_product(product_id, count):
+    dynamodb = boto3.resource('dynamodb')
+    dynamodb.Table(os.environ['TABLE_NAME_PRODUCTS']).put_item(Item={
+        'id': product_id,
+        'title': f'Product {product_id}',
+        'description': 'Test Description',
+        'price': 10
+    })
+    dynamodb.Table(os.environ['TABLE_NAME_STOCKS']).put_item(Item={
+        'product_id': product_id,
+        'count': count
+    })
+
+def reservation_event(product_id, action, quantity):
+    return {
+        'resource': f'/products/{{productId}}/{action}',
+        'pathParameters': {'productId': product_id},
+        'body': json.dumps({'quantity': quantity})
+    }
+
+def test_shard_key():
+    assert shard_key('1', 0) == '1'
+    assert shard_key('1', 2) == '1#shard-2'
+
+def test_sum_stock_items_ignores_leftover_shards():
+    counts = sum_stock_items([
+        {'product_id': '1', 'count': 4, 'shards': 2},
+        {'product_id': '1#shard-1', 'count': 3},
+        # Left over from an earlier configuration with more shards
+        {'product_id': '1#shard-2', 'count': 7},
+        {'product_id': '2', 'count': 5}
+    ])
+
+    assert counts == {'1': 7, '2': 5}
+
+def test_configure_shards_spreads_and_merges_stock(dynamodb_client):
+    put_product('1', 10)
+
+    assert configure_shards('1', 3) == [4, 3, 3]
+    base_item, counts = read_shards('1')
+    assert base_item['shards'] == 3
+    assert counts == [4, 3, 3]
+
+    assert configure_shards('1', 1) == [10]
+    stocks_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_STOCKS'])
+    assert 'Item' not in stocks_table.get_item(Key={'product_id': '1#shard-1'})
+
+def test_configure_shards_rejects_unknown_product_and_bad_counts(dynamodb_client):
+    with pytest.raises(KeyError):
+        configure_shards('missing', 2)
+    with pytest.raises(ValueError):
+        configure_shards('missing', 0)
+
+def test_complete_counts_adds_other_shards(dynamodb_client):
+    put_product('1', 10)
+    put_product('2', 5)
+    configure_shards('1', 4)
+    stocks_table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME_STOCKS'])
+    base_items = [
+        stocks_table.get_item(Key={'product_id': product_id})['Item']
+        for product_id in ('1', '2')
+    ]
+
+    assert complete_counts(base_items) == {'1': 10, '2': 5}
+
+def test_reserve_never_oversells(dynamodb_client):
+    put_product('1', 10)
+    configure_shards('1', 3)
+
+    reserved = 0
+    for _ in range(15):
+        try:
+            reserve('1', 1)
+            reserved += 1
+        except InsufficientStock:
+            pass
+
+    _, counts = read_shards('1')
+    assert reserved == 10
+    assert counts == [0, 0, 0]
+
+def test_reserve_takes_across_shards(dynamodb_client):
+    put_product('1', 9)
+    configure_shards('1', 3)
+
+    # No single shard holds 7, so the reservation spans a transaction
+    reserve('1', 7)
+    _, counts = read_shards('1')
+    assert sum(counts) == 2
+    assert min(counts) >= 0
+
+    with pytest.raises(InsufficientStock):
+        reserve('1', 3)
+
+def test_release_returns_stock(dynamodb_client):
+    put_product('1', 4)
+    configure_shards('1', 2)
+
+    reserve('1', 3)
+    release('1', 2)
+
+    _, counts = read_shards('1')
+    assert sum(counts) == 3
+    with pytest.raises(KeyError):
+        release('missing', 1)
+
+def test_shard_count_is_read_consistently(dynamodb_client):
+    from src import stock_counters
+    put_product('1', 4)
+    configure_shards('1', 2)
+    calls = []
+    record_call = lambda params, model, **kwargs: calls.append((model.name, params.get('ConsistentRead')))
+    events = stock_counters.dynamodb.meta.client.meta.events
+    events.register('provide-client-params.dynamodb', record_call)
+
+    # Merged back into one shard: release must not pick the deleted shard 1
+    configure_shards('1', 1)
+    calls.clear()
+    release('1', 1)
+    events.unregister('provide-client-params.dynamodb', record_call)
+
+    assert calls[0] == ('GetItem', True)
+    assert read_shards('1')[1] == [5]
+
+def test_cached_shard_count_falls_back_to_a_consistent_read(dynamodb_client, monkeypatch):
+    from src import stock_counters
+    monkeypatch.setattr(stock_counters, 'SHARD_COUNT_CACHE_TTL_SECONDS', 60)
+    monkeypatch.setattr(stock_counters, 'shard_count_cache', stock_counters.LRUCache(100, 1024 * 1024))
+    put_product('1', 40)
+    configure_shards('1', 4)
+    calls = []
+    record_call = lambda params, model, **kwargs: calls.append(model.name)
+    events = stock_counters.dynamodb.meta.client.meta.events
+    events.register('provide-client-params.dynamodb', record_call)
+
+    for _ in range(5):
+        reserve('1', 1)
+    assert calls.count('GetItem') == 1
+
+    # Merged back while the count of 4 is cached: every release to a
+    # deleted shard misses and re-reads the count
+    configure_shards('1', 1)
+    for _ in range(5):
+        release('1', 1)
+    events.unregister('provide-client-params.dynamodb', record_call)
+
+    assert read_shards('1')[1] == [40]
+    assert stock_counters.shard_count_cache.get('1') == 1
+
+def test_imports_keep_the_product_sharded(dynamodb_client, sns_client, lambda_context):
+    from src.catalog_batch_process import handler as catalog_batch_handler
+    put_product('1', 10)
+    configure_shards('1', 4)
+
+    def import_record(message_id, count, **fields):
+        return {'messageId': message_id, 'body': json.dumps({
+            'id': '1', 'title': 'Product 1', 'description': 'Test Description',
+            'price': '10', 'count': str(count), **fields
+        })}
+
+    response = catalog_batch_handler({'Records': [import_record('versioned', 21, version=5)]}, lambda_context)
+    assert response == {'batchItemFailures': []}
+    base_item, counts = read_shards('1')
+    assert base_item['shards'] == 4
+    assert base_item['version'] == 5
+    assert counts == [6, 5, 5, 5]
+
+    # Unversioned updates are written over every shard as well
+    catalog_batch_handler({'Records': [import_record('unversioned', 2)]}, lambda_context)
+    base_item, counts = read_shards('1')
+    assert base_item['shards'] == 4
+    assert counts == [1, 1, 0, 0]
+    reserve('1', 2)
+    with pytest.raises(InsufficientStock):
+        reserve('1', 1)
+
+def test_product_reads_sum_shards(dynamodb_client, lambda_context):
+    from src.product_by_id import handler as product_by_id_handler
+    from src.products_list import handler as products_list_handler
+
+    put_product('1', 10)
+    put_product('2', 5)
+    configure_shards('1', 3)
+    reserve('1', 2)
+
+    response = product_by_id_handler({'pathParameters': {'productId': '1'}}, lambda_context)
+    assert json.loads(response['body'])['count'] == 8
+
+    response = products_list_handler({}, lambda_context)
+    counts = {product['id']: product['count'] for product in json.loads(response['body'])}
+    assert counts == {'1': 8, '2': 5}
+
+def test_reservation_handler(dynamodb_client, lambda_context):
+    put_product('1', 2)
+
+    response = handler(reservation_event('1', 'reserve', 2), lambda_context)
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['quantity'] == 2
+
+    response = handler(reservation_event('1', 'reserve', 1), lambda_context)
+    assert response['statusCode'] == 409
+
+    response = handler(reservation_event('1', 'release', 1), lambda_context)
+    assert response['statusCode'] == 200
+
+    response = handler(reservation_event('missing', 'reserve', 1), lambda_context)
+    assert response['statusCode'] == 404
+
+    response = handler(reservation_event('1', 'reserve', 0), lambda_context)
+    assert response['statusCode'] == 400